@@ -0,0 +1,62 @@
+"""Compare getting the numeric and date fields of a page of results into
+NumPy arrays by parsing it into dicts and building the arrays from
+them, and by parsing it straight into columns with results_as_columns().
+
+    PYTHONPATH=. python benchmarks/columns.py [rows] [fields of each type]
+
+Nothing is fetched from Solr; this times parsing a page of rows, as
+SolrInterface.search() does, and then having an array of each int,
+double and date field.
+"""
+from __future__ import absolute_import
+
+import cStringIO as StringIO
+import sys
+import time
+
+import numpy
+
+from sunburnt.columnar import SolrColumns
+from sunburnt.schema import SolrSchema
+
+from lazy_docs import make_docs, schema_string
+from response_formats import json_response, xml_response
+
+DTYPES = {'_i': numpy.int32, '_d': numpy.float64, '_dt': 'datetime64[ms]'}
+
+
+def from_dicts(schema, response_format, msg, fields):
+    docs = schema.parse_response(msg, response_format=response_format).result.docs
+    columns = {}
+    for name in fields:
+        dtype = DTYPES[name[name.rindex('_'):]]
+        columns[name] = numpy.array([doc[name] for doc in docs], dtype=dtype)
+    return columns
+
+
+def from_columns(schema, response_format, msg, fields):
+    return schema.parse_response(msg, response_format=response_format,
+                                 record_class=SolrColumns).result.docs
+
+
+def benchmark(f, *args):
+    start = time.time()
+    f(*args)
+    return time.time() - start
+
+
+def main(argv):
+    rows = int(argv[1]) if len(argv) > 1 else 10000
+    width = int(argv[2]) if len(argv) > 2 else 10
+    schema = SolrSchema(StringIO.StringIO(schema_string))
+    docs = list(make_docs(rows, width))
+    fields = [name for name in docs[0] if name[name.rfind('_'):] in DTYPES]
+    for response_format, msg in (('xml', xml_response(docs)), ('json', json_response(docs))):
+        dicts = benchmark(from_dicts, schema, response_format, msg, fields)
+        columns = benchmark(from_columns, schema, response_format, msg, fields)
+        print "%-4s dicts %7.0f docs/s  columns %7.0f docs/s  (%.0f%% less CPU)" % (
+            response_format, rows / dicts, rows / columns, 100 * (1 - columns / dicts))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
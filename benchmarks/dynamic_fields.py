@@ -0,0 +1,75 @@
+"""Compare looking up the dynamic fields of names by scanning every
+pattern, as SolrSchema used to, with its DynamicFieldIndex - both
+without its memo of names already looked up, and with it.
+
+    PYTHONPATH=. python benchmarks/dynamic_fields.py [patterns] [names] [passes]
+
+The schema has as many prefix and suffix patterns as asked for (half
+of each), and each pass looks up the same names, most of them matching
+one of the patterns; the first pass is what the memo has to fill.
+"""
+from __future__ import absolute_import
+
+import cStringIO as StringIO
+import sys
+import time
+
+from sunburnt.schema import DynamicFieldIndex, SolrSchema
+
+
+def schema_string(patterns):
+    fields = []
+    for i in xrange(patterns // 2):
+        fields.append('<dynamicField name="*_suffix%s" type="string"/>' % i)
+        fields.append('<dynamicField name="prefix%s_*" type="string"/>' % i)
+    return """<schema name="benchmark" version="1.1">
+  <types><fieldType name="string" class="solr.StrField"/></types>
+  <fields><field name="id" type="string"/>%s</fields>
+</schema>""" % "".join(fields)
+
+
+def make_names(n, patterns):
+    names = []
+    for i in xrange(n):
+        j = i % patterns // 2
+        if i % 3 == 0:
+            names.append('field%s_suffix%s' % (i, j))
+        elif i % 3 == 1:
+            names.append('prefix%s_field%s' % (j, i))
+        else:
+            names.append('unmatched_field%s' % i)
+    return names
+
+
+def scan(schema, name):
+    for field in schema.dynamic_fields:
+        if field.match(name):
+            return field
+
+
+def benchmark(lookup, names, passes):
+    start = time.time()
+    for i in xrange(passes):
+        for name in names:
+            lookup(name)
+    return time.time() - start
+
+
+def main(argv):
+    patterns = int(argv[1]) if len(argv) > 1 else 80
+    n = int(argv[2]) if len(argv) > 2 else 500
+    passes = int(argv[3]) if len(argv) > 3 else 20
+    schema = SolrSchema(StringIO.StringIO(schema_string(patterns)))
+    names = make_names(n, patterns)
+    index = DynamicFieldIndex(schema.dynamic_fields)
+    index.memo_size = 0
+    lookups = n * passes
+    for name, lookup in (('scan', lambda name: scan(schema, name)),
+                         ('index', index.match),
+                         ('index+memo', DynamicFieldIndex(schema.dynamic_fields).match)):
+        elapsed = benchmark(lookup, names, passes)
+        print "%-10s %9.0f lookups/s" % (name, lookups / elapsed)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,82 @@
+"""Compare parsing search responses of wide documents with and without
+lazy_docs, when only a couple of fields of a few documents are read.
+
+    PYTHONPATH=. python benchmarks/lazy_docs.py [rows per page] [pages] [fields of each type]
+
+Nothing is fetched from Solr; this times parsing a page of rows, as
+SolrInterface.search() does, and then reading the id and title of the
+first ten documents.
+"""
+from __future__ import absolute_import
+
+import cStringIO as StringIO
+import datetime
+import sys
+import time
+import uuid
+
+from sunburnt.schema import SolrSchema
+
+from response_formats import json_response, xml_response
+
+schema_string = """<schema name="benchmark" version="1.1">
+  <types>
+    <fieldType name="string" class="solr.StrField"/>
+    <fieldType name="int" class="solr.TrieIntField"/>
+    <fieldType name="double" class="solr.TrieDoubleField"/>
+    <fieldType name="date" class="solr.TrieDateField"/>
+    <fieldType name="uuid" class="solr.UUIDField"/>
+  </types>
+  <fields>
+    <field name="id" type="int" required="true"/>
+    <field name="title" type="string"/>
+    <dynamicField name="*_s" type="string"/>
+    <dynamicField name="*_i" type="int"/>
+    <dynamicField name="*_d" type="double"/>
+    <dynamicField name="*_dt" type="date"/>
+    <dynamicField name="*_u" type="uuid"/>
+  </fields>
+  <uniqueKey>id</uniqueKey>
+</schema>
+"""
+
+
+def make_docs(n, width):
+    published = datetime.datetime(2012, 1, 1)
+    for i in xrange(n):
+        doc = {'id': i, 'title': u'Document number %s' % i}
+        for j in xrange(width):
+            doc['field%s_s' % j] = u'value %s' % j
+            doc['field%s_i' % j] = i * j
+            doc['field%s_d' % j] = i * 0.5 + j
+            doc['field%s_dt' % j] = (published + datetime.timedelta(hours=i + j)).isoformat() + 'Z'
+            doc['field%s_u' % j] = unicode(uuid.UUID(int=i * 1000 + j))
+        yield doc
+
+
+def benchmark(schema, response_format, msg, pages, lazy_docs):
+    start = time.time()
+    for i in xrange(pages):
+        response = schema.parse_response(msg, response_format=response_format,
+                                         lazy_docs=lazy_docs)
+        for doc in response.result.docs[:10]:
+            doc['id'], doc['title']
+    return time.time() - start
+
+
+def main(argv):
+    rows = int(argv[1]) if len(argv) > 1 else 100
+    pages = int(argv[2]) if len(argv) > 2 else 10
+    width = int(argv[3]) if len(argv) > 3 else 10
+    schema = SolrSchema(StringIO.StringIO(schema_string))
+    docs = list(make_docs(rows, width))
+    for response_format, msg in (('xml', xml_response(docs)), ('json', json_response(docs))):
+        eager = benchmark(schema, response_format, msg, pages, False)
+        lazy = benchmark(schema, response_format, msg, pages, True)
+        print "%-4s eager %7.0f docs/s  lazy %7.0f docs/s  (%.0f%% less CPU)" % (
+            response_format, rows * pages / eager, rows * pages / lazy,
+            100 * (1 - lazy / eager))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
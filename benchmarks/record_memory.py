@@ -0,0 +1,43 @@
+"""Compare the memory taken by a page of wide result documents parsed
+into dicts, and into records with results_as_records().
+
+    PYTHONPATH=. python benchmarks/record_memory.py [rows] [fields of each type]
+
+Nothing is fetched from Solr. The field values are the same objects
+either way, so only what holds them - the dict, or the record - is
+measured, along with the time taken to parse the page.
+"""
+from __future__ import absolute_import
+
+import cStringIO as StringIO
+import sys
+import time
+
+from sunburnt.schema import SolrSchema, record_class
+
+from lazy_docs import make_docs, schema_string
+from response_formats import json_response
+
+
+def benchmark(schema, msg, cls):
+    start = time.time()
+    response = schema.parse_response(msg, response_format='json', record_class=cls)
+    elapsed = time.time() - start
+    return elapsed, sum(sys.getsizeof(doc) for doc in response.result.docs)
+
+
+def main(argv):
+    rows = int(argv[1]) if len(argv) > 1 else 10000
+    width = int(argv[2]) if len(argv) > 2 else 10
+    schema = SolrSchema(StringIO.StringIO(schema_string))
+    docs = list(make_docs(rows, width))
+    msg = json_response(docs)
+    fields = sorted(docs[0])
+    for name, cls in (('dict', None), ('record', record_class(fields))):
+        elapsed, size = benchmark(schema, msg, cls)
+        print "%-6s %10d bytes (%5d per doc) %8.0f docs/s" % (
+            name, size, size / rows, rows / elapsed)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,90 @@
+"""Compare how quickly XML, JSON and javabin search responses are parsed.
+
+    PYTHONPATH=. python benchmarks/response_formats.py [rows per page] [pages]
+
+Nothing is fetched from Solr; this only times turning a response for a
+page of rows into a SolrResponse, as SolrInterface.search() does.
+"""
+from __future__ import absolute_import
+
+import cStringIO as StringIO
+import json
+import sys
+import time
+
+from lxml.builder import E
+import lxml.etree
+
+from sunburnt import javabin
+from sunburnt.schema import SolrSchema
+
+from update_formats import make_docs, schema_string
+
+
+def solr_values(doc):
+    """The document as Solr would return it: dates and floats formatted
+    as Solr formats them, everything else as it is."""
+    values = {}
+    for name, value in doc.items():
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat() + 'Z'
+        values[name] = value
+    return values
+
+
+def xml_value(name, value):
+    if isinstance(value, list):
+        return E.arr({'name': name}, *[xml_value(None, v) for v in value])
+    attrs = {'name': name} if name else {}
+    if isinstance(value, bool):
+        return E.bool(attrs, 'true' if value else 'false')
+    if isinstance(value, int):
+        return E.int(attrs, str(value))
+    if isinstance(value, float):
+        return E.float(attrs, repr(value))
+    if name == 'published':
+        return E.date(attrs, value)
+    return E.str(attrs, value)
+
+
+def xml_response(docs):
+    return lxml.etree.tostring(E.response(
+        E.lst({'name': 'responseHeader'}, E.int({'name': 'status'}, '0'),
+              E.int({'name': 'QTime'}, '1')),
+        E.result({'name': 'response', 'numFound': str(len(docs)), 'start': '0'},
+                 *[E.doc(*[xml_value(k, v) for k, v in doc.items()]) for doc in docs])))
+
+
+def json_response(docs):
+    return json.dumps({'responseHeader': {'status': 0, 'QTime': 1},
+                       'response': {'numFound': len(docs), 'start': 0, 'docs': docs}})
+
+
+def javabin_response(docs):
+    return javabin.dumps(javabin.NamedList([
+        ('responseHeader', javabin.NamedList([('status', 0), ('QTime', 1)])),
+        ('response', javabin.SolrDocumentList(len(docs), 0, None,
+                                              [javabin.SolrDocument(doc) for doc in docs]))]))
+
+
+def benchmark(schema, response_format, msg, pages):
+    start = time.time()
+    for i in xrange(pages):
+        schema.parse_response(msg, response_format=response_format)
+    return time.time() - start
+
+
+def main(argv):
+    rows = int(argv[1]) if len(argv) > 1 else 1000
+    pages = int(argv[2]) if len(argv) > 2 else 10
+    schema = SolrSchema(StringIO.StringIO(schema_string))
+    docs = list(make_docs(rows))
+    values = [solr_values(doc) for doc in docs]
+    for response_format, msg in (('xml', xml_response(values)), ('json', json_response(values)),
+                                 ('javabin', javabin_response(docs))):
+        elapsed = benchmark(schema, response_format, msg, pages)
+        print "%-7s %8.0f docs/s %10d bytes" % (response_format, rows * pages / elapsed, len(msg))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,116 @@
+"""Time how long a new process takes to import sunburnt, make a
+SolrInterface, and get the results of its first query.
+
+    PYTHONPATH=. python benchmarks/startup.py [runs]
+
+Each run is made in a fresh interpreter, against a fake connection
+which answers from files, so nothing is fetched from Solr. Runs are
+made with XML responses and no schema cache, and with JSON responses
+and a SchemaCache (to which Solr answers 304 Not Modified), each with
+and without lazy_schema; the median of each is shown, along with
+whether lxml ended up being imported.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIGS = [
+    ('xml', False, False),
+    ('xml', False, True),
+    ('json', True, False),
+    ('json', True, True),
+]
+
+
+class FileConnection(object):
+    """Answers requests for the schema, and searches, from the files in
+    directory."""
+    class Response(dict):
+        def __init__(self, status, headers=()):
+            super(FileConnection.Response, self).__init__(headers)
+            self.status = status
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name)) as f:
+            return f.read()
+
+    def request(self, uri, method='GET', body=None, headers=None):
+        if 'admin/file' in uri:
+            if (headers or {}).get('If-None-Match') == '"1"':
+                return self.Response(304), ''
+            return self.Response(200, {'etag': '"1"'}), self.read('schema.xml')
+        if 'wt=json' in uri:
+            return self.Response(200), self.read('response.json')
+        return self.Response(200), self.read('response.xml')
+
+
+def child(directory, response_format, cached, lazy):
+    start = time.time()
+    import sunburnt
+    imported = time.time()
+    schema_cache = sunburnt.SchemaCache(os.path.join(directory, 'cache')) if cached else None
+    si = sunburnt.SolrInterface("http://localhost:8983/solr/",
+                                http_connection=FileConnection(directory),
+                                response_format=response_format,
+                                schema_cache=schema_cache, lazy_schema=lazy)
+    created = time.time()
+    si.query(title="document").paginate(rows=10).execute()
+    queried = time.time()
+    print imported - start, created - imported, queried - created, int('lxml' in sys.modules)
+
+
+def run(directory, config):
+    response_format, cached, lazy = config
+    output = subprocess.check_output([sys.executable, __file__, 'child', directory,
+                                      response_format, str(int(cached)), str(int(lazy))])
+    return [float(v) for v in output.split()]
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def write_files(directory):
+    from lazy_docs import make_docs, schema_string
+    from response_formats import json_response, xml_response
+    docs = list(make_docs(10, 10))
+    for name, content in (('schema.xml', schema_string), ('response.xml', xml_response(docs)),
+                          ('response.json', json_response(docs))):
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(content)
+
+
+def main(argv):
+    runs = int(argv[1]) if len(argv) > 1 else 10
+    directory = tempfile.mkdtemp()
+    try:
+        write_files(directory)
+        print "%-32s %8s %10s %12s %8s  lxml" % ('', 'import', 'interface', 'first query', 'total')
+        for config in CONFIGS:
+            response_format, cached, lazy = config
+            if cached:
+                # Fill the cache first.
+                run(directory, config)
+            timings = zip(*[run(directory, config) for i in xrange(runs)])
+            imported, created, queried = [median(t) * 1000 for t in timings[:3]]
+            name = "%s, %s%s" % (response_format, 'schema cache' if cached else 'no cache',
+                                 ', lazy_schema' if lazy else '')
+            print "%-32s %6.1fms %8.1fms %10.1fms %6.1fms  %s" % (
+                name, imported, created, queried, imported + created + queried,
+                'yes' if max(timings[3]) else 'no')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['child']:
+        directory, response_format, cached, lazy = sys.argv[2:]
+        child(directory, response_format, cached == '1', lazy == '1')
+    else:
+        main(sys.argv)
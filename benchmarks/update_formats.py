@@ -0,0 +1,74 @@
+"""Compare how quickly documents are turned into XML and JSON updates.
+
+    PYTHONPATH=. python benchmarks/update_formats.py [number of docs] [chunk]
+
+Nothing is sent to Solr; this only times building the update messages,
+as SolrInterface.add() does before sending each chunk.
+"""
+from __future__ import absolute_import
+
+import cStringIO as StringIO
+import datetime
+import sys
+import time
+
+from sunburnt.schema import SolrSchema
+from sunburnt.sunburnt import grouper
+
+schema_string = """<schema name="benchmark" version="1.1">
+  <types>
+    <fieldType name="string" class="solr.StrField"/>
+    <fieldType name="text" class="solr.TextField"/>
+    <fieldType name="int" class="solr.TrieIntField"/>
+    <fieldType name="float" class="solr.TrieFloatField"/>
+    <fieldType name="boolean" class="solr.BoolField"/>
+    <fieldType name="date" class="solr.TrieDateField"/>
+  </types>
+  <fields>
+    <field name="id" type="int" required="true"/>
+    <field name="title" type="text"/>
+    <field name="body" type="text"/>
+    <field name="tags" type="string" multiValued="true"/>
+    <field name="price" type="float"/>
+    <field name="in_stock" type="boolean"/>
+    <field name="published" type="date"/>
+    <dynamicField name="*_s" type="string"/>
+  </fields>
+  <uniqueKey>id</uniqueKey>
+</schema>
+"""
+
+
+def make_docs(n):
+    published = datetime.datetime(2012, 1, 1)
+    for i in xrange(n):
+        yield {'id': i,
+               'title': u'Document number %s' % i,
+               'body': u'Some text about document %s. ' % i * 20,
+               'tags': [u'tag%s' % (i % 10), u'tag%s' % (i % 7), u'tag%s' % (i % 3)],
+               'price': i * 0.5,
+               'in_stock': i % 2 == 0,
+               'published': published + datetime.timedelta(hours=i),
+               'author_s': u'Author %s' % (i % 100)}
+
+
+def benchmark(schema, update_format, docs, chunk):
+    start = time.time()
+    size = 0
+    for doc_chunk in grouper(docs, chunk):
+        size += len(str(schema.make_update(doc_chunk, update_format)))
+    return time.time() - start, size
+
+
+def main(argv):
+    n = int(argv[1]) if len(argv) > 1 else 20000
+    chunk = int(argv[2]) if len(argv) > 2 else 100
+    schema = SolrSchema(StringIO.StringIO(schema_string))
+    docs = list(make_docs(n))
+    for update_format in ('xml', 'json'):
+        elapsed, size = benchmark(schema, update_format, docs, chunk)
+        print "%-4s %8.0f docs/s %10d bytes" % (update_format, n / elapsed, size)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
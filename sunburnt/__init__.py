@@ -1,8 +1,14 @@
 from __future__ import absolute_import
 
+from .cache import ResultCache, SchemaCache
+from .indexer import BufferedIndexer
+from .replicas import ReplicaSet
+from .retry import CircuitBreaker, RetryPolicy
 from .strings import RawString
 from .sunburnt import SolrError, SolrInterface
+from .transport import PooledHttp
 
 __version__ = '0.6'
 
-__all__ = ['RawString', 'SolrError', 'SolrInterface']
+__all__ = ['BufferedIndexer', 'CircuitBreaker', 'PooledHttp', 'RawString', 'ReplicaSet', 'ResultCache',
+           'RetryPolicy', 'SchemaCache', 'SolrError', 'SolrInterface']
@@ -0,0 +1,378 @@
+from __future__ import absolute_import
+
+import logging
+import socket
+import time
+import urlparse
+
+from tornado import gen
+from tornado.httpclient import HTTPError, HTTPRequest
+try:
+    # libcurl keeps connections to Solr alive between requests.
+    from tornado.curl_httpclient import CurlAsyncHTTPClient as DefaultAsyncHTTPClient
+except ImportError:
+    from tornado.simple_httpclient import SimpleAsyncHTTPClient as DefaultAsyncHTTPClient
+
+from .schema import SolrError, SolrSchema
+from .search import MltSolrSearch, SolrSearch, params_from_dict
+from .sunburnt import MAX_LENGTH_GET_URL, SolrConnection, SolrInterface, time_left
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHttpResponse(dict):
+    """Response headers from a Tornado HTTPResponse, in the shape of an
+    httplib2.Response."""
+    def __init__(self, response):
+        super(AsyncHttpResponse, self).__init__(
+            (k.lower(), v) for k, v in response.headers.get_all())
+        self.status = response.code
+        self.reason = response.reason
+        self['status'] = str(self.status)
+
+
+class AsyncSolrConnection(SolrConnection):
+    max_clients = 100
+
+    def default_http_connection(self):
+        return DefaultAsyncHTTPClient(force_instance=True,
+                                      max_clients=self.max_clients)
+
+    def fetch(self, uri, method="GET", body=None, headers=None, compress=False, timeout=None):
+        body, headers = self.encode_request(body, headers, compress)
+        # Tornado asks for, and decompresses, gzipped responses itself.
+        headers.pop("Accept-Encoding", None)
+        request = HTTPRequest(uri, method=method, body=body, headers=headers,
+                              request_timeout=timeout)
+        return self.http_connection.fetch(request, raise_error=False)
+
+    @gen.coroutine
+    def request(self, uri, timeout=None, **kwargs):
+        policy = self.retry_policy
+        deadline = None if timeout is None else time.time() + timeout
+        attempt = 1
+        while True:
+            delay = policy.delay(attempt)
+            retry = attempt < policy.max_attempts and \
+                    (deadline is None or time.time() + delay < deadline)
+            response = yield self.dispatch(uri, deadline, **kwargs)
+            if response.code == 599:
+                if not retry:
+                    if deadline is not None and time.time() >= deadline:
+                        raise socket.timeout("Deadline exceeded")
+                    raise response.error
+            elif not retry or not policy.retry_status(response.code):
+                raise gen.Return((AsyncHttpResponse(response), response.body))
+            yield gen.sleep(delay)
+            attempt += 1
+
+    @gen.coroutine
+    def dispatch(self, uri, deadline=None, **kwargs):
+        """Fetch uri from one of the replicas, failing over to the others
+        if it can't be reached, as SolrConnection.dispatch() does.
+
+        Tornado reports connection failures, and timeouts, as a response
+        with code 599; if every replica fails, the last such response is
+        the result."""
+        if self.replicas is None or not uri.startswith(self.url):
+            response = yield self.fetch(uri, timeout=time_left(deadline), **kwargs)
+            raise gen.Return(response)
+        path = uri[len(self.url):]
+        tried = []
+        while True:
+            timeout = time_left(deadline)
+            replica = self.replicas.choose(exclude=tried)
+            if replica is None:
+                raise gen.Return(response)
+            response = yield self.fetch(replica.url + path, timeout=timeout, **kwargs)
+            if response.code != 599:
+                self.replicas.release(replica)
+                raise gen.Return(response)
+            if deadline is not None and time.time() >= deadline:
+                # The caller's time ran out, which says nothing about
+                # the replica; nor is there time for another.
+                self.replicas.release(replica)
+                raise gen.Return(response)
+            self.replicas.release(replica, failed=True)
+            tried.append(replica)
+
+    def commit(self, waitSearcher=None, expungeDeletes=None, softCommit=None, timeout=None):
+        return self.update('<commit/>', commit=True,
+                waitSearcher=waitSearcher, expungeDeletes=expungeDeletes, softCommit=softCommit,
+                timeout=timeout)
+
+    def optimize(self, waitSearcher=None, maxSegments=None, timeout=None):
+        return self.update('<optimize/>', optimize=True,
+            waitSearcher=waitSearcher, maxSegments=maxSegments, timeout=timeout)
+
+    def rollback(self, timeout=None):
+        return self.update("<rollback/>", timeout=timeout)
+
+    @gen.coroutine
+    def update(self, update_doc, **kwargs):
+        r, c = yield self.request(**self.update_request(update_doc, **kwargs))
+        if r.status != 200:
+            raise SolrError(r, c)
+
+    @gen.coroutine
+    def select(self, params, timeout=None):
+        r, c = yield self.request(timeout=timeout, **self.select_request(params))
+        if r.status != 200:
+            raise SolrError(r, c)
+        raise gen.Return(c)
+
+    @gen.coroutine
+    def mlt(self, params, content=None, timeout=None):
+        r, c = yield self.request(timeout=timeout, **self.mlt_request(params, content))
+        if r.status != 200:
+            raise SolrError(r, c)
+        raise gen.Return(c)
+
+
+class AsyncSolrSearch(SolrSearch):
+    @gen.coroutine
+    def execute(self, constructor=None, timeout=None):
+        if constructor is None:
+            constructor = self.result_constructor
+        self.check_constructor(constructor)
+        result = yield self.interface.search(timeout=timeout, record_class=self.record_class(),
+                                             **self.options())
+        raise gen.Return(self.transform_result(result, constructor))
+
+    @gen.coroutine
+    def count(self):
+        if self._count is None:
+            if self.paginator.rows is not None:
+                total_results = self.paginator.rows
+            else:
+                response = yield self.paginate(rows=0).execute()
+                total_results = response.result.numFound
+                if self.paginator.start is not None:
+                    total_results -= self.paginator.start
+            self._count = total_results
+        raise gen.Return(self._count)
+
+    def __len__(self):
+        raise TypeError("Use 'yield search.count()' on an asynchronous search")
+
+    def __getitem__(self, k):
+        raise TypeError("Use paginate() and execute() on an asynchronous search")
+
+    def stream(self, *args, **kwargs):
+        raise TypeError("stream() isn't available on an asynchronous search")
+
+    def iter_cursor(self, *args, **kwargs):
+        raise TypeError("iter_cursor() isn't available on an asynchronous search")
+
+    def export(self, *args, **kwargs):
+        raise TypeError("export() isn't available on an asynchronous search")
+
+
+class AsyncMltSolrSearch(MltSolrSearch):
+    @gen.coroutine
+    def execute(self, constructor=dict, timeout=None):
+        self.check_constructor(constructor)
+        result = yield self.interface.mlt_search(content=self.content, timeout=timeout,
+                                                 record_class=self.record_class(),
+                                                 **self.options())
+        raise gen.Return(self.transform_result(result, constructor))
+
+
+class AsyncSolrInterface(SolrInterface):
+    """A SolrInterface whose methods return Futures rather than blocking.
+
+    This uses Tornado's asynchronous HTTP client, so each Future can be
+    yielded from a Tornado coroutine (or, under Python 3, awaited from
+    an asyncio one). Query building and response parsing are shared
+    with SolrInterface.
+
+    If no schemadoc is given, the schema is fetched in the background;
+    schema_future resolves once it has arrived. Methods which talk to
+    Solr wait for it themselves, but query() and Q() need the schema
+    immediately, so yield schema_future before building queries. With
+    lazy_schema, the schema isn't fetched until schema_future is first
+    wanted, and if fetching it fails, the next time tries again.
+
+    max_clients is the maximum number of requests to Solr which will be
+    in flight at once; it is ignored if http_connection is given, in
+    which case it should be a Tornado AsyncHTTPClient. max_workers is
+    accepted but ignored: execute_many() sends every search at once,
+    with no threads to limit.
+    """
+    connection_class = AsyncSolrConnection
+    query_class = AsyncSolrSearch
+    mlt_query_class = AsyncMltSolrSearch
+    asynchronous = True
+    # The schema is fetched in the background, not when it's first
+    # wanted; this hides SolrInterface.schema.
+    schema = None
+
+    def __init__(self, url, schemadoc=None, http_connection=None, mode='',
+                 retry_timeout=-1, max_length_get_url=MAX_LENGTH_GET_URL,
+                 retry_policy=None, compress_responses=False, compress_updates=False,
+                 max_clients=AsyncSolrConnection.max_clients, result_cache=None,
+                 update_format='xml', response_format='xml', lazy_docs=False,
+                 schema_cache=None, lazy_schema=False, max_workers=None):
+        self.schema = None
+        self._schema_future = None
+        self.lazy_schema = lazy_schema
+        if http_connection is None:
+            http_connection = DefaultAsyncHTTPClient(force_instance=True,
+                                                     max_clients=max_clients)
+        super(AsyncSolrInterface, self).__init__(url, schemadoc, http_connection,
+            mode, retry_timeout, max_length_get_url, retry_policy,
+            compress_responses, compress_updates, result_cache=result_cache,
+            update_format=update_format, response_format=response_format,
+            lazy_docs=lazy_docs, schema_cache=schema_cache, lazy_schema=lazy_schema)
+
+    @property
+    def schema_future(self):
+        future = self._schema_future
+        if future is None or (self.lazy_schema and future.done()
+                              and future.exception() is not None):
+            future = self._schema_future = self.fetch_schema()
+        return future
+
+    def init_schema(self):
+        return self.schema_future
+
+    @gen.coroutine
+    def fetch_schema(self):
+        if self.schemadoc:
+            self.schema = SolrSchema(self.schemadoc)
+            raise gen.Return(self.schema)
+        url = urlparse.urljoin(self.conn.url, self.remote_schema_file)
+        cached = self.cached_schema(url)
+        try:
+            r, c = yield self.conn.request(url, headers=self.schema_request_headers(cached))
+        except self.schema_fetch_errors():
+            if cached is None:
+                raise
+            logger.warning("Couldn't reach Solr for its schema; using the cached one",
+                           exc_info=True)
+            self.schema = cached[0]
+        else:
+            self.schema = self.schema_from_response(url, r, c, cached)
+        raise gen.Return(self.schema)
+
+    def bulk_add(self, *args, **kwargs):
+        raise TypeError("bulk_add() isn't available on an asynchronous interface")
+
+    def load_csv(self, *args, **kwargs):
+        raise TypeError("load_csv() isn't available on an asynchronous interface")
+
+    def schema_fetch_errors(self):
+        # Tornado reports connection failures as HTTPErrors with code 599.
+        return super(AsyncSolrInterface, self).schema_fetch_errors() + (HTTPError,)
+
+    def check_schema(self):
+        if self.schema is None:
+            raise SolrError("Schema not loaded yet - yield schema_future first")
+
+    @gen.coroutine
+    def add(self, docs, chunk=100, chunk_bytes=None, timeout=None, **kwargs):
+        if not self.writeable:
+            raise TypeError("This Solr instance is only for reading")
+        deadline = None if timeout is None else time.time() + timeout
+        yield self.schema_future
+        sizes = []
+        for n_docs, update_message in self.update_messages(docs, chunk, chunk_bytes):
+            yield self.conn.update(update_message, timeout=time_left(deadline),
+                                   update_format=self.update_format, **kwargs)
+            sizes.append((n_docs, len(update_message)))
+        self.invalidate_cache(kwargs)
+        raise gen.Return(sizes)
+
+    @gen.coroutine
+    def delete(self, docs=None, queries=None, **kwargs):
+        if not self.writeable:
+            raise TypeError("This Solr instance is only for reading")
+        if not docs and not queries:
+            raise SolrError("No docs or query specified for deletion")
+        elif docs is not None and (hasattr(docs, "items") or not hasattr(docs, "__iter__")):
+            docs = [docs]
+        yield self.schema_future
+        delete_message = self.schema.make_delete(docs, queries)
+        yield self.conn.update(str(delete_message), **kwargs)
+        self.invalidate_cache(kwargs)
+
+    @gen.coroutine
+    def delete_all(self, timeout=None):
+        if not self.writeable:
+            raise TypeError("This Solr instance is only for reading")
+        yield self.schema_future
+        yield self.delete(queries=self.Q(**{"*":"*"}), timeout=timeout)
+
+    @gen.coroutine
+    def commit(self, *args, **kwargs):
+        if not self.writeable:
+            raise TypeError("This Solr instance is only for reading")
+        yield self.conn.commit(*args, **kwargs)
+        self.invalidate_cache()
+
+    @gen.coroutine
+    def optimize(self, *args, **kwargs):
+        if not self.writeable:
+            raise TypeError("This Solr instance is only for reading")
+        yield self.conn.optimize(*args, **kwargs)
+        self.invalidate_cache()
+
+    @gen.coroutine
+    def rollback(self, timeout=None):
+        if not self.writeable:
+            raise TypeError("This Solr instance is only for reading")
+        yield self.conn.rollback(timeout=timeout)
+        self.invalidate_cache()
+
+    @gen.coroutine
+    def search(self, timeout=None, record_class=None, **kwargs):
+        if not self.readable:
+            raise TypeError("This Solr instance is only for writing")
+        yield self.schema_future
+        params = self.response_params(params_from_dict(**kwargs))
+        response = self.cached_response(params, record_class)
+        if response is None:
+            requested = self.cache_clock()
+            response = self.schema.parse_response((yield self.conn.select(
+                self.time_allowed(params, timeout), timeout=timeout)),
+                response_format=self.response_format, lazy_docs=self.lazy_docs,
+                record_class=record_class)
+            if not response.partialResults:
+                self.cache_response(params, response, record_class, requested)
+        raise gen.Return(response)
+
+    @gen.coroutine
+    def mlt_search(self, content=None, timeout=None, record_class=None, **kwargs):
+        if not self.readable:
+            raise TypeError("This Solr instance is only for writing")
+        yield self.schema_future
+        params = self.time_allowed(self.response_params(params_from_dict(**kwargs)), timeout)
+        response = yield self.conn.mlt(params, content=content, timeout=timeout)
+        raise gen.Return(self.schema.parse_response(response,
+                                                    response_format=self.response_format,
+                                                    lazy_docs=self.lazy_docs,
+                                                    record_class=record_class))
+
+    @gen.coroutine
+    def execute_many(self, searches, timeout=None):
+        # All the searches are sent before we wait for any of them.
+        futures = [search.execute(timeout=timeout) for search in searches]
+        responses = []
+        for future in futures:
+            try:
+                responses.append((yield future))
+            except Exception, e:
+                responses.append(e)
+        raise gen.Return(responses)
+
+    def query(self, *args, **kwargs):
+        self.check_schema()
+        return super(AsyncSolrInterface, self).query(*args, **kwargs)
+
+    def mlt_query(self, *args, **kwargs):
+        self.check_schema()
+        return super(AsyncSolrInterface, self).mlt_query(*args, **kwargs)
+
+    def Q(self, *args, **kwargs):
+        self.check_schema()
+        return super(AsyncSolrInterface, self).Q(*args, **kwargs)
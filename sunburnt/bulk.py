@@ -0,0 +1,311 @@
+from __future__ import absolute_import
+
+import collections
+import cStringIO as StringIO
+import csv
+import multiprocessing
+import re
+import time
+
+from .instrumentation import reporting
+from .schema import SolrSchema, object_to_dict
+from .sunburnt import byte_grouper, grouper
+from .workers import Task, WorkerPool
+
+
+# The schema used by serialize_docs() in a worker process.
+worker_schema = None
+
+def init_worker(schema_source):
+    global worker_schema
+    worker_schema = SolrSchema(StringIO.StringIO(schema_source))
+
+def serialize_docs(docs, update_format):
+    return str(worker_schema.make_update(docs, update_format))
+
+
+class BulkLoadStats(object):
+    """Progress of a bulk load, as passed to on_progress and returned
+    when it's done."""
+    def __init__(self):
+        self.started = time.time()
+        self.docs = 0
+        self.batches = 0
+        self.bytes = 0
+        self.failed_docs = 0
+        self.failed_batches = 0
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started
+
+    @property
+    def docs_per_second(self):
+        elapsed = self.elapsed
+        return self.docs / elapsed if elapsed else 0.0
+
+    def __repr__(self):
+        return "<BulkLoadStats %s docs in %s batches (%s failed), %.1f docs/s>" % (
+            self.docs, self.batches, self.failed_docs, self.docs_per_second)
+
+
+class BulkLoader(object):
+    """Add a large number of documents to Solr as fast as possible.
+
+    Documents are converted to Solr's update format by a pool of
+    processes (processes of them; by default, one per CPU, and if 0,
+    in this process), while up to concurrency updates are sent to Solr
+    at once from a pool of threads. Objects are turned into dicts before
+    being handed to the processes, so only their field values need to
+    be picklable.
+
+    on_progress is called with a BulkLoadStats after each batch. If a
+    batch fails, on_error is called with the exception and the batch's
+    documents, and loading carries on; without an on_error, the first
+    failure stops the load and is raised. Other keyword arguments are
+    passed on with each update, as for SolrInterface.add().
+    """
+    def __init__(self, interface, chunk=1000, processes=None, concurrency=4,
+                 on_progress=None, on_error=None, **update_kwargs):
+        if not interface.writeable:
+            raise TypeError("This Solr instance is only for reading")
+        if interface.asynchronous:
+            raise TypeError("%s can't load through an asynchronous interface"
+                            % type(self).__name__)
+        self.interface = interface
+        self.chunk = chunk
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+        if not getattr(interface.conn.http_connection, 'thread_safe', False):
+            concurrency = 1
+        self.concurrency = concurrency
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self.update_kwargs = update_kwargs
+
+    def load(self, docs):
+        stats = BulkLoadStats()
+        pool = None
+        if self.processes:
+            pool = multiprocessing.Pool(self.processes, init_worker,
+                                        (self.interface.schema.source,))
+        senders = WorkerPool(self.concurrency, name="sunburnt bulk loader")
+        # Batches being serialized, and being sent, oldest first; each is
+        # only allowed to get so far ahead, so memory use stays bounded.
+        serializing = collections.deque()
+        sending = collections.deque()
+        try:
+            for batch in grouper(docs, self.chunk):
+                batch = [doc if hasattr(doc, "items")
+                         else object_to_dict(doc, self.interface.schema)
+                         for doc in batch]
+                if pool is None:
+                    task = Task(self.serialize, (batch,), {})
+                    task.run()
+                    serializing.append((batch, task.result))
+                else:
+                    serializing.append((batch, pool.apply_async(
+                        serialize_docs, (batch, self.interface.update_format)).get))
+                while len(serializing) > max(2 * self.processes, 1):
+                    self.send(serializing.popleft(), senders, sending, stats)
+            while serializing:
+                self.send(serializing.popleft(), senders, sending, stats)
+            while sending:
+                self.finish(sending.popleft(), stats)
+        finally:
+            self.interface.invalidate_cache(self.update_kwargs)
+            if pool is not None:
+                pool.terminate()
+            senders.close()
+        return stats
+
+    def serialize(self, batch):
+        return str(self.interface.schema.make_update(batch, self.interface.update_format))
+
+    def send(self, serialized, senders, sending, stats):
+        batch, result = serialized
+        try:
+            body = result()
+        except Exception, e:
+            self.failed(e, batch, stats)
+            return
+        self.submit(batch, body, senders, sending, stats)
+
+    def submit(self, batch, body, senders, sending, stats):
+        while len(sending) >= self.concurrency:
+            self.finish(sending.popleft(), stats)
+        sending.append((batch, len(body), senders.submit(self.update, body)))
+
+    def update(self, body):
+        with reporting(self.interface.new_metrics('update')) as metrics:
+            self.interface.conn.update(body, metrics=metrics,
+                                       update_format=self.interface.update_format,
+                                       **self.update_kwargs)
+
+    def finish(self, sent, stats):
+        batch, size, task = sent
+        task.wait()
+        if task.exception is not None:
+            self.failed(task.exception, batch, stats)
+            return
+        stats.docs += len(batch)
+        stats.batches += 1
+        stats.bytes += size
+        if self.on_progress is not None:
+            self.on_progress(stats)
+
+    def failed(self, exception, batch, stats):
+        stats.failed_docs += len(batch)
+        stats.failed_batches += 1
+        if self.on_error is None:
+            raise exception
+        self.on_error(exception, batch)
+
+
+class CSVLoader(BulkLoader):
+    """Load a CSV file through Solr's CSV update handler.
+
+    The file is read a line at a time, and sent in updates of whole
+    records, each of at most chunk records and chunk_bytes bytes (unless
+    a single record is bigger than that), so it is never all in memory.
+    Up to concurrency updates are sent at once, as for BulkLoader.
+
+    The column names come from the file's first line, if header is
+    true, or from fieldnames (which, if both are given, replace those
+    in the file). field_map renames columns to the Solr fields they
+    should go in; a column mapped to None is left out. skipLines lines
+    are skipped at the start of the file, before the header.
+
+    separator, encapsulator and escape say how the file is quoted; pass
+    encapsulator=None for a file which only uses escape. split maps a
+    multivalued field to the separator between its values within a
+    column (or None, for Solr's default), or may be just a list of such
+    fields. literals gives values for fields which aren't in the file.
+    skip is a list of fields to leave out, and trim and keepEmpty are
+    passed on to Solr. encoding is the file's character set.
+
+    Records are counted as documents in the BulkLoadStats; on_error is
+    called with the exception and the records of an update which
+    couldn't be sent. Other keyword arguments are passed on with each
+    update, as for SolrInterface.add().
+    """
+    def __init__(self, interface, chunk=10000, chunk_bytes=4 << 20, concurrency=1,
+                 on_progress=None, on_error=None, fieldnames=None, header=True,
+                 field_map=None, separator=',', encapsulator='"', escape=None,
+                 split=None, literals=None, skip=None, skipLines=0, trim=None,
+                 keepEmpty=None, encoding='utf-8', **update_kwargs):
+        super(CSVLoader, self).__init__(interface, chunk, 0, concurrency,
+                                        on_progress, on_error, **update_kwargs)
+        if not header and fieldnames is None:
+            raise ValueError("fieldnames are needed for a file without a header")
+        self.chunk_bytes = chunk_bytes
+        self.fieldnames = fieldnames
+        self.header = header
+        self.field_map = field_map or {}
+        self.separator = separator
+        self.encapsulator = encapsulator
+        self.escape = escape
+        self.split = split or {}
+        self.literals = literals or {}
+        self.skip = skip
+        self.skipLines = skipLines
+        self.trim = trim
+        self.keepEmpty = keepEmpty
+        self.encoding = encoding
+
+    def load(self, csv_file):
+        if isinstance(csv_file, basestring):
+            with open(csv_file, 'rb') as f:
+                return self.load(f)
+        stats = BulkLoadStats()
+        lines = iter(csv_file)
+        for i in xrange(self.skipLines):
+            next(lines, None)
+        records = csv_records(lines, self.encapsulator, self.escape)
+        fieldnames = self.fieldnames
+        if self.header:
+            first = next(records, None)
+            if first is None:
+                return stats
+            if fieldnames is None:
+                fieldnames = [name.decode(self.encoding) for name in self.parse_header(first)]
+        self.params = self.csv_params(fieldnames)
+        senders = WorkerPool(self.concurrency, name="sunburnt CSV loader")
+        sending = collections.deque()
+        try:
+            for batch in byte_grouper(records, self.chunk, self.chunk_bytes):
+                self.submit(batch, "".join(batch), senders, sending, stats)
+            while sending:
+                self.finish(sending.popleft(), stats)
+        finally:
+            self.interface.invalidate_cache(self.update_kwargs)
+            senders.close()
+        return stats
+
+    def parse_header(self, record):
+        if self.encapsulator is None:
+            reader = csv.reader([record], delimiter=self.separator,
+                                escapechar=self.escape, quoting=csv.QUOTE_NONE)
+        else:
+            reader = csv.reader([record], delimiter=self.separator,
+                                quotechar=self.encapsulator, escapechar=self.escape)
+        return next(reader, [])
+
+    def csv_params(self, fieldnames):
+        """The CSV handler's parameters for each update. The header is
+        only in the first, so the field names are always given instead."""
+        # An empty field name tells Solr to leave the column out.
+        names = [self.field_map.get(name, name) or '' for name in fieldnames]
+        params = [('header', 'false'), ('fieldnames', ','.join(names)),
+                  ('separator', self.separator)]
+        if self.encapsulator is not None:
+            params.append(('encapsulator', self.encapsulator))
+        if self.escape is not None:
+            params.append(('escape', self.escape))
+        if self.skip:
+            params.append(('skip', ','.join(self.skip)))
+        for name in ('trim', 'keepEmpty'):
+            value = getattr(self, name)
+            if value is not None:
+                params.append((name, "true" if value else "false"))
+        split = self.split
+        if not hasattr(split, 'items'):
+            split = dict.fromkeys(split)
+        for field, separator in sorted(split.items()):
+            params.append(('f.%s.split' % field, 'true'))
+            if separator is not None:
+                params.append(('f.%s.separator' % field, separator))
+        for field, value in sorted(self.literals.items()):
+            params.append(('literal.%s' % field, unicode(value)))
+        return [(k, v.encode('utf-8') if isinstance(v, unicode) else v) for k, v in params]
+
+    def update(self, body):
+        with reporting(self.interface.new_metrics('update')) as metrics:
+            self.interface.conn.csv_update(body, self.params, metrics=metrics,
+                                           encoding=self.encoding, **self.update_kwargs)
+
+
+def csv_records(lines, encapsulator='"', escape=None):
+    """Join lines of a CSV file into whole records, as a value in
+    encapsulators, or a line break after escape, may carry a record on
+    over several lines. Blank lines between records are dropped, as
+    Solr ignores them."""
+    escaped = re.compile(re.escape(escape) + '.', re.DOTALL) if escape else None
+    record = []
+    quoted = False
+    for line in lines:
+        if not record and not line.strip():
+            continue
+        record.append(line)
+        if escaped is not None:
+            line = escaped.sub('', line)
+            if not line.endswith('\n'):
+                continue
+        if encapsulator is not None:
+            quoted ^= line.count(encapsulator) & 1
+        if not quoted:
+            yield "".join(record)
+            record = []
+    if record:
+        yield "".join(record)
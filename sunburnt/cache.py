@@ -0,0 +1,194 @@
+from __future__ import absolute_import
+
+import collections
+import copy
+import cPickle as pickle
+import errno
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache(object):
+    """A cache of parsed search responses, keyed on their parameters.
+
+    At most max_size responses are kept; when it is full, the least
+    recently used one is evicted. Responses older than ttl seconds are
+    never returned (pass ttl=None to keep them until they're evicted).
+
+    Pass one of these as the result_cache of a SolrInterface. Commits,
+    optimizes and rollbacks made through the interface (and adds and
+    deletes which ask for a commit) clear it. An update with a
+    commitWithin clears it too, and until that time has passed, no
+    response is stored, since Solr may not have committed yet.
+    """
+    clock = time.time
+
+    def __init__(self, max_size=1000, ttl=60):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (response, time it was stored), least recently used first.
+        self.entries = collections.OrderedDict()
+        # Responses asked for before this time aren't stored.
+        self.pending_commit = None
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(
+            ('hits', 'misses', 'evictions', 'expirations', 'invalidations'), 0)
+
+    def get(self, key):
+        """Return a copy of the response stored under key, or None."""
+        with self.lock:
+            try:
+                response, stored = self.entries.pop(key)
+            except KeyError:
+                self.counts['misses'] += 1
+                return None
+            if self.ttl is not None and self.clock() - stored > self.ttl:
+                self.counts['expirations'] += 1
+                self.counts['misses'] += 1
+                return None
+            self.entries[key] = (response, stored)
+            self.counts['hits'] += 1
+        return copy_response(response)
+
+    def put(self, key, response, requested=None):
+        """Store response under key. requested is when it was asked for
+        (by default, now); if that was before a pending commit, it may
+        be out of date already, so it isn't stored."""
+        if requested is None:
+            requested = self.clock()
+        with self.lock:
+            if self.pending_commit is not None and requested < self.pending_commit:
+                return
+        # Store a copy, since the caller is free to change the original.
+        response = copy_response(response)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (response, self.clock())
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.counts['evictions'] += 1
+
+    def clear(self, until=None):
+        """Throw away every response. If until is given, a commit is due by
+        then, so nothing asked for before it is stored either."""
+        with self.lock:
+            self.entries.clear()
+            self.counts['invalidations'] += 1
+            if until is not None:
+                self.pending_commit = max(until, self.pending_commit)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+            stats['size'] = len(self.entries)
+        return stats
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def copy_response(response):
+    """Copy a SolrResponse deeply enough that turning its documents into
+    objects, or adding highlighting to them, leaves the original alone."""
+    response = copy.copy(response)
+    response.result = copy.copy(response.result)
+    docs = response.result.docs
+    if isinstance(docs, list):
+        response.result.docs = [doc.copy() for doc in docs]
+    else:
+        # Results as columns, rather than a list of documents.
+        response.result.docs = docs.copy()
+    return response
+
+
+class SchemaCache(object):
+    """A cache of parsed schemas on disk, so that a new SolrInterface
+    needn't download and parse schema.xml again if it hasn't changed.
+
+    Each schema is pickled in directory, along with the ETag and
+    Last-Modified header Solr sent it with (and a digest of it, for
+    when Solr sends neither). When it's wanted again, Solr is asked for
+    it only if it has changed since; if Solr can't be reached, or is
+    unavailable, the cached schema is used as it is.
+
+    Pass one of these as the schema_cache of a SolrInterface. Any number
+    of processes can share a directory.
+    """
+    # Changed whenever what's pickled changes, so that old files are ignored.
+    format = 2
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url).hexdigest() + '.schema')
+
+    def get(self, url):
+        """Return the (schema, validators) stored for the schema at url,
+        or None. validators is a dict of the headers Solr sent with it
+        (lower case), and its 'sha1'."""
+        try:
+            with open(self.path(url), 'rb') as f:
+                entry = pickle.load(f)
+        except (IOError, OSError), e:
+            if e.errno != errno.ENOENT:
+                logger.warning("Couldn't read cached schema for %s: %s", url, e)
+            return None
+        except Exception:
+            logger.warning("Ignoring unreadable cached schema for %s", url, exc_info=True)
+            return None
+        format, stored_url, schema, validators = entry
+        if format != self.format or stored_url != url:
+            return None
+        return schema, validators
+
+    def put(self, url, schema, validators):
+        """Store schema, from url. Failing to isn't an error; it's
+        logged, and the schema will be fetched again next time."""
+        try:
+            try:
+                os.makedirs(self.directory)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+            # Written to one side first, so that no one reads half of it.
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.schema')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump((self.format, url, schema, validators), f,
+                                pickle.HIGHEST_PROTOCOL)
+                os.rename(temp_path, self.path(url))
+            except:
+                os.remove(temp_path)
+                raise
+        except (IOError, OSError), e:
+            logger.warning("Couldn't cache schema for %s: %s", url, e)
+
+
+def schema_validators(r, c):
+    """What to check a cached copy of the schema in c, which came with
+    the response headers r, against."""
+    validators = {'sha1': hashlib.sha1(c).hexdigest()}
+    if hasattr(r, 'get'):
+        for header in ('etag', 'last-modified'):
+            if r.get(header):
+                validators[header] = r[header]
+    return validators
+
+
+def conditional_headers(validators):
+    """Headers asking Solr for the schema only if it has changed."""
+    headers = {}
+    if 'etag' in validators:
+        headers['If-None-Match'] = validators['etag']
+    if 'last-modified' in validators:
+        headers['If-Modified-Since'] = validators['last-modified']
+    return headers
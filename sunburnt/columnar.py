@@ -0,0 +1,141 @@
+"""Search results as columns of NumPy arrays, as asked for with
+SolrSearch.results_as_columns(). NumPy is only needed if that's used.
+"""
+from __future__ import absolute_import
+
+import collections
+
+import numpy
+
+from .schema import SolrBooleanField, SolrDateField, SolrDoubleField, SolrError, \
+    SolrFloatField, SolrIntField, SolrLongField, SolrShortField, convert_result_value
+
+# The dtype of the column for each kind of field (SolrScoreField is a
+# SolrDoubleField). Any other field is kept in an array of objects,
+# converted just as results_as_records() would convert it.
+COLUMN_DTYPES = [
+    (SolrShortField, numpy.int16),
+    (SolrIntField, numpy.int32),
+    (SolrLongField, numpy.int64),
+    (SolrFloatField, numpy.float32),
+    (SolrDoubleField, numpy.float64),
+    (SolrDateField, 'datetime64[ms]'),
+    (SolrBooleanField, numpy.bool_),
+]
+
+# What goes under the mask where a document has no value.
+FILL_VALUES = {'i': 0, 'f': 0, 'b': False, 'M': 'NaT'}
+
+
+def column_dtype(field_class):
+    for cls, dtype in COLUMN_DTYPES:
+        if isinstance(field_class, cls):
+            return numpy.dtype(dtype)
+    return numpy.dtype(object)
+
+
+class MultiValuedColumn(collections.namedtuple('MultiValuedColumn', 'values offsets')):
+    """The values of a multivalued field, for every document one after
+    another; those of document i are values[offsets[i]:offsets[i+1]], so
+    offsets has one more entry than there are documents, and a document
+    without the field has none.
+    """
+    __slots__ = ()
+
+    def row(self, i):
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def copy(self):
+        return MultiValuedColumn(self.values.copy(), self.offsets.copy())
+
+
+class SolrColumns(dict):
+    """A page of results as a dict of the fields in it to columns, each
+    with an entry for every one of the rows documents.
+
+    Short, int, long, float, double (and score), date and boolean fields
+    become arrays of the matching dtype - datetime64[ms] for dates - and
+    any other field an array of objects. If some documents don't have a
+    field, its column is a numpy.ma.MaskedArray with those entries masked
+    (or, for an array of objects, None). Multivalued fields become a
+    MultiValuedColumn.
+    """
+    def __init__(self, columns=(), rows=0):
+        super(SolrColumns, self).__init__(columns)
+        self.rows = rows
+
+    @classmethod
+    def from_result_docs(cls, schema, docs):
+        """Convert result documents - <doc> nodes, or dicts decoded from
+        JSON or javabin - into columns, without a Python object for each
+        value of a numeric or date field along the way."""
+        rows = len(docs)
+        values = {}
+        for i, doc in enumerate(docs):
+            if hasattr(doc, 'iteritems'):
+                items = doc.iteritems()
+            else:
+                items = schema.raw_result_items(doc)
+            for name, value in items:
+                try:
+                    column = values[name]
+                except KeyError:
+                    column = values[name] = [None] * rows
+                column[i] = value
+        return cls(((name, make_column(schema.result_field(name), name, column))
+                    for name, column in values.iteritems()), rows)
+
+    def copy(self):
+        return SolrColumns(((name, column.copy()) for name, column in self.iteritems()),
+                           self.rows)
+
+
+def make_column(field_class, name, values):
+    """A column of values, as Solr gave them, with None for a document
+    which doesn't have the field."""
+    dtype = column_dtype(field_class)
+    if getattr(field_class, 'multi_valued', False) \
+            or any(isinstance(value, list) for value in values):
+        offsets = numpy.zeros(len(values) + 1, dtype=numpy.int64)
+        flat = []
+        for i, value in enumerate(values):
+            if isinstance(value, list):
+                flat.extend(value)
+            elif value is not None:
+                flat.append(value)
+            offsets[i + 1] = len(flat)
+        return MultiValuedColumn(make_array(field_class, name, dtype, flat), offsets)
+    if dtype.kind == 'O' or None not in values:
+        return make_array(field_class, name, dtype, values)
+    mask = numpy.array([value is None for value in values])
+    fill = FILL_VALUES[dtype.kind]
+    values = [fill if value is None else value for value in values]
+    return numpy.ma.array(make_array(field_class, name, dtype, values), mask=mask)
+
+
+def make_array(field_class, name, dtype, values):
+    if dtype.kind == 'O':
+        array = numpy.empty(len(values), dtype=object)
+        for i, value in enumerate(values):
+            if value is not None:
+                array[i] = convert_result_value(field_class, value)
+        return array
+    if dtype.kind == 'b':
+        values = [field_class.from_solr(value) for value in values]
+    elif dtype.kind == 'M':
+        values = [date_string(field_class, value) for value in values]
+    try:
+        # NumPy parses numbers and dates from strings by itself.
+        return numpy.array(values, dtype=dtype)
+    except (OverflowError, TypeError, ValueError):
+        raise SolrError("invalid value for a %s column (field %s)" % (dtype, name))
+
+
+def date_string(field_class, value):
+    # Solr's dates are in UTC; NumPy warns about the Z saying so.
+    if not isinstance(value, basestring):
+        # javabin responses hold dates.
+        value = field_class.to_solr(field_class.from_solr(value))
+    if value.endswith('Z'):
+        value = value[:-1]
+    return value
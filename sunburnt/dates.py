@@ -2,13 +2,23 @@ from __future__ import absolute_import
 
 import datetime, math, re, warnings
 
-try:
-    import mx.DateTime
-except ImportError:
-    warnings.warn(
-        "mx.DateTime not found, retricted to Python datetime objects",
-        ImportWarning)
-    mx = None
+# mx.DateTime is slow to import, so it isn't looked for until the first
+# date is converted; mx is then the mx package, or None if it isn't
+# installed.
+NOT_LOADED = object()
+mx = NOT_LOADED
+
+def load_mx():
+    global mx
+    if mx is NOT_LOADED:
+        try:
+            import mx.DateTime
+        except ImportError:
+            warnings.warn(
+                "mx.DateTime not found, retricted to Python datetime objects",
+                ImportWarning)
+            mx = None
+    return mx
 
 
 year = r'[+/-]?\d+'
@@ -66,27 +76,43 @@ class DateTimeRangeError(ValueError):
     pass
     
 
-if mx:
-    def datetime_factory(**kwargs):
-        try:
-            return mx.DateTime.DateTimeFrom(**kwargs)
-        except mx.DateTime.RangeError:
-            raise DateTimeRangeError(e.args[0])
-else:
-    def datetime_factory(**kwargs):
-        second = kwargs.get('second')
-        if second is not None:
-            f, i = math.modf(second)
-            kwargs['second'] = int(i)
-            kwargs['microsecond'] = int(f * 1000000)
-        try:
-            return datetime.datetime(**kwargs)
-        except ValueError, e:
-            raise DateTimeRangeError(e.args[0])
+def datetime_factory(**kwargs):
+    if load_mx():
+        return mx_datetime_factory(**kwargs)
+    return py_datetime_factory(**kwargs)
+
+def mx_datetime_factory(**kwargs):
+    try:
+        return mx.DateTime.DateTimeFrom(**kwargs)
+    except mx.DateTime.RangeError:
+        raise DateTimeRangeError(e.args[0])
 
-if mx:
-    def datetime_delta_factory(hours, minutes):
+def py_datetime_factory(**kwargs):
+    second = kwargs.get('second')
+    if second is not None:
+        f, i = math.modf(second)
+        kwargs['second'] = int(i)
+        kwargs['microsecond'] = int(f * 1000000)
+    try:
+        return datetime.datetime(**kwargs)
+    except ValueError, e:
+        raise DateTimeRangeError(e.args[0])
+
+def datetime_delta_factory(hours, minutes):
+    if load_mx():
         return mx.DateTime.DateTimeDelta(0, hours, minutes)
-else:
-    def datetime_delta_factory(hours, minutes):
-        return datetime.timedelta(hours=hours, minutes=minutes)
+    return datetime.timedelta(hours=hours, minutes=minutes)
+
+
+epoch = datetime.datetime(1970, 1, 1)
+
+def datetime_from_timestamp(ms):
+    """The date ms milliseconds after the epoch (as Solr's javabin format
+    sends dates), in the same form as datetime_from_w3_datestring()
+    returns it."""
+    dt = epoch + datetime.timedelta(milliseconds=ms)
+    if load_mx():
+        return datetime_factory(year=dt.year, month=dt.month, day=dt.day,
+                                hour=dt.hour, minute=dt.minute,
+                                second=dt.second + dt.microsecond / 1000000.0)
+    return dt
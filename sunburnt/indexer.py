@@ -0,0 +1,172 @@
+from __future__ import absolute_import
+
+import logging
+import Queue
+import threading
+import time
+
+from .instrumentation import reporting
+from .schema import UPDATE_FORMATS
+
+logger = logging.getLogger(__name__)
+
+
+class Flush(object):
+    """Put on the queue to have the batch so far sent at once."""
+    def __init__(self):
+        self.done = threading.Event()
+
+
+# Put on the queue to stop the background thread.
+CLOSE = object()
+
+
+class BufferedIndexer(object):
+    """Collect documents from any number of threads, and send them to
+    Solr in batches from a background thread.
+
+    A batch is sent once it holds max_docs documents or max_bytes bytes
+    of XML, or once its first document has waited max_latency seconds,
+    whichever comes first. At most queue_size documents can be waiting
+    to be sent; once that many are, add() blocks until there is room.
+
+    If a batch can't be sent, on_error is called with the exception and
+    the documents in the batch; by default, the error is logged. Other
+    keyword arguments (commitWithin, say) are passed on with each update.
+
+    Documents are serialized by add(), so invalid ones are rejected
+    straight away, in the thread which added them. The interface's
+    http_connection is used from the background thread, so if other
+    threads use the interface at the same time, it should be
+    thread-safe, like PooledHttp.
+    """
+    def __init__(self, interface, max_docs=100, max_bytes=1024 * 1024, max_latency=1.0,
+                 queue_size=1000, on_error=None, **update_kwargs):
+        if not interface.writeable:
+            raise TypeError("This Solr instance is only for reading")
+        if interface.asynchronous:
+            raise TypeError("BufferedIndexer can't send updates through an asynchronous interface")
+        self.interface = interface
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.queue = Queue.Queue(queue_size)
+        self.on_error = on_error
+        self.update_kwargs = update_kwargs
+        self.closed = False
+        self.lock = threading.Lock()
+        # Held while checking closed and putting something on the queue,
+        # so that nothing can be put on it after CLOSE.
+        self.put_lock = threading.Lock()
+        self.counts = dict.fromkeys(
+            ('docs_added', 'docs_sent', 'docs_failed', 'batches', 'bytes'), 0)
+        self.thread = threading.Thread(target=self.run, name="sunburnt indexer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, doc, block=True, timeout=None):
+        """Queue a document to be sent. If the queue is full, wait for room
+        (unless block is False), for up to timeout seconds; Queue.Full is
+        raised if there is still none."""
+        self.check_open()
+        fragment = self.interface.schema.make_update_fragment(doc, self.interface.update_format)
+        self.put((doc, fragment), block, timeout)
+        with self.lock:
+            self.counts['docs_added'] += 1
+
+    def flush(self, timeout=None):
+        """Send every document added so far, waiting until that's done.
+        Returns False if timeout passed first."""
+        flush = Flush()
+        self.put(flush)
+        flush.done.wait(timeout)
+        return flush.done.is_set()
+
+    def close(self, timeout=None):
+        """Send every document added so far, and stop the background
+        thread."""
+        with self.put_lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(CLOSE)
+        self.thread.join(timeout)
+
+    def check_open(self):
+        if self.closed:
+            raise ValueError("This indexer has been closed")
+
+    def put(self, item, block=True, timeout=None):
+        with self.put_lock:
+            self.check_open()
+            self.queue.put(item, block, timeout)
+
+    def run(self):
+        batch = []
+        batch_bytes = 0
+        deadline = None
+        while True:
+            try:
+                if deadline is None:
+                    item = self.queue.get()
+                else:
+                    item = self.queue.get(timeout=max(deadline - time.time(), 0))
+            except Queue.Empty:
+                # The batch has waited for max_latency.
+                item = None
+            if isinstance(item, tuple):
+                batch.append(item)
+                batch_bytes += len(item[1])
+                if deadline is None:
+                    deadline = time.time() + self.max_latency
+                if len(batch) < self.max_docs and batch_bytes < self.max_bytes:
+                    continue
+            if batch:
+                self.send(batch)
+                batch, batch_bytes, deadline = [], 0, None
+            if item is CLOSE:
+                return
+            if isinstance(item, Flush):
+                item.done.set()
+
+    def send(self, batch):
+        update_format = self.interface.update_format
+        body = UPDATE_FORMATS[update_format].join_fragments(
+            fragment for doc, fragment in batch)
+        try:
+            with reporting(self.interface.new_metrics('update')) as metrics:
+                self.interface.conn.update(body, metrics=metrics, update_format=update_format,
+                                           **self.update_kwargs)
+        except Exception, e:
+            with self.lock:
+                self.counts['docs_failed'] += len(batch)
+            self.error(e, [doc for doc, fragment in batch])
+        else:
+            with self.lock:
+                self.counts['docs_sent'] += len(batch)
+                self.counts['batches'] += 1
+                self.counts['bytes'] += len(body)
+            self.interface.invalidate_cache(self.update_kwargs)
+
+    def error(self, exception, docs):
+        if self.on_error is None:
+            logger.error("Failed to send %s documents to Solr: %s", len(docs), exception)
+            return
+        try:
+            self.on_error(exception, docs)
+        except Exception:
+            logger.exception("Error in indexer error callback %r", self.on_error)
+
+    def stats(self):
+        """Return the number of documents added, sent and failed, and the
+        number of batches and bytes sent."""
+        with self.lock:
+            stats = dict(self.counts)
+        stats['queued'] = self.queue.qsize()
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
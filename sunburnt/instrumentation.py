@@ -0,0 +1,105 @@
+from __future__ import absolute_import
+
+import contextlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetrics(object):
+    """What happened during one request to Solr, as passed to listeners.
+
+    handler is 'select', 'mlt', 'update' or 'export' (or None, for
+    anything else, like fetching the schema). timings holds the seconds spent in each
+    phase which the request went through:
+
+    * build: turning the query (or documents) into a Solr request;
+    * http: talking to Solr, including any retries;
+    * parse: parsing the XML response;
+    * convert: turning result documents into Python values, and then
+      into objects, if a constructor was given.
+
+    and total is the time from the start of the request to the end.
+    cached is True if a search was answered from the result cache, in
+    which case Solr wasn't asked at all.
+    """
+    def __init__(self, listeners, handler=None):
+        self.listeners = listeners
+        self.handler = handler
+        self.started = time.time()
+        self.timings = {}
+        self.total = None
+        self.method = self.url = self.status = None
+        self.attempts = 0
+        self.request_bytes = self.request_wire_bytes = 0
+        self.response_bytes = self.response_wire_bytes = 0
+        self.QTime = None
+        self.numFound = None
+        self.docs = None
+        self.cached = False
+        self.error = None
+
+    @contextlib.contextmanager
+    def timing(self, phase):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0) + time.time() - start
+
+    def record_response(self, response):
+        """Note the details of a parsed SolrResponse."""
+        self.QTime = response.QTime
+        self.numFound = response.result.numFound
+        docs = response.result.docs
+        # Results as columns know how many documents they hold.
+        self.docs = getattr(docs, 'rows', None)
+        if self.docs is None:
+            self.docs = len(docs)
+
+    def finish(self, error=None):
+        """Call the listeners, once the request is over."""
+        if self.total is not None:
+            return
+        self.total = time.time() - self.started
+        self.error = error
+        for listener in self.listeners:
+            try:
+                listener(self)
+            except Exception:
+                logger.exception("Error in request listener %r", listener)
+
+    def __repr__(self):
+        return "<RequestMetrics %s %s %s: %s>" % (self.method, self.url, self.status,
+            ", ".join("%s=%.4f" % (k, v) for k, v in sorted(self.timings.items())))
+
+
+@contextlib.contextmanager
+def reporting(metrics):
+    """Report metrics (if there are any) to their listeners once the
+    block is over, along with any exception it raised."""
+    try:
+        yield metrics
+    except Exception, e:
+        if metrics is not None:
+            metrics.finish(e)
+        raise
+    if metrics is not None:
+        metrics.finish()
+
+
+def timing(metrics, phase):
+    """Time phase of a request, if its metrics are being recorded."""
+    if metrics is None:
+        return no_timing
+    return metrics.timing(phase)
+
+
+class NoTiming(object):
+    def __enter__(self):
+        pass
+    def __exit__(self, *exc_info):
+        pass
+
+no_timing = NoTiming()
@@ -0,0 +1,364 @@
+"""Solr's javabin response format, as asked for with wt=javabin.
+
+loads() decodes a javabin message. Named lists (like the response
+itself) come back as NamedLists of (name, value) pairs, result
+documents as SolrDocuments, and results as SolrDocumentLists, which
+hold numFound, start, maxScore and docs just as a JSON response does.
+dumps() encodes the same things again.
+"""
+from __future__ import absolute_import
+
+import calendar
+from codecs import utf_8_decode
+import struct
+import uuid
+
+from .dates import datetime_from_timestamp
+
+VERSION = 2
+
+# Tags which are a whole byte.
+(NULL, BOOL_TRUE, BOOL_FALSE, BYTE, SHORT, DOUBLE, INT, LONG, FLOAT, DATE, MAP,
+ SOLRDOC, SOLRDOCLST, BYTEARR, ITERATOR, END, SOLRINPUTDOC, MAP_ENTRY_ITER,
+ ENUM_FIELD_VALUE, MAP_ENTRY, UUID) = range(21)
+
+# Tags which are the top three bits of a byte; the rest holds a size,
+# or the start of one.
+STR, SINT, SLONG, ARR, ORDERED_MAP, NAMED_LST, EXTERN_STRING = [i << 5 for i in range(1, 8)]
+
+INT32 = struct.Struct(">i")
+INT64 = struct.Struct(">q")
+INT16 = struct.Struct(">h")
+INT8 = struct.Struct(">b")
+FLOAT32 = struct.Struct(">f")
+FLOAT64 = struct.Struct(">d")
+
+
+class NamedList(list):
+    """A list of (name, value) pairs."""
+
+
+class SolrDocument(dict):
+    pass
+
+
+class SolrDocumentList(dict):
+    def __init__(self, numFound, start, maxScore, docs):
+        super(SolrDocumentList, self).__init__(
+            numFound=numFound, start=start, maxScore=maxScore, docs=docs)
+
+
+# Returned by Decoder.read_value() at the end of an iterator.
+end_marker = object()
+
+
+class Decoder(object):
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.strings = []
+
+    def decode(self):
+        if not self.data or ord(self.data[0]) != VERSION:
+            raise ValueError("Not a javabin message (or not version %s)" % VERSION)
+        self.pos = 1
+        try:
+            return self.read_value()
+        except (IndexError, struct.error):
+            raise ValueError("Truncated javabin message")
+
+    def read_value(self):
+        tag = ord(self.data[self.pos])
+        self.pos += 1
+        if tag >> 5:
+            return self.shifted_readers[tag >> 5](self, tag)
+        try:
+            reader = self.readers[tag]
+        except IndexError:
+            reader = None
+        if reader is None:
+            raise ValueError("Unknown javabin tag %s" % tag)
+        return reader(self)
+
+    def read_vint(self):
+        data = self.data
+        pos = self.pos
+        b = ord(data[pos])
+        pos += 1
+        value = b & 0x7f
+        shift = 7
+        while b & 0x80:
+            b = ord(data[pos])
+            pos += 1
+            value |= (b & 0x7f) << shift
+            shift += 7
+        self.pos = pos
+        return value
+
+    def read_size(self, tag):
+        size = tag & 0x1f
+        if size == 0x1f:
+            size += self.read_vint()
+        return size
+
+    def read_struct(self, s):
+        value, = s.unpack_from(self.data, self.pos)
+        self.pos += s.size
+        return value
+
+    def read_bytes(self, n):
+        start = self.pos
+        self.pos += n
+        if self.pos > len(self.data):
+            raise IndexError
+        return self.data[start:self.pos]
+
+    # Readers for the shifted tags.
+
+    def read_str(self, tag):
+        size = tag & 0x1f
+        if size == 0x1f:
+            size += self.read_vint()
+        return utf_8_decode(self.read_bytes(size), 'strict', True)[0]
+
+    def read_small_int(self, tag):
+        value = tag & 0x0f
+        if tag & 0x10:
+            value |= self.read_vint() << 4
+        return value
+
+    def read_arr(self, tag):
+        return [self.read_value() for i in xrange(self.read_size(tag))]
+
+    def read_named_list(self, tag):
+        read_value = self.read_value
+        return NamedList((read_value(), read_value()) for i in xrange(self.read_size(tag)))
+
+    def read_extern_string(self, tag):
+        i = self.read_size(tag)
+        if i:
+            return self.strings[i - 1]
+        s = self.read_value()
+        self.strings.append(s)
+        return s
+
+    shifted_readers = [None, read_str, read_small_int, read_small_int, read_arr,
+                       read_named_list, read_named_list, read_extern_string]
+
+    # Readers for the whole-byte tags.
+
+    def read_float(self):
+        # Solr's other formats give floats as Java prints them: the
+        # shortest decimal which reads back as the same float. Do the
+        # same, rather than giving the float's exact value as a double.
+        value = self.read_struct(FLOAT32)
+        for precision in xrange(1, 10):
+            shortest = float("%.*g" % (precision, value))
+            if FLOAT32.unpack(FLOAT32.pack(shortest))[0] == value:
+                return shortest
+        return value
+
+    def read_date(self):
+        return datetime_from_timestamp(self.read_struct(INT64))
+
+    def read_map(self):
+        read_value = self.read_value
+        return dict((read_value(), read_value()) for i in xrange(self.read_vint()))
+
+    def read_solr_doc(self):
+        tag = ord(self.data[self.pos])
+        self.pos += 1
+        doc = SolrDocument()
+        children = []
+        for i in xrange(self.read_size(tag)):
+            name = self.read_value()
+            # Child documents come without a name.
+            if isinstance(name, SolrDocument):
+                children.append(name)
+            else:
+                doc[name] = self.read_value()
+        if children:
+            doc['_childDocuments_'] = children
+        return doc
+
+    def read_solr_doc_list(self):
+        numFound, start, maxScore = self.read_value()
+        return SolrDocumentList(numFound, start, maxScore, self.read_value())
+
+    def read_byte_arr(self):
+        return bytearray(self.read_bytes(self.read_vint()))
+
+    def read_iterator(self):
+        values = []
+        while True:
+            value = self.read_value()
+            if value is end_marker:
+                return values
+            values.append(value)
+
+    def read_map_entry_iter(self):
+        entries = NamedList()
+        while True:
+            name = self.read_value()
+            if name is end_marker:
+                return entries
+            entries.append((name, self.read_value()))
+
+    def read_enum_field_value(self):
+        # The enum's number, then its name, which is what XML gives.
+        self.read_value()
+        return self.read_value()
+
+    def read_map_entry(self):
+        return self.read_value(), self.read_value()
+
+    def read_uuid(self):
+        return unicode(uuid.UUID(bytes=self.read_bytes(16)))
+
+    readers = [
+        lambda self: None,
+        lambda self: True,
+        lambda self: False,
+        lambda self: self.read_struct(INT8),
+        lambda self: self.read_struct(INT16),
+        lambda self: self.read_struct(FLOAT64),
+        lambda self: self.read_struct(INT32),
+        lambda self: self.read_struct(INT64),
+        read_float,
+        read_date,
+        read_map,
+        read_solr_doc,
+        read_solr_doc_list,
+        read_byte_arr,
+        read_iterator,
+        lambda self: end_marker,
+        None, # SOLRINPUTDOC, which Solr never responds with.
+        read_map_entry_iter,
+        read_enum_field_value,
+        read_map_entry,
+        read_uuid,
+        ]
+
+
+class Encoder(object):
+    def __init__(self):
+        self.chunks = []
+        self.strings = {}
+
+    def encode(self, value):
+        self.chunks.append(chr(VERSION))
+        self.write_value(value)
+        return "".join(self.chunks)
+
+    def write_value(self, value):
+        write = self.chunks.append
+        if value is None:
+            write(chr(NULL))
+        elif value is True:
+            write(chr(BOOL_TRUE))
+        elif value is False:
+            write(chr(BOOL_FALSE))
+        elif isinstance(value, (int, long)):
+            if -2**31 <= value < 2**31:
+                self.write_int(value)
+            else:
+                self.write_long(value)
+        elif isinstance(value, float):
+            write(chr(DOUBLE) + FLOAT64.pack(value))
+        elif isinstance(value, basestring):
+            self.write_str(value)
+        elif isinstance(value, bytearray):
+            write(chr(BYTEARR))
+            self.write_vint(len(value))
+            write(str(value))
+        elif isinstance(value, SolrDocumentList):
+            # numFound and start are longs, as Solr writes them.
+            write(chr(SOLRDOCLST))
+            self.write_tag(ARR, 3)
+            self.write_long(value['numFound'])
+            self.write_long(value['start'])
+            self.write_value(value['maxScore'])
+            self.write_value(value['docs'])
+        elif isinstance(value, SolrDocument):
+            write(chr(SOLRDOC))
+            self.write_tag(ORDERED_MAP, len(value))
+            for name, v in value.items():
+                self.write_extern_string(name)
+                self.write_value(v)
+        elif isinstance(value, NamedList):
+            self.write_tag(NAMED_LST, len(value))
+            for name, v in value:
+                self.write_extern_string(name)
+                self.write_value(v)
+        elif isinstance(value, dict):
+            write(chr(MAP))
+            self.write_vint(len(value))
+            for k, v in value.items():
+                self.write_value(k)
+                self.write_value(v)
+        elif isinstance(value, (list, tuple)):
+            self.write_tag(ARR, len(value))
+            for v in value:
+                self.write_value(v)
+        elif hasattr(value, 'utctimetuple'):
+            ms = calendar.timegm(value.utctimetuple()) * 1000 + value.microsecond // 1000
+            write(chr(DATE) + INT64.pack(ms))
+        else:
+            raise TypeError("Can't encode %r as javabin" % (value,))
+
+    def write_int(self, value):
+        # Small positive numbers are written as variable-length ints.
+        if value > 0:
+            self.write_small_int(SINT, value)
+        else:
+            self.chunks.append(chr(INT) + INT32.pack(value))
+
+    def write_long(self, value):
+        if 0 <= value < 2**56:
+            self.write_small_int(SLONG, value)
+        else:
+            self.chunks.append(chr(LONG) + INT64.pack(value))
+
+    def write_small_int(self, tag, value):
+        if value >= 0x0f:
+            self.chunks.append(chr(tag | 0x10 | (value & 0x0f)))
+            self.write_vint(value >> 4)
+        else:
+            self.chunks.append(chr(tag | value))
+
+    def write_str(self, value):
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        self.write_tag(STR, len(value))
+        self.chunks.append(value)
+
+    def write_extern_string(self, value):
+        i = self.strings.get(value)
+        if i is not None:
+            self.write_tag(EXTERN_STRING, i)
+        else:
+            self.write_tag(EXTERN_STRING, 0)
+            self.write_str(value)
+            self.strings[value] = len(self.strings) + 1
+
+    def write_tag(self, tag, size):
+        if size < 0x1f:
+            self.chunks.append(chr(tag | size))
+        else:
+            self.chunks.append(chr(tag | 0x1f))
+            self.write_vint(size - 0x1f)
+
+    def write_vint(self, value):
+        chunks = []
+        while value & ~0x7f:
+            chunks.append(chr((value & 0x7f) | 0x80))
+            value >>= 7
+        chunks.append(chr(value))
+        self.chunks.append("".join(chunks))
+
+
+def loads(data):
+    return Decoder(data).decode()
+
+def dumps(value):
+    return Encoder().encode(value)
@@ -0,0 +1,132 @@
+from __future__ import absolute_import
+
+import httplib
+import threading
+import time
+
+from .transport import PooledHttp
+
+
+class Replica(object):
+    def __init__(self, url):
+        self.url = url.rstrip("/") + "/"
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.down_since = None
+
+    def __repr__(self):
+        return "Replica(%r, %s)" % (self.url, "up" if self.healthy else "down")
+
+
+class ReplicaSet(object):
+    """A set of Solr replicas which requests are balanced across.
+
+    Pass one of these (or just a list of URLs) as the url of a
+    SolrInterface. Each request is sent to one healthy replica, chosen
+    either in turn ('round_robin') or as the one with fewest requests
+    in progress ('least_outstanding'). A replica which can't be reached
+    is marked down and the request is tried on the next one; down
+    replicas are probed every probe_interval seconds in a background
+    thread, and re-admitted as soon as they answer.
+    """
+    strategies = ('round_robin', 'least_outstanding')
+    probe_path = "admin/ping"
+
+    def __init__(self, urls, strategy='round_robin', probe_interval=5,
+                 probe_timeout=2, probe_connection=None):
+        if isinstance(urls, basestring):
+            urls = [urls]
+        self.replicas = [Replica(url) for url in urls]
+        if not self.replicas:
+            raise ValueError("At least one replica URL must be given")
+        if strategy not in self.strategies:
+            raise ValueError("strategy must be one of %s" % (self.strategies,))
+        self.strategy = strategy
+        self.probe_interval = probe_interval
+        if probe_connection is None:
+            # The prober runs in its own thread, so it mustn't share the
+            # connection (which may well not be thread-safe) used for requests.
+            probe_connection = PooledHttp(pool_size=1, timeout=probe_timeout)
+        self.probe_connection = probe_connection
+        self.prober = None
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    @property
+    def urls(self):
+        return [replica.url for replica in self.replicas]
+
+    def choose(self, exclude=()):
+        """Pick a replica for a request, and count it as outstanding until
+        release() is called. Down replicas are only picked if there are no
+        healthy ones left; None is returned if every replica is excluded."""
+        with self.lock:
+            candidates = [r for r in self.replicas if r not in exclude]
+            healthy = [r for r in candidates if r.healthy]
+            if healthy:
+                candidates = healthy
+            if not candidates:
+                return None
+            # Rotate the candidates, so that round_robin takes each in turn,
+            # and least_outstanding shares ties out between them.
+            offset = self.counter % len(candidates)
+            self.counter += 1
+            candidates = candidates[offset:] + candidates[:offset]
+            if self.strategy == 'least_outstanding':
+                replica = min(candidates, key=lambda r: r.outstanding)
+            else:
+                replica = candidates[0]
+            replica.outstanding += 1
+            replica.requests += 1
+            return replica
+
+    def release(self, replica, failed=False):
+        with self.lock:
+            replica.outstanding -= 1
+            if failed:
+                replica.failures += 1
+                self._mark_down(replica)
+            elif not replica.healthy:
+                replica.healthy = True
+                replica.down_since = None
+
+    def _mark_down(self, replica):
+        if replica.healthy:
+            replica.healthy = False
+            replica.down_since = time.time()
+        if self.probe_interval is not None and self.prober is None:
+            self.prober = threading.Thread(target=self.probe_until_healthy,
+                                           name="sunburnt replica prober")
+            self.prober.daemon = True
+            self.prober.start()
+
+    def probe(self):
+        """Check every down replica, re-admitting those which respond."""
+        for replica in [r for r in self.replicas if not r.healthy]:
+            try:
+                r, c = self.probe_connection.request(replica.url + self.probe_path)
+            except (EnvironmentError, httplib.HTTPException):
+                continue
+            # Anything but a server error means Solr is up, even if it
+            # has no ping handler configured.
+            if r.status < 500:
+                with self.lock:
+                    replica.healthy = True
+                    replica.down_since = None
+
+    def probe_until_healthy(self):
+        while True:
+            time.sleep(self.probe_interval)
+            self.probe()
+            with self.lock:
+                if all(r.healthy for r in self.replicas):
+                    self.prober = None
+                    return
+
+    def stats(self):
+        with self.lock:
+            return [dict(url=r.url, healthy=r.healthy, outstanding=r.outstanding,
+                         requests=r.requests, failures=r.failures)
+                    for r in self.replicas]
@@ -0,0 +1,107 @@
+from __future__ import absolute_import
+
+import random
+import socket
+import threading
+import time
+
+from .schema import SolrError
+
+
+class CircuitOpenError(SolrError):
+    pass
+
+
+class CircuitBreaker(object):
+    """Fail fast when a Solr endpoint is overloaded or unreachable.
+
+    After failure_threshold consecutive failures, the circuit for that
+    endpoint opens and requests to it raise CircuitOpenError at once.
+    After reset_timeout seconds a single trial request is let through;
+    if it succeeds the circuit closes again, otherwise it stays open for
+    another reset_timeout.
+    """
+    clock = time.time
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be at least 1")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # endpoint -> [consecutive failures, time opened, trial in progress]
+        self.circuits = {}
+        self.lock = threading.Lock()
+
+    def before_request(self, endpoint):
+        with self.lock:
+            circuit = self.circuits.get(endpoint)
+            if circuit is None or circuit[1] is None:
+                return
+            if circuit[2] or self.clock() - circuit[1] < self.reset_timeout:
+                raise CircuitOpenError("Circuit open for %s after %s failures"
+                                       % (endpoint, circuit[0]))
+            circuit[2] = True
+
+    def record_success(self, endpoint):
+        with self.lock:
+            self.circuits.pop(endpoint, None)
+
+    def record_failure(self, endpoint):
+        with self.lock:
+            circuit = self.circuits.setdefault(endpoint, [0, None, False])
+            circuit[0] += 1
+            if circuit[2] or circuit[0] >= self.failure_threshold:
+                circuit[1] = self.clock()
+                circuit[2] = False
+
+    def is_open(self, endpoint):
+        with self.lock:
+            circuit = self.circuits.get(endpoint)
+            return circuit is not None and circuit[1] is not None
+
+
+class RetryPolicy(object):
+    """Decide whether, and after how long, a failed request is retried.
+
+    A request is attempted at most max_attempts times. It is retried if
+    it raises one of retry_errors, or if Solr answers with one of
+    retry_statuses. Before attempt n+1 we wait for
+    backoff * multiplier**(n-1) seconds, capped at max_backoff, of which
+    a random fraction of up to jitter is taken off, so that clients
+    which failed together don't all retry together.
+
+    If a CircuitBreaker is given, failures (including retry_statuses)
+    are reported to it, per Solr node.
+    """
+    def __init__(self, max_attempts=3, backoff=0.1, multiplier=2, max_backoff=10,
+                 jitter=0.5, retry_statuses=(503,), retry_errors=(socket.error,),
+                 circuit_breaker=None):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter must be between 0 and 1")
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_errors = tuple(retry_errors)
+        self.circuit_breaker = circuit_breaker
+
+    @classmethod
+    def from_retry_timeout(cls, retry_timeout):
+        """The policy given by the old retry_timeout option: retry once,
+        after retry_timeout seconds, on socket errors only - or never,
+        if retry_timeout is negative."""
+        if retry_timeout < 0:
+            return cls(max_attempts=1)
+        return cls(max_attempts=2, backoff=retry_timeout, jitter=0, retry_statuses=())
+
+    def delay(self, attempt):
+        """How long to wait after the attempt'th attempt has failed."""
+        delay = min(self.backoff * self.multiplier ** (attempt - 1), self.max_backoff)
+        return delay - random.uniform(0, delay * self.jitter)
+
+    def retry_status(self, status):
+        return status in self.retry_statuses
@@ -1,24 +1,43 @@
 from __future__ import absolute_import
 
+import collections
 import datetime
+import json
 import math
 import operator
-import uuid
-import warnings
-
-from lxml.builder import E
-import lxml.etree
+import re
+import threading
 
 from .dates import datetime_from_w3_datestring
+from .instrumentation import timing
 from .strings import RawString, SolrString, WildcardString
 
 try:
-    import pytz
+    # Either of these decodes JSON responses more quickly than json does.
+    from ujson import loads as json_loads
 except ImportError:
-    warnings.warn(
-        "pytz not found; cannot do timezone conversions for Solr DateFields",
-        ImportWarning)
-    pytz = None
+    try:
+        from simplejson import loads as json_loads
+    except ImportError:
+        json_loads = json.loads
+
+# lxml, pytz, uuid and the javabin codec are imported where they're
+# needed, rather than here, so that importing sunburnt stays quick, and
+# clients which don't use them never pay for them.
+
+
+class lazy_element(object):
+    """Makes tag elements, like lxml.builder.E.<tag>, but only imports
+    lxml when the first one is made."""
+    def __init__(self, tag):
+        self.tag = tag
+        self.maker = None
+
+    def __call__(self, *args, **kwargs):
+        if self.maker is None:
+            from lxml.builder import E
+            self.maker = getattr(E, self.tag)
+        return self.maker(*args, **kwargs)
 
 
 class SolrError(Exception):
@@ -48,10 +67,11 @@ class solr_date(object):
         # Python datetime objects may include timezone information
         if hasattr(dt_obj, 'tzinfo') and dt_obj.tzinfo:
             # but Solr requires UTC times.
-            if pytz:
-                return dt_obj.astimezone(pytz.utc).replace(tzinfo=None)
-            else:
+            try:
+                import pytz
+            except ImportError:
                 raise EnvironmentError("pytz not available, cannot do timezone conversions")
+            return dt_obj.astimezone(pytz.utc).replace(tzinfo=None)
         else:
             return dt_obj
 
@@ -140,6 +160,12 @@ class SolrField(object):
                 raise SolrError("Dynamic fields must have * at start or end of name (field %s)" % 
                         self.name)
 
+    def __reduce__(self):
+        # The classes SolrFieldTypeFactory makes don't exist until a
+        # schema using them has been read, so a schema unpickled in
+        # another process has to make them again.
+        return make_field, (getattr(type(self), 'type_args', type(self)), self.__dict__)
+
     def match(self, name):
         if self.dynamic:
             if self.wildcard_at_start:
@@ -212,6 +238,9 @@ class SolrBinaryField(SolrField):
         return unicode(value.encode('base64'))
 
     def from_solr(self, value):
+        # javabin responses hold the bytes themselves.
+        if isinstance(value, bytearray):
+            return str(value)
         return value.decode('base64')
 
 
@@ -273,9 +302,11 @@ class SolrRandomField(SolrField):
 
 class SolrUUIDField(SolrUnicodeField):
     def from_solr(self, v):
+        import uuid
         return uuid.UUID(v)
 
     def from_user_data(self, v):
+        import uuid
         if v == 'NEW':
             return v
         elif isinstance(v, uuid.UUID):
@@ -319,10 +350,19 @@ def SolrFieldTypeFactory(cls, name, **kwargs):
     # and its safe to put in globals(), because the class is
     # defined by the constituents of its name.
     if name not in globals():
-        globals()[name] = type(name, (cls,), atts)
+        globals()[name] = type(name, (cls,), dict(atts, type_args=(cls, kwargs)))
     return globals()[name]
 
 
+def make_field(field_type, state):
+    if isinstance(field_type, tuple):
+        cls, kwargs = field_type
+        field_type = SolrFieldTypeFactory(cls, None, **kwargs)
+    field = field_type.__new__(field_type)
+    field.__dict__.update(state)
+    return field
+
+
 class SolrFieldInstance(object):
     @classmethod
     def from_solr(cls, field, data):
@@ -365,6 +405,67 @@ class WildcardFieldInstance(SolrFieldInstance):
         return super(WildcardFieldInstance, cls).from_user_data(SolrWildcardField(), "*")
 
 
+class DynamicFieldIndex(object):
+    """Finds the dynamic field a name matches, as Solr does: the field
+    with the longest pattern wins, or, of those as long, the first in
+    the schema.
+
+    Prefix patterns (foo_*) are kept in a trie of their characters, and
+    suffix patterns (*_foo) in a trie of theirs reversed, so a lookup
+    walks the name once each way, however many patterns there are.
+    Names already looked up (up to memo_size of them) are remembered.
+    """
+    memo_size = 10000
+
+    def __init__(self, fields):
+        self.prefixes = {}
+        self.suffixes = {}
+        for order, field in enumerate(fields):
+            if field.wildcard_at_start:
+                trie, chars = self.suffixes, reversed(field.name[1:])
+            else:
+                trie, chars = self.prefixes, field.name[:-1]
+            node = trie
+            for char in chars:
+                node = node.setdefault(char, {})
+            # An earlier field with the same pattern wins.
+            node.setdefault(None, (-len(field.name), order, field))
+        self.memo = {}
+
+    def match(self, name):
+        try:
+            return self.memo[name]
+        except KeyError:
+            pass
+        candidates = [found for found in (self.longest(self.prefixes, name),
+                                          self.longest(self.suffixes, reversed(name)))
+                      if found is not None]
+        field = min(candidates)[2] if candidates else None
+        if len(self.memo) >= self.memo_size:
+            self.memo.clear()
+        self.memo[name] = field
+        return field
+
+    @staticmethod
+    def longest(trie, chars):
+        """The (-length, order, field) of the longest pattern in trie
+        which matches the start of chars, or None."""
+        node = trie
+        found = node.get(None)
+        for char in chars:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+    def __getstate__(self):
+        # The memo needn't be pickled along with a schema.
+        state = dict(self.__dict__)
+        state['memo'] = {}
+        return state
+
+
 class SolrSchema(object):
     solr_data_types = {
         'solr.StrField':SolrUnicodeField,
@@ -397,6 +498,7 @@ class SolrSchema(object):
         filename or file-like object."""
         self.fields, self.dynamic_fields, self.default_field_name, self.unique_key \
             = self.schema_parse(f)
+        self.dynamic_field_index = DynamicFieldIndex(self.dynamic_fields)
         self.default_field = self.fields[self.default_field_name] \
             if self.default_field_name else None
         self.unique_field = self.fields[self.unique_key] \
@@ -409,10 +511,13 @@ class SolrSchema(object):
         return q
 
     def schema_parse(self, f):
+        import lxml.etree
         try:
             schemadoc = lxml.etree.parse(f)
         except lxml.etree.XMLSyntaxError, e:
             raise SolrError("Invalid XML in schema:\n%s" % e.args[0])
+        # Kept so that the schema can be rebuilt in another process.
+        self.source = lxml.etree.tostring(schemadoc)
 
         field_type_classes = {}
         for field_type_node in schemadoc.xpath("/schema/types/fieldType|/schema/types/fieldtype"):
@@ -488,9 +593,7 @@ class SolrSchema(object):
             raise SolrError("Fields not defined in schema: %s" % list(undefined_field_names))
 
     def match_dynamic_field(self, name):
-        for field in self.dynamic_fields:
-            if field.match(name):
-                return field
+        return self.dynamic_field_index.match(name)
 
     def match_field(self, name):
         try:
@@ -505,14 +608,24 @@ class SolrSchema(object):
             raise SolrError("No such field '%s' in current schema" % k)
         return field.instance_from_user_data(v)
 
-    def make_update(self, docs):
-        return SolrUpdate(self, docs)
+    def make_update(self, docs, update_format='xml'):
+        return UPDATE_FORMATS[update_format](self, docs)
+
+    def make_update_fragment(self, doc, update_format='xml'):
+        return UPDATE_FORMATS[update_format](self).doc_fragment(doc)
 
     def make_delete(self, docs, query):
         return SolrDelete(self, docs, query)
 
-    def parse_response(self, msg):
-        return SolrResponse(self, msg)
+    def parse_response(self, msg, metrics=None, response_format='xml', lazy_docs=False,
+                       record_class=None):
+        return RESPONSE_FORMATS[response_format](self, msg, metrics, lazy_docs, record_class)
+
+    def parse_response_stream(self, f, constructor=dict):
+        return SolrResultStream(self, f, constructor)
+
+    def parse_export_stream(self, f, constructor=dict):
+        return SolrExportStream(self, f, constructor)
 
     def parse_result_doc(self, doc, name=None):
         if name is None:
@@ -529,15 +642,48 @@ class SolrSchema(object):
             raise SolrError("unexpected field found in result (field name: %s)" % name)
         return name, SolrFieldInstance.from_solr(field_class, doc.text or '').to_user_data()
 
+    def parse_json_result_doc(self, doc):
+        return dict((name, self.parse_result_value(name, value))
+                    for name, value in doc.iteritems())
+
+    def parse_result_value(self, name, value):
+        """Convert the value of a field in a result document, as Solr gave
+        it (a list of them, for a multivalued field), to Python."""
+        return convert_result_value(self.result_field(name), value)
+
+    def result_field(self, name):
+        field_class = self.match_field(name)
+        if field_class is None and name == "score":
+            field_class = SolrScoreField()
+        elif field_class is None:
+            raise SolrError("unexpected field found in result (field name: %s)" % name)
+        return field_class
+
+    def raw_result_doc(self, doc):
+        """The values of the fields of a <doc> node, as Solr wrote them,
+        ready for parse_result_value()."""
+        return dict(self.raw_result_items(doc))
+
+    def raw_result_items(self, doc):
+        """The names and values of the fields of a <doc> node, as
+        raw_result_doc() has them, without making a dict of them."""
+        for node in doc.iterchildren():
+            if node.tag in ('arr', 'lst'):
+                yield node.attrib['name'], [n.text or '' for n in node.iterchildren()]
+            else:
+                yield node.attrib['name'], node.text or ''
+
 
 class SolrUpdate(object):
-    ADD = E.add
-    DOC = E.doc
-    FIELD = E.field
+    ADD = lazy_element('add')
+    DOC = lazy_element('doc')
+    FIELD = lazy_element('field')
+    content_type = "text/xml; charset=utf-8"
 
-    def __init__(self, schema, docs):
+    def __init__(self, schema, docs=None):
         self.schema = schema
-        self.xml = self.add(docs)
+        if docs is not None:
+            self.xml = self.add(docs)
 
     def fields(self, name, values):
         # values may be multivalued - so we treat that as the default case
@@ -560,22 +706,85 @@ class SolrUpdate(object):
                                      for name, values in doc.items()]))
 
     def add(self, docs):
+        return self.ADD(*[self.doc(doc) for doc in self.dicts(docs)])
+
+    def dicts(self, docs):
         if hasattr(docs, "items") or not hasattr(docs, "__iter__"):
             # is a dictionary, or anything else except a list
             docs = [docs]
-        docs = [(doc if hasattr(doc, "items")
+        return [(doc if hasattr(doc, "items")
                  else object_to_dict(doc, self.schema))
                 for doc in docs]
-        return self.ADD(*[self.doc(doc) for doc in docs])
+
+    def doc_fragment(self, doc):
+        """Serialize a single document, as a <doc> element which can be
+        put together with others by join_fragments()."""
+        if not hasattr(doc, "items"):
+            doc = object_to_dict(doc, self.schema)
+        import lxml.etree
+        return lxml.etree.tostring(self.doc(doc), encoding='utf-8')
+
+    @staticmethod
+    def join_fragments(fragments):
+        return "<add>%s</add>" % "".join(fragments)
 
     def __str__(self):
+        import lxml.etree
         return lxml.etree.tostring(self.xml, encoding='utf-8')
 
 
+class SolrJSONUpdate(SolrUpdate):
+    """The same update as SolrUpdate, in Solr's JSON update format, for
+    posting to update/json. Values are converted exactly as they are
+    for XML, but no element tree is built along the way, which makes
+    this much quicker."""
+    content_type = "application/json; charset=utf-8"
+
+    def __init__(self, schema, docs=None):
+        self.schema = schema
+        if docs is not None:
+            self.docs = self.add(docs)
+
+    def doc(self, doc):
+        missing_fields = self.schema.missing_fields(doc.keys())
+        if missing_fields:
+            raise SolrError("These required fields are unspecified:\n %s" %
+                            missing_fields)
+        json_doc = {}
+        for name, values in doc.items():
+            field = self.schema.match_field(name)
+            if not field:
+                raise SolrError("No such field '%s' in current schema" % name)
+            # This is what SolrFieldInstance does, without the instances.
+            if hasattr(values, "__iter__"):
+                json_doc[name] = [field.to_solr(field.from_user_data(value))
+                                  for value in values]
+            else:
+                json_doc[name] = field.to_solr(field.from_user_data(values))
+        return json_doc
+
+    def add(self, docs):
+        return [self.doc(doc) for doc in self.dicts(docs)]
+
+    def doc_fragment(self, doc):
+        return json.dumps(self.doc(self.dicts(doc)[0]), separators=(',', ':'))
+
+    @staticmethod
+    def join_fragments(fragments):
+        return "[%s]" % ",".join(fragments)
+
+    def __str__(self):
+        return json.dumps(self.docs, separators=(',', ':'))
+
+
+# The classes which build updates in each format SolrInterface can send.
+UPDATE_FORMATS = {'xml': SolrUpdate, 'json': SolrJSONUpdate}
+
+
 class SolrDelete(object):
-    DELETE = E.delete
-    ID = E.id
-    QUERY = E.query
+    DELETE = lazy_element('delete')
+    ID = lazy_element('id')
+    QUERY = lazy_element('query')
     def __init__(self, schema, docs=None, queries=None):
         self.schema = schema
         deletions = []
@@ -625,6 +834,7 @@ class SolrDelete(object):
         return [self.QUERY(unicode(query)) for query in queries]
 
     def __str__(self):
+        import lxml.etree
         return lxml.etree.tostring(self.xml, encoding='utf-8')
 
 
@@ -642,26 +852,35 @@ class SolrFacetCounts(object):
 
 
 class SolrResponse(object):
-    def __init__(self, schema, xmlmsg):
+    # What to add to a query's parameters to get a response in this format.
+    request_params = []
+
+    def __init__(self, schema, xmlmsg, metrics=None, lazy_docs=False, record_class=None):
         self.schema = schema
         self.original_xml = xmlmsg
-        doc = lxml.etree.fromstring(xmlmsg)
-        details = dict(value_from_node(n) for n in
-                       doc.xpath("/response/lst[@name!='moreLikeThis']"))
+        import lxml.etree
+        with timing(metrics, 'parse'):
+            doc = lxml.etree.fromstring(xmlmsg)
+            details = dict(value_from_node(n) for n in
+                           doc.xpath("/response/lst[@name!='moreLikeThis']"))
         details['responseHeader'] = dict(details['responseHeader'])
         for attr in ["QTime", "params", "status"]:
             setattr(self, attr, details['responseHeader'].get(attr))
+        # Set if Solr ran out of timeAllowed before finding every match.
+        self.partialResults = details['responseHeader'].get('partialResults', False)
         if self.status != 0:
             raise ValueError("Response indicates an error")
-        result_node = doc.xpath("/response/result")[0]
-        self.result = SolrResult(schema, result_node)
+        with timing(metrics, 'convert'):
+            result_node = doc.xpath("/response/result")[0]
+            self.result = SolrResult(schema, result_node, lazy_docs, record_class)
         self.facet_counts = SolrFacetCounts.from_response(details)
         self.highlighting = dict((k, dict(v))
                                  for k, v in details.get("highlighting", ()))
-        more_like_these_nodes = \
-            doc.xpath("/response/lst[@name='moreLikeThis']/result")
-        more_like_these_results = [SolrResult(schema, node)
-                                  for node in more_like_these_nodes]
+        with timing(metrics, 'convert'):
+            more_like_these_nodes = \
+                doc.xpath("/response/lst[@name='moreLikeThis']/result")
+            more_like_these_results = [SolrResult(schema, node, lazy_docs, record_class)
+                                      for node in more_like_these_nodes]
         self.more_like_these = dict((n.name, n)
                                          for n in more_like_these_results)
         if len(self.more_like_these) == 1:
@@ -676,6 +895,9 @@ class SolrResponse(object):
         else:
             value = None
         self.interesting_terms = value
+        # Where to carry on from, if the query had a cursorMark.
+        cursor_marks = doc.xpath("/response/str[@name='nextCursorMark']/text()")
+        self.next_cursor_mark = cursor_marks[0] if cursor_marks else None
 
     def __str__(self):
         return str(self.result)
@@ -687,18 +909,516 @@ class SolrResponse(object):
         return self.result.docs[key]
 
 
+class SolrJSONResponse(SolrResponse):
+    """A SolrResponse parsed from Solr's JSON response format, as asked
+    for with wt=json and json.nl=arrarr (so that named lists, like facet
+    counts, keep their order)."""
+    request_params = [('json.nl', 'arrarr'), ('wt', 'json')]
+
+    def __init__(self, schema, msg, metrics=None, lazy_docs=False, record_class=None):
+        self.schema = schema
+        with timing(metrics, 'parse'):
+            details = dict(named_list(self.decode(msg)))
+        header = dict(named_list(details['responseHeader']))
+        self.QTime = header.get('QTime')
+        self.status = header.get('status')
+        self.params = named_list(header['params']) if 'params' in header else None
+        self.partialResults = header.get('partialResults', False)
+        if self.status != 0:
+            raise ValueError("Response indicates an error")
+        with timing(metrics, 'convert'):
+            # The MoreLikeThis handler may also return the document it
+            # matched, but the similar ones are what's wanted.
+            name = 'response' if 'response' in details else 'match'
+            self.result = SolrJSONResult(schema, name, details[name], lazy_docs, record_class)
+        facet_counts = {}
+        for k, v in named_list(details.get('facet_counts', ())):
+            if k == 'facet_queries':
+                facet_counts[k] = named_list(v)
+            elif k == 'facet_fields':
+                facet_counts[k] = [(field, named_list(counts))
+                                   for field, counts in named_list(v)]
+            elif k == 'facet_dates':
+                # Besides the counts, each holds the start and end dates.
+                facet_counts[k] = [(field, [(name, solr_date(value) if name in ('start', 'end')
+                                             else value)
+                                            for name, value in named_list(counts)])
+                                   for field, counts in named_list(v)]
+        self.facet_counts = SolrFacetCounts(**facet_counts)
+        self.highlighting = dict((k, dict(named_list(v)))
+                                 for k, v in named_list(details.get("highlighting", ())))
+        with timing(metrics, 'convert'):
+            self.more_like_these = dict((k, SolrJSONResult(schema, k, v, lazy_docs, record_class))
+                                        for k, v in named_list(details.get('moreLikeThis', ())))
+        if len(self.more_like_these) == 1:
+            self.more_like_this = self.more_like_these.values()[0]
+        else:
+            self.more_like_this = None
+        # can be computed by MoreLikeThisHandler
+        if 'interestingTerms' in details:
+            self.interesting_terms = [tuple(term) if isinstance(term, list) else term
+                                      for term in details['interestingTerms']]
+        else:
+            self.interesting_terms = None
+        self.next_cursor_mark = details.get('nextCursorMark')
+
+    def decode(self, msg):
+        self.original_json = msg
+        return json_loads(msg)
+
+
+class SolrJavabinResponse(SolrJSONResponse):
+    """A SolrResponse parsed from Solr's binary javabin format, as asked
+    for with wt=javabin. This decodes to much the same structure as JSON
+    does, though with numbers, dates and so on already typed."""
+    request_params = [('wt', 'javabin')]
+
+    def decode(self, msg):
+        self.original_javabin = msg
+        from . import javabin
+        return javabin.loads(msg)
+
+
 class SolrResult(object):
-    def __init__(self, schema, node):
+    def __init__(self, schema, node, lazy_docs=False, record_class=None):
         self.schema = schema
         self.name = node.attrib['name']
         self.numFound = int(node.attrib['numFound'])
         self.start = int(node.attrib['start'])
-        self.docs = [schema.parse_result_doc(n) for n in node.xpath("doc")]
+        if record_class is not None:
+            self.docs = record_class.from_result_docs(schema, node.xpath("doc"))
+        elif lazy_docs:
+            self.docs = [LazyDocument(schema, schema.raw_result_doc(n)) for n in node.xpath("doc")]
+        else:
+            self.docs = [schema.parse_result_doc(n) for n in node.xpath("doc")]
 
     def __str__(self):
         return "%(numFound)s results found, starting at #%(start)s\n\n" % self.__dict__ + str(self.docs)
 
 
+class SolrJSONResult(SolrResult):
+    def __init__(self, schema, name, result, lazy_docs=False, record_class=None):
+        self.schema = schema
+        self.name = name
+        self.numFound = int(result['numFound'])
+        self.start = int(result['start'])
+        if record_class is not None:
+            self.docs = record_class.from_result_docs(schema, result['docs'])
+        elif lazy_docs:
+            self.docs = [LazyDocument(schema, doc) for doc in result['docs']]
+        else:
+            self.docs = [schema.parse_json_result_doc(doc) for doc in result['docs']]
+
+
+class LazyDocument(collections.MutableMapping):
+    """A result document which keeps the values of its fields as Solr
+    gave them, and only converts each one the first time it is looked
+    up, so that fields which are never read cost next to nothing.
+
+    It can be used like a dict, but isn't one; dict(doc) converts every
+    field, and gives a real dict (for json.dumps(), say).
+    """
+    def __init__(self, schema, raw, values=None):
+        self.schema = schema
+        self.raw = raw
+        self.values = {} if values is None else values
+
+    def __getitem__(self, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            value = self.values[name] = self.schema.parse_result_value(name, self.raw[name])
+            return value
+
+    def __setitem__(self, name, value):
+        self.values[name] = value
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self.raw.pop(name, None)
+        self.values.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self.raw or name in self.values
+
+    def __iter__(self):
+        for name in self.raw:
+            yield name
+        for name in self.values:
+            if name not in self.raw:
+                yield name
+
+    def __len__(self):
+        return len(self.raw) + sum(1 for name in self.values if name not in self.raw)
+
+    def copy(self):
+        return LazyDocument(self.schema, dict(self.raw), dict(self.values))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class SolrRecord(tuple):
+    """A result document as a tuple of the values of a fixed list of
+    fields, in the order of _fields, with None for any field the
+    document doesn't have. This takes much less memory than a dict.
+
+    Records behave like namedtuples, and can be looked up by field
+    name too: record.int_field (if the name is an identifier),
+    record['int_field'] and record.get('int_field') all work.
+    Subclasses, one for each list of fields, are made by record_class().
+    If the class is for the fields of the schema, rather than a field
+    limit, dynamic fields in the results are added to them.
+    """
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+    _dynamic = False
+
+    def __new__(cls, values):
+        return tuple.__new__(cls, values)
+
+    @classmethod
+    def from_result_docs(cls, schema, docs):
+        """Convert result documents - <doc> nodes, or dicts decoded from
+        JSON or javabin - straight into records. Anything else results
+        can be made into (see SolrSearch.record_class()) has a
+        from_result_docs() like this one."""
+        if cls._dynamic:
+            cls = cls.with_dynamic_fields(docs)
+        fields = cls._fields
+        index = cls._index
+        field_classes = [schema.result_field(name) for name in fields]
+        records = []
+        for doc in docs:
+            values = [None] * len(fields)
+            if hasattr(doc, 'iteritems'):
+                items = doc.iteritems()
+            else:
+                items = schema.raw_result_items(doc)
+            for name, value in items:
+                try:
+                    i = index[name]
+                except KeyError:
+                    raise SolrError("unexpected field found in result (field name: %s)" % name)
+                values[i] = convert_result_value(field_classes[i], value)
+            records.append(cls(values))
+        return records
+
+    @classmethod
+    def with_dynamic_fields(cls, docs):
+        """The record class for cls's fields and any others the docs
+        have, which must be dynamic fields."""
+        names = set()
+        for doc in docs:
+            if hasattr(doc, 'iteritems'):
+                names.update(doc)
+            else:
+                names.update(node.attrib['name'] for node in doc.iterchildren())
+        names.difference_update(cls._index)
+        fields = [name for name in cls._fields if name != 'score']
+        fields = sorted(fields + list(names))
+        if 'score' in cls._index:
+            fields.append('score')
+        return record_class(fields)
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, name, default=None):
+        value = self[name] if name in self._index else None
+        return default if value is None else value
+
+    def _asdict(self):
+        """The fields which have values, as a dict."""
+        return dict((name, value) for name, value in zip(self._fields, self)
+                    if value is not None)
+
+    def copy(self):
+        # Records can't be changed, so needn't be copied.
+        return self
+
+    def __reduce__(self):
+        return make_record, (self._fields, tuple(self))
+
+    def __repr__(self):
+        return "SolrRecord(%s)" % ", ".join("%s=%r" % item
+                                            for item in zip(self._fields, self))
+
+
+# Record classes made so far, by their fields, least recently used
+# first. Results with dynamic fields can have any number of different
+# lists of fields, so only the last max_record_classes are kept.
+record_classes = collections.OrderedDict()
+record_classes_lock = threading.Lock()
+max_record_classes = 1000
+
+def record_class(fields, dynamic=False):
+    """The SolrRecord class for results with these fields - and, if
+    dynamic is True, any dynamic fields found in them."""
+    fields = tuple(fields)
+    key = fields, dynamic
+    with record_classes_lock:
+        try:
+            cls = record_classes[key] = record_classes.pop(key)
+            return cls
+        except KeyError:
+            pass
+    attrs = {'__slots__': (), '_fields': fields, '_dynamic': dynamic,
+             '_index': dict((name, i) for i, name in enumerate(fields))}
+    for i, name in enumerate(fields):
+        if re.match(r'^[a-zA-Z_]\w*$', name) and not hasattr(SolrRecord, name):
+            attrs[str(name)] = property(operator.itemgetter(i))
+    cls = type('SolrRecord', (SolrRecord,), attrs)
+    with record_classes_lock:
+        # Another thread may have made one in the meantime.
+        cls = record_classes.setdefault(key, cls)
+        while len(record_classes) > max_record_classes:
+            record_classes.popitem(last=False)
+    return cls
+
+def make_record(fields, values):
+    return record_class(fields)(values)
+
+
+def convert_result_value(field_class, value):
+    # This is what SolrFieldInstance does, without the instances.
+    if isinstance(value, list):
+        return tuple(field_class.to_user_data(field_class.from_solr(v)) for v in value)
+    return field_class.to_user_data(field_class.from_solr(value))
+
+
+# The classes which parse responses in each format SolrInterface can ask for.
+RESPONSE_FORMATS = {'xml': SolrResponse, 'json': SolrJSONResponse,
+                    'javabin': SolrJavabinResponse}
+
+
+class SolrResultStream(object):
+    """The main result of a query, parsed incrementally from a file-like
+    object as it is iterated over. Each document is converted and then
+    thrown away, so memory use doesn't grow with the number of rows.
+
+    name, numFound and start are available straight away; iterating
+    yields each document (passed through constructor, if that isn't
+    dict) and closes the file once the response has been read.
+    """
+    def __init__(self, schema, f, constructor=dict):
+        self.schema = schema
+        self.f = f
+        self.constructor = constructor
+        self.name = self.numFound = self.start = None
+        self.QTime = self.status = None
+        self.partialResults = False
+        self.docs = self.parse()
+        try:
+            # Read as far as the start of the result.
+            self.docs.next()
+        except StopIteration:
+            pass
+
+    def parse(self):
+        import lxml.etree
+        depth = 0
+        in_result = False
+        try:
+            for event, node in lxml.etree.iterparse(self.f, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if depth == 2 and node.tag == 'result':
+                        self.name = node.attrib['name']
+                        self.numFound = int(node.attrib['numFound'])
+                        self.start = int(node.attrib['start'])
+                        in_result = True
+                        yield None
+                    continue
+                depth -= 1
+                if in_result and depth == 2 and node.tag == 'doc':
+                    doc = self.schema.parse_result_doc(node)
+                    self.discard(node)
+                    if self.constructor is not dict:
+                        doc = self.constructor(**doc)
+                    yield doc
+                elif depth == 1:
+                    if node.tag == 'result':
+                        in_result = False
+                    elif node.attrib.get('name') == 'responseHeader':
+                        header = dict(value_from_node(node)[1])
+                        self.QTime = header.get('QTime')
+                        self.status = header.get('status')
+                        self.partialResults = header.get('partialResults', False)
+                        if self.status != 0:
+                            raise ValueError("Response indicates an error")
+                    self.discard(node)
+        except lxml.etree.XMLSyntaxError, e:
+            raise SolrError("Invalid XML in response:\n%s" % e.args[0])
+        finally:
+            self.close()
+
+    @staticmethod
+    def discard(node):
+        node.clear()
+        while node.getprevious() is not None:
+            del node.getparent()[0]
+
+    def close(self):
+        self.f.close()
+
+    def __iter__(self):
+        return self.docs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Closing the generator closes the file, via parse()'s finally.
+        self.docs.close()
+
+
+class SolrExportStream(object):
+    """The documents of a response from Solr's /export handler, which
+    always responds in JSON, decoded incrementally from a file-like
+    object as they are iterated over. Each document is decoded once all
+    of it has been read, and what has been decoded is then thrown away,
+    so memory use depends on the size of a document, not on how many
+    there are.
+
+    numFound and status are available straight away; iterating yields
+    each document (passed through constructor, if that isn't dict) and
+    closes the file once the response has been read.
+    """
+    read_size = 65536
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, schema, f, constructor=dict):
+        self.schema = schema
+        self.f = f
+        self.constructor = constructor
+        self.numFound = self.status = None
+        self.buf = ""
+        self.pos = 0
+        self.docs = self.parse()
+        try:
+            # Read as far as the start of the documents.
+            self.docs.next()
+        except StopIteration:
+            pass
+
+    def parse(self):
+        try:
+            self.expect('{')
+            for key in self.keys():
+                if key == 'responseHeader':
+                    self.status = self.value().get('status')
+                    if self.status != 0:
+                        raise ValueError("Response indicates an error")
+                elif key == 'response':
+                    self.expect('{')
+                    for key in self.keys():
+                        if key == 'numFound':
+                            self.numFound = self.value()
+                        elif key == 'docs':
+                            yield None
+                            for doc in self.parse_docs():
+                                yield doc
+                        else:
+                            self.value()
+                else:
+                    self.value()
+        finally:
+            self.close()
+
+    def parse_docs(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            doc = self.value()
+            # An error part way through is reported in place of a document.
+            if 'EXCEPTION' in doc:
+                raise SolrError("Error in export response: %s" % doc['EXCEPTION'])
+            doc = self.schema.parse_json_result_doc(doc)
+            if self.constructor is not dict:
+                doc = self.constructor(**doc)
+            yield doc
+            if self.expect(',]') == ']':
+                return
+
+    def keys(self):
+        """Yield the keys of an object whose opening brace has been read;
+        each value must be read before asking for the next key."""
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError, e:
+                # Most likely, the value hasn't all been read yet.
+                if not self.fill():
+                    raise SolrError("Invalid JSON in export response: %s" % e)
+                continue
+            # A number at the end of what's been read may go on further.
+            if end == len(self.buf) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise SolrError("Invalid JSON in export response: expected %s, got %r"
+                            % (" or ".join(chars), c))
+        self.pos += 1
+        return c
+
+    def peek(self):
+        """The next character, after any whitespace ('' at the end)."""
+        while True:
+            self.pos = self.whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def fill(self):
+        """Read some more of the response, dropping what has already been
+        decoded; return False if there is no more."""
+        data = self.f.read(self.read_size)
+        if not data:
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def close(self):
+        self.f.close()
+
+    def __iter__(self):
+        return self.docs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Closing the generator closes the file, via parse()'s finally.
+        self.docs.close()
+
+
 def object_to_dict(o, names):
     return dict((name, getattr(o, name)) for name in names
                  if (hasattr(o, name) and getattr(o, name) is not None))
@@ -748,6 +1468,14 @@ def get_attribute_or_callable(o, name):
         a = None
     return a
 
+def named_list(value):
+    """Turn a named list from a JSON response (an object, or, with
+    json.nl=arrarr, a list of [name, value] lists) into a list of
+    (name, value) pairs, as value_from_node() does for XML."""
+    if hasattr(value, "items"):
+        return value.items()
+    return [tuple(pair) for pair in value]
+
 def value_from_node(node):
     name = node.attrib.get('name')
     if node.tag in ('lst', 'arr'):
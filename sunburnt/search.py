@@ -2,7 +2,9 @@ from __future__ import absolute_import
 
 import collections, copy, operator, re
 
-from .schema import SolrError, SolrBooleanField, SolrUnicodeField, WildcardFieldInstance
+from .instrumentation import reporting, timing
+from .schema import SolrError, SolrBooleanField, SolrUnicodeField, WildcardFieldInstance, \
+    record_class
 
 
 class LuceneQuery(object):
@@ -365,6 +367,8 @@ class BaseSearch(object):
                       'sorter', 'facet_querier', 'field_limiter',)
 
     result_constructor = dict
+    as_records = False
+    as_columns = False
 
     def _init_common_modules(self):
         self.query_obj = LuceneQuery(self.schema, u'q')
@@ -484,8 +488,73 @@ class BaseSearch(object):
         newself.result_constructor = constructor
         return newself
 
-    def transform_result(self, result, constructor):
+    def results_as_records(self):
+        """Return results as SolrRecords, which take much less memory than
+        dicts; their fields are those given to field_limit() or, failing
+        that, all the fields in the schema (and the score, if asked for).
+        Each document is converted straight into a record."""
+        newself = self.clone()
+        newself.as_records = True
+        newself.as_columns = False
+        return newself
+
+    def results_as_columns(self):
+        """Return results as SolrColumns: a dict of each field to an array
+        of its values for every document, decoded straight from the
+        response, with NumPy dtypes for numeric, date and boolean fields.
+        NumPy must be installed. Like records, columns can't be made by
+        a constructor or have highlighting added."""
+        newself = self.clone()
+        newself.as_columns = True
+        newself.as_records = False
+        return newself
+
+    def record_class(self):
+        """The class results should be made into, if any - a SolrRecord
+        class, or SolrColumns. Either has a from_result_docs()."""
+        if self.as_columns:
+            from .columnar import SolrColumns
+            return SolrColumns
+        if not self.as_records:
+            return None
+        limiter = self.field_limiter
+        if limiter.fields and not limiter.all_fields:
+            fields = sorted(limiter.fields - set(['score']))
+            dynamic = False
+        else:
+            # Which dynamic fields there are is only known from the results.
+            fields = sorted(self.schema.fields)
+            dynamic = bool(self.schema.dynamic_fields)
+        if limiter.score:
+            fields.append('score')
+        return record_class(fields, dynamic)
+
+    def parsed_results_as(self):
+        """The results_as_*() method in effect, if results are made as
+        the response is parsed, rather than from dicts afterwards."""
+        if self.as_records:
+            return 'results_as_records()'
+        if self.as_columns:
+            return 'results_as_columns()'
+
+    def check_constructor(self, constructor):
+        """Results made as the response is parsed can't be made by a
+        constructor, nor have highlighting added to them."""
+        results_as = self.parsed_results_as()
+        if results_as is None:
+            return
         if constructor is not dict:
+            raise ValueError("%s can't be used with a constructor" % results_as)
+        if self.highlighter.options():
+            raise ValueError("%s can't be used with highlight(); the highlighting "
+                             "is in response.highlighting without it" % results_as)
+
+    def transform_result(self, result, constructor):
+        if self.as_records or self.as_columns:
+            # Records and columns are made as the response is parsed, and
+            # check_constructor() has refused anything to add to them.
+            pass
+        elif constructor is not dict:
             result.result.docs = [constructor(**d) for d in result.result.docs]
             # in future, highlighting chould be made available to
             # custom constructors; perhaps document additional
@@ -606,6 +675,8 @@ class SolrSearch(BaseSearch):
             for opt in self.option_modules:
                 setattr(self, opt, getattr(original, opt).clone())
             self.result_constructor = original.result_constructor
+            self.as_records = original.as_records
+            self.as_columns = original.as_columns
 
     def options(self):
         options = super(SolrSearch, self).options()
@@ -613,11 +684,118 @@ class SolrSearch(BaseSearch):
             options['q'] = '*:*' # search everything
         return options
 
-    def execute(self, constructor=None):
+    def execute(self, constructor=None, timeout=None):
+        if constructor is None:
+            constructor = self.result_constructor
+        self.check_constructor(constructor)
+        with reporting(self.interface.new_metrics('select')) as metrics:
+            with timing(metrics, 'build'):
+                options = self.options()
+            result = self.interface.search(timeout=timeout, metrics=metrics,
+                                           record_class=self.record_class(), **options)
+            with timing(metrics, 'convert'):
+                return self.transform_result(result, constructor)
+
+    def stream(self, constructor=None, timeout=None):
+        """Execute the query, returning a SolrResultStream which parses the
+        response incrementally, and yields documents one at a time.
+        Highlighting and facets are not available this way, nor are
+        records or columns."""
+        if constructor is None:
+            constructor = self.result_constructor
+        results_as = self.parsed_results_as()
+        if results_as is not None:
+            raise ValueError("stream() can't be used with %s; use execute() or iter_cursor()"
+                             % results_as)
+        return self.interface.search_stream(constructor=constructor, timeout=timeout,
+                                            **self.options())
+
+    def export(self, fields=None, sort=None, constructor=None, timeout=None):
+        """Stream every result of the query from Solr's /export handler,
+        returning a SolrExportStream which decodes the response as it
+        arrives and yields documents one at a time.
+
+        fields are the fields to return, which must all have docValues;
+        they default to those given to field_limit(). sort is a field
+        name, or a list of them, as for sort_by(); by default, the
+        query's sort is used, or failing that the unique key. Only the
+        query and filters are used; pagination, facets and the like
+        don't apply to an export, and it can't make records or columns.
+        """
+        if constructor is None:
+            constructor = self.result_constructor
+        results_as = self.parsed_results_as()
+        if results_as is not None:
+            raise ValueError("export() can't be used with %s" % results_as)
+        if fields is None:
+            fields = self.field_limiter.fields
+        elif isinstance(fields, basestring):
+            fields = [fields]
+        if not fields:
+            raise SolrError("An export needs the fields to return")
+        self.schema.check_fields(fields)
+        if sort is not None:
+            sorter = SortOptions(self.schema)
+            for field in [sort] if isinstance(sort, basestring) else sort:
+                sorter.update(field)
+        elif self.sorter.fields:
+            sorter = self.sorter
+        elif self.schema.unique_key is not None:
+            sorter = SortOptions(self.schema)
+            sorter.update(self.schema.unique_key)
+        else:
+            raise SolrError("An export needs a sort, and there's no uniqueKey to sort by")
+        options = {'q': '*:*'}
+        options.update(self.query_obj.options())
+        options.update(self.filter_obj.options())
+        options.update(sorter.options())
+        options['fl'] = ','.join(sorted(fields))
+        return self.interface.export_stream(constructor=constructor, timeout=timeout,
+                                            **options)
+
+    def iter_cursor(self, page_size=100, constructor=None, timeout=None):
+        """Yield every result of the query, fetching page_size at a time
+        with Solr's cursorMark, which (unlike start) costs as much for
+        the last page as for the first. The sort must include the
+        schema's unique key, to give the results a fixed order. If the
+        query has been paginated, only its first rows results are
+        yielded; it can't have a start. timeout applies to each page.
+        """
         if constructor is None:
             constructor = self.result_constructor
-        result = self.interface.search(**self.options())
-        return self.transform_result(result, constructor)
+        self.check_constructor(constructor)
+        unique_key = self.schema.unique_key
+        if unique_key is None:
+            raise SolrError("Can't use a cursor without a uniqueKey in the schema")
+        if unique_key not in [field for order, field in self.sorter.fields]:
+            raise SolrError("Can't use a cursor unless the results are sorted by %s" % unique_key)
+        if self.paginator.start:
+            raise SolrError("Can't use a cursor with a start; it always starts at the beginning")
+        if page_size < 1:
+            raise SolrError("page_size must be at least 1")
+        if self.as_columns:
+            raise SolrError("Can't use a cursor with results_as_columns(); execute() each page")
+        left = self.paginator.rows
+        cursor_mark = "*"
+        while left is None or left > 0:
+            rows = page_size if left is None else min(page_size, left)
+            with reporting(self.interface.new_metrics('select')) as metrics:
+                with timing(metrics, 'build'):
+                    options = self.options()
+                    options.pop('start', None)
+                    options.update(rows=rows, cursorMark=cursor_mark)
+                result = self.interface.search(timeout=timeout, metrics=metrics,
+                                               record_class=self.record_class(), **options)
+                with timing(metrics, 'convert'):
+                    docs = self.transform_result(result, constructor).result.docs
+            for doc in docs:
+                yield doc
+            if left is not None:
+                left -= len(docs)
+            # Solr gives back the same mark once there are no more results.
+            if not docs or result.next_cursor_mark in (None, cursor_mark):
+                break
+            cursor_mark = result.next_cursor_mark
 
 
 class MltSolrSearch(BaseSearch):
@@ -647,6 +825,8 @@ class MltSolrSearch(BaseSearch):
             self.url = original.url
             for opt in self.option_modules:
                 setattr(self, opt, getattr(original, opt).clone())
+            self.as_records = original.as_records
+            self.as_columns = original.as_columns
 
     def query(self, *args, **kwargs):
         if self.content is not None or self.url is not None:
@@ -684,9 +864,16 @@ class MltSolrSearch(BaseSearch):
             options['stream.url'] = self.url
         return options
 
-    def execute(self, constructor=dict):
-        result = self.interface.mlt_search(content=self.content, **self.options())
-        return self.transform_result(result, constructor)
+    def execute(self, constructor=dict, timeout=None):
+        self.check_constructor(constructor)
+        with reporting(self.interface.new_metrics('mlt')) as metrics:
+            with timing(metrics, 'build'):
+                options = self.options()
+            result = self.interface.mlt_search(content=self.content, timeout=timeout,
+                                               metrics=metrics,
+                                               record_class=self.record_class(), **options)
+            with timing(metrics, 'convert'):
+                return self.transform_result(result, constructor)
 
 
 class Options(object):
@@ -988,7 +1175,7 @@ class FieldLimitOptions(Options):
         if self.all_fields:
             fields = set("*")
         else:
-            fields = self.fields
+            fields = set(self.fields)
         if self.score:
             fields.add("score")
         if fields:
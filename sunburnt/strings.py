@@ -24,8 +24,15 @@ class RawString(SolrString):
 
 
 class WildcardString(SolrString):
-    def __init__(self, s):
-        self.chars = self.get_wildcards(s)
+    # Wildcards only matter when the string is used in a query, so they
+    # aren't looked for until then; most strings are only ever indexed.
+    @property
+    def chars(self):
+        try:
+            return self._chars
+        except AttributeError:
+            self._chars = self.get_wildcards(self)
+            return self._chars
 
     class SpecialChar(object):
         def __unicode__(self):
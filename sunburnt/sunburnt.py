@@ -4,67 +4,277 @@ import cgi
 import cStringIO as StringIO
 from itertools import islice
 import logging
-import socket, time, urllib, urlparse
+import socket, threading, time, urllib, urlparse
 import warnings
 
 
-from .schema import SolrSchema, SolrError
+from .cache import conditional_headers, schema_validators
+from .instrumentation import RequestMetrics, reporting, timing
+from .replicas import ReplicaSet
+from .retry import CircuitOpenError, RetryPolicy
+from .schema import RESPONSE_FORMATS, UPDATE_FORMATS, SolrSchema, SolrError
 from .search import LuceneQuery, MltSolrSearch, SolrSearch, params_from_dict
+from .transport import ResponseStream, TransferStats, decode_content, gzip_encode
+from .workers import WorkerPool
 
 MAX_LENGTH_GET_URL = 2048
 # Jetty default is 4096; Tomcat default is 8192; picking 2048 to be conservative.
 
+logger = logging.getLogger(__name__)
+
 class SolrConnection(object):
-    def __init__(self, url, http_connection, retry_timeout, max_length_get_url):
+    def __init__(self, url, http_connection, retry_timeout, max_length_get_url, retry_policy=None,
+                 compress_responses=False, compress_updates=False):
+        # url may also be a list of replica URLs, or a ReplicaSet.
+        if isinstance(url, basestring):
+            self.replicas = None
+        else:
+            if not isinstance(url, ReplicaSet):
+                url = ReplicaSet(url)
+            self.replicas = url
+            url = self.replicas.urls[0]
         if http_connection:
             self.http_connection = http_connection
         else:
-            import httplib2
-            self.http_connection = httplib2.Http()
+            self.http_connection = self.default_http_connection()
         self.url = url.rstrip("/") + "/"
         self.update_url = self.url + "update/"
+        self.json_update_url = self.url + "update/json"
+        self.csv_update_url = self.url + "update/csv"
         self.select_url = self.url + "select/"
         self.mlt_url = self.url + "mlt/"
+        self.export_url = self.url + "export"
         self.retry_timeout = retry_timeout
+        if retry_policy is None:
+            retry_policy = RetryPolicy.from_retry_timeout(retry_timeout)
+        self.retry_policy = retry_policy
         self.max_length_get_url = max_length_get_url
+        self.compress_responses = compress_responses
+        self.compress_updates = compress_updates
+        self.transfer_stats = TransferStats()
+        self.listeners = []
 
-    def request(self, *args, **kwargs):
-        try:
-            return self.http_connection.request(*args, **kwargs)
-        except socket.error:
-            if self.retry_timeout < 0:
-                raise
-            time.sleep(self.retry_timeout)
-            return self.http_connection.request(*args, **kwargs)
+    def default_http_connection(self):
+        import httplib2
+        return httplib2.Http()
+
+    def request(self, uri, method="GET", body=None, headers=None, compress=False, stream=False,
+                timeout=None, metrics=None):
+        """Make a request, retrying according to the retry policy.
+
+        If stream is True, the body of the response is returned as a
+        ResponseStream to be read incrementally, rather than as a string;
+        it should be closed once it has been read.
+
+        If timeout is given, the request (including any retries) must be
+        over within that many seconds, or socket.timeout is raised.
 
-    def commit(self, waitSearcher=None, expungeDeletes=None, softCommit=None):
+        metrics is the RequestMetrics to record the request in, if the
+        caller is timing it; otherwise, if there are any listeners, the
+        request is recorded and reported to them by itself.
+        """
+        own_metrics = metrics is None
+        if own_metrics:
+            metrics = self.new_metrics(self.handler_for(uri))
+        request_bytes = len(body) if body else 0
+        body, headers = self.encode_request(body, headers, compress)
+        request_wire_bytes = len(body) if body else 0
+        if metrics is not None:
+            metrics.method, metrics.url = method, uri
+            metrics.request_bytes, metrics.request_wire_bytes = request_bytes, request_wire_bytes
+
+        def record(response_bytes, response_wire_bytes):
+            self.transfer_stats.record(request_bytes, request_wire_bytes,
+                                       response_bytes, response_wire_bytes)
+            if metrics is not None:
+                metrics.response_bytes = response_bytes
+                metrics.response_wire_bytes = response_wire_bytes
+                if own_metrics:
+                    metrics.finish()
+        try:
+            with timing(metrics, 'http'):
+                r, c = self.retry(uri, method, body, headers, stream, timeout, metrics)
+            if stream:
+                return r, ResponseStream(c, self.response_encoding(r),
+                                         on_close=lambda s: record(s.bytes, s.wire_bytes))
+            response_wire_bytes = len(c)
+            c = decode_content(c, self.response_encoding(r))
+        except Exception, e:
+            if own_metrics and metrics is not None:
+                metrics.finish(e)
+            raise
+        record(len(c), response_wire_bytes)
+        return r, c
+
+    def retry(self, uri, method, body, headers, stream, timeout, metrics=None):
+        """Send a request until it succeeds, or the retry policy gives up."""
+        policy = self.retry_policy
+        deadline = None if timeout is None else time.time() + timeout
+        attempt = 1
+        while True:
+            if metrics is not None:
+                metrics.attempts = attempt
+            delay = policy.delay(attempt)
+            try:
+                r, c = self.dispatch(uri, deadline, method=method, body=body, headers=headers,
+                                     stream=stream)
+            except policy.retry_errors:
+                if not self.should_retry(attempt, delay, deadline):
+                    raise
+            else:
+                if not policy.retry_status(r.status) \
+                        or not self.should_retry(attempt, delay, deadline):
+                    break
+                if stream:
+                    c.close()
+            time.sleep(delay)
+            attempt += 1
+        if metrics is not None:
+            metrics.status = r.status
+        return r, c
+
+    def should_retry(self, attempt, delay, deadline):
+        # Don't bother retrying if we'd run out of time while waiting.
+        return attempt < self.retry_policy.max_attempts and \
+            (deadline is None or time.time() + delay < deadline)
+
+    def new_metrics(self, handler=None):
+        """A RequestMetrics to record a request in, or None if there is no
+        one listening."""
+        if self.listeners:
+            return RequestMetrics(list(self.listeners), handler)
+
+    def handler_for(self, uri):
+        for handler in ('select', 'mlt', 'update', 'export'):
+            if uri.startswith(getattr(self, handler + '_url')):
+                return handler
+
+    def encode_request(self, body, headers, compress=False):
+        """Compress the body (if asked to, and compression of updates is
+        on), and ask for a compressed response (if that's on)."""
+        headers = dict(headers or {})
+        if compress and self.compress_updates and body:
+            body = gzip_encode(body)
+            headers["Content-Encoding"] = "gzip"
+        if self.compress_responses:
+            headers["Accept-Encoding"] = "gzip, deflate"
+        return body, headers
+
+    def response_encoding(self, r):
+        # httplib2 decompresses responses itself, but other transports don't.
+        return r.get('content-encoding') if hasattr(r, 'get') else None
+
+    def dispatch(self, uri, deadline=None, **kwargs):
+        """Send a request to one of the replicas, failing over to the
+        others if it can't be reached. Each attempt is given whatever is
+        left of the time until deadline."""
+        if self.replicas is None or not uri.startswith(self.url):
+            return self.send(self.url, uri, timeout=time_left(deadline), **kwargs)
+        path = uri[len(self.url):]
+        tried = []
+        while True:
+            timeout = time_left(deadline)
+            replica = self.replicas.choose(exclude=tried)
+            if replica is None:
+                raise error
+            try:
+                response = self.send(replica.url, replica.url + path, timeout=timeout, **kwargs)
+            except CircuitOpenError, error:
+                self.replicas.release(replica)
+                tried.append(replica)
+                continue
+            except socket.error, error:
+                if isinstance(error, socket.timeout) and deadline is not None \
+                        and time.time() >= deadline:
+                    # The caller's time ran out, which says nothing
+                    # about the replica; nor is there time for another.
+                    self.replicas.release(replica)
+                    raise
+                self.replicas.release(replica, failed=True)
+                tried.append(replica)
+                continue
+            self.replicas.release(replica)
+            return response
+
+    def send(self, endpoint, uri, *args, **kwargs):
+        """Make a single request to the Solr node at endpoint, keeping its
+        circuit breaker (if there is one) up to date."""
+        breaker = self.retry_policy.circuit_breaker
+        if breaker is None:
+            return self.http_request(uri, *args, **kwargs)
+        breaker.before_request(endpoint)
+        try:
+            response = self.http_request(uri, *args, **kwargs)
+        except Exception:
+            # Any error, not just those worth retrying, must be reported,
+            # or a trial request which failed would hold the circuit open.
+            breaker.record_failure(endpoint)
+            raise
+        if self.retry_policy.retry_status(response[0].status):
+            breaker.record_failure(endpoint)
+        else:
+            breaker.record_success(endpoint)
+        return response
+
+    def http_request(self, uri, stream=False, timeout=None, **kwargs):
+        # Only some transports can change their socket timeout per request.
+        if timeout is not None and getattr(self.http_connection, 'supports_timeout', False):
+            kwargs['timeout'] = timeout
+        if not stream:
+            return self.http_connection.request(uri, **kwargs)
+        try:
+            request_stream = self.http_connection.request_stream
+        except AttributeError:
+            # This transport can't stream; make do with the whole body.
+            r, c = self.http_connection.request(uri, **kwargs)
+            return r, StringIO.StringIO(c)
+        return request_stream(uri, **kwargs)
+
+    def commit(self, waitSearcher=None, expungeDeletes=None, softCommit=None, timeout=None):
         response = self.update('<commit/>', commit=True,
-                waitSearcher=waitSearcher, expungeDeletes=expungeDeletes, softCommit=softCommit)
+                waitSearcher=waitSearcher, expungeDeletes=expungeDeletes, softCommit=softCommit,
+                timeout=timeout)
 
-    def optimize(self, waitSearcher=None, maxSegments=None):
+    def optimize(self, waitSearcher=None, maxSegments=None, timeout=None):
         response = self.update('<optimize/>', optimize=True,
-            waitSearcher=waitSearcher, maxSegments=maxSegments)
+            waitSearcher=waitSearcher, maxSegments=maxSegments, timeout=timeout)
 
     # For both commit & optimize above, we use the XML body instead
     # of the URL parameter, because if we're using POST (which we
     # should) then only the former works.
 
-    def rollback(self):
-        response = self.update("<rollback/>")
+    def rollback(self, timeout=None):
+        response = self.update("<rollback/>", timeout=timeout)
 
-    def update(self, update_doc, **kwargs):
+    def update(self, update_doc, metrics=None, **kwargs):
+        r, c = self.request(metrics=metrics, **self.update_request(update_doc, **kwargs))
+        if r.status != 200:
+            raise SolrError(r, c)
+
+    def update_request(self, update_doc, timeout=None, update_format='xml', **kwargs):
         body = update_doc
         if body:
-            headers = {"Content-Type":"text/xml; charset=utf-8"}
+            headers = {"Content-Type":UPDATE_FORMATS[update_format].content_type}
         else:
             headers = {}
-        url = self.url_for_update(**kwargs)
-        r, c = self.request(url, method="POST", body=body,
-                            headers=headers)
+        url = self.url_for_update(update_format=update_format, **kwargs)
+        return dict(uri=url, method="POST", body=body, headers=headers, compress=True,
+                    timeout=timeout)
+
+    def csv_update(self, body, params, timeout=None, metrics=None, encoding='utf-8', **kwargs):
+        """Send body, some records of a CSV file, to Solr's CSV update
+        handler; params are the handler's parameters, as (name, value)
+        pairs."""
+        url = self.url_for_update(update_format='csv', params=params, **kwargs)
+        r, c = self.request(uri=url, method="POST", body=body,
+                            headers={"Content-Type": "text/csv; charset=%s" % encoding},
+                            compress=True, timeout=timeout, metrics=metrics)
         if r.status != 200:
             raise SolrError(r, c)
 
-    def url_for_update(self, commit=None, commitWithin=None, softCommit=None, optimize=None, waitSearcher=None, expungeDeletes=None, maxSegments=None):
+    def url_for_update(self, commit=None, commitWithin=None, softCommit=None, optimize=None, waitSearcher=None, expungeDeletes=None, maxSegments=None, update_format='xml', params=()):
+        update_url = {'json': self.json_update_url,
+                      'csv': self.csv_update_url}.get(update_format, self.update_url)
         extra_params = {}
         if commit is not None:
             extra_params['commit'] = "true" if commit else "false"
@@ -94,34 +304,65 @@ class SolrConnection(object):
             raise ValueError("Can't do expungeDeletes without commit")
         if 'maxSegments' in extra_params and 'optimize' not in extra_params:
             raise ValueError("Can't do maxSegments without optimize")
-        if extra_params:
-            return "%s?%s" % (self.update_url, urllib.urlencode(sorted(extra_params.items())))
+        if extra_params or params:
+            return "%s?%s" % (update_url,
+                              urllib.urlencode(sorted(extra_params.items()) + list(params)))
         else:
-            return self.update_url
+            return update_url
 
-    def select(self, params):
+    def select(self, params, timeout=None, metrics=None):
+        r, c = self.request(timeout=timeout, metrics=metrics, **self.select_request(params))
+        if r.status != 200:
+            raise SolrError(r, c)
+        return c
+
+    def select_stream(self, params, timeout=None, metrics=None):
+        """Like select(), but return a file-like object from which the
+        response can be read incrementally. It should be closed after use."""
+        return self.request_stream(self.select_request(params), timeout, metrics)
+
+    def export_stream(self, params, timeout=None, metrics=None):
+        """Like select_stream(), but from the /export handler."""
+        return self.request_stream(self.select_request(params, self.export_url),
+                                   timeout, metrics)
+
+    def request_stream(self, request, timeout=None, metrics=None):
+        r, f = self.request(stream=True, timeout=timeout, metrics=metrics, **request)
+        if r.status != 200:
+            try:
+                c = f.read()
+            finally:
+                f.close()
+            raise SolrError(r, c)
+        return f
+
+    def select_request(self, params, select_url=None):
+        if select_url is None:
+            select_url = self.select_url
         qs = urllib.urlencode(params)
-        url = "%s?%s" % (self.select_url, qs)
+        url = "%s?%s" % (select_url, qs)
         if len(url) > self.max_length_get_url:
             warnings.warn("Long query URL encountered - POSTing instead of "
                 "GETting. This query will not be cached at the HTTP layer")
-            url = self.select_url
-            kwargs = dict(
+            return dict(
+                uri=select_url,
                 method="POST",
                 body=qs,
                 headers={"Content-Type": "application/x-www-form-urlencoded"},
             )
         else:
-            kwargs = dict(method="GET")
-        r, c = self.request(url, **kwargs)
-        if r.status != 200:
-            raise SolrError(r, c)
-        return c
+            return dict(uri=url, method="GET")
 
-    def mlt(self, params, content=None):
+    def mlt(self, params, content=None, timeout=None, metrics=None):
         """Perform a MoreLikeThis query using the content specified
         There may be no content if stream.url is specified in the params.
         """
+        r, c = self.request(timeout=timeout, metrics=metrics, **self.mlt_request(params, content))
+        if r.status != 200:
+            raise SolrError(r, c)
+        return c
+
+    def mlt_request(self, params, content=None):
         qs = urllib.urlencode(params)
         base_url = "%s?%s" % (self.mlt_url, qs)
         if content is None:
@@ -133,46 +374,171 @@ class SolrConnection(object):
             else:
                 kwargs = {'uri': base_url, 'method': "POST",
                     'body': content, 'headers': {"Content-Type": "text/plain; charset=utf-8"}}
-        r, c = self.request(**kwargs)
-        if r.status != 200:
-            raise SolrError(r, c)
-        return c
+        return kwargs
 
 
 class SolrInterface(object):
     readable = True
     writeable = True
+    asynchronous = False
     remote_schema_file = "admin/file/?file=schema.xml"
-    def __init__(self, url, schemadoc=None, http_connection=None, mode='', retry_timeout=-1, max_length_get_url=MAX_LENGTH_GET_URL):
-        self.conn = SolrConnection(url, http_connection, retry_timeout, max_length_get_url)
+    connection_class = SolrConnection
+    query_class = SolrSearch
+    mlt_query_class = MltSolrSearch
+    def __init__(self, url, schemadoc=None, http_connection=None, mode='', retry_timeout=-1, max_length_get_url=MAX_LENGTH_GET_URL, retry_policy=None,
+                 compress_responses=False, compress_updates=False, max_workers=8, result_cache=None,
+                 update_format='xml', response_format='xml', lazy_docs=False, schema_cache=None,
+                 lazy_schema=False):
+        if update_format not in UPDATE_FORMATS:
+            raise ValueError("update_format should be one of %s" % ", ".join(sorted(UPDATE_FORMATS)))
+        if response_format not in RESPONSE_FORMATS:
+            raise ValueError("response_format should be one of %s" % ", ".join(sorted(RESPONSE_FORMATS)))
+        self.update_format = update_format
+        self.response_format = response_format
+        self.lazy_docs = lazy_docs
+        self.conn = self.connection_class(url, http_connection, retry_timeout, max_length_get_url, retry_policy,
+                                          compress_responses, compress_updates)
         self.schemadoc = schemadoc
+        self.schema_cache = schema_cache
+        self._schema = None
+        self.schema_lock = threading.Lock()
+        self.max_workers = max_workers
+        self.workers = None
+        self.workers_lock = threading.Lock()
+        self.result_cache = result_cache
         if mode == 'r':
             self.writeable = False
         elif mode == 'w':
             self.readable = False
-        self.init_schema()
+        if not lazy_schema:
+            self.init_schema()
+
+    @property
+    def schema(self):
+        """The SolrSchema; with lazy_schema, it's fetched the first time
+        it's needed, by a query or an update."""
+        if self._schema is None:
+            with self.schema_lock:
+                if self._schema is None:
+                    self.init_schema()
+        return self._schema
+
+    @schema.setter
+    def schema(self, schema):
+        self._schema = schema
 
     def init_schema(self):
         if self.schemadoc:
-            schemadoc = self.schemadoc
+            self.schema = SolrSchema(self.schemadoc)
+            return
+        url = urlparse.urljoin(self.conn.url, self.remote_schema_file)
+        cached = self.cached_schema(url)
+        try:
+            r, c = self.conn.request(url, headers=self.schema_request_headers(cached))
+        except self.schema_fetch_errors():
+            if cached is None:
+                raise
+            logger.warning("Couldn't reach Solr for its schema; using the cached one",
+                           exc_info=True)
+            self.schema = cached[0]
+            return
+        self.schema = self.schema_from_response(url, r, c, cached)
+
+    def cached_schema(self, url):
+        if self.schema_cache is not None:
+            return self.schema_cache.get(url)
+
+    def schema_request_headers(self, cached):
+        if cached is None:
+            return {}
+        return conditional_headers(cached[1])
+
+    def schema_fetch_errors(self):
+        """The errors which mean Solr couldn't be reached for the schema,
+        so that a cached copy should be used."""
+        return self.conn.retry_policy.retry_errors + (CircuitOpenError,)
+
+    def schema_from_response(self, url, r, c, cached):
+        """The schema Solr sent in answer to a request for it, or the
+        cached one, if it hasn't changed (or Solr is unavailable)."""
+        if cached is not None:
+            schema, validators = cached
+            if r.status == 304:
+                return schema
+            if self.conn.retry_policy.retry_status(r.status):
+                logger.warning("Solr answered %s when asked for its schema; using the cached one",
+                               r.status)
+                return schema
+        if r.status != 200:
+            raise EnvironmentError("Couldn't retrieve schema document from server - received status code %s\n%s" % (r.status, c))
+        new_validators = schema_validators(r, c)
+        if cached is not None and validators['sha1'] == new_validators['sha1']:
+            # Solr doesn't do conditional requests, but the schema is the same.
+            schema = cached[0]
         else:
-            r, c = self.conn.request(
-                urlparse.urljoin(self.conn.url, self.remote_schema_file))
-            if r.status != 200:
-                raise EnvironmentError("Couldn't retrieve schema document from server - received status code %s\n%s" % (r.status, c))
-            schemadoc = StringIO.StringIO(c)
-        self.schema = SolrSchema(schemadoc)
-
-    def add(self, docs, chunk=100, **kwargs):
+            schema = SolrSchema(StringIO.StringIO(c))
+        if self.schema_cache is not None and (cached is None or validators != new_validators):
+            self.schema_cache.put(url, schema, new_validators)
+        return schema
+
+    def add(self, docs, chunk=100, chunk_bytes=None, timeout=None, **kwargs):
+        """Add docs, in updates of at most chunk documents and, if
+        chunk_bytes is given, at most chunk_bytes bytes (unless a single
+        document is bigger than that). Returns a list of the number of
+        documents and bytes in each update."""
         if not self.writeable:
             raise TypeError("This Solr instance is only for reading")
+        # timeout covers all the chunks, not each of them.
+        deadline = None if timeout is None else time.time() + timeout
+        messages = self.update_messages(docs, chunk, chunk_bytes)
+        sizes = []
+        while True:
+            metrics = self.new_metrics('update')
+            with timing(metrics, 'build'):
+                n_docs, update_message = next(messages, (0, None))
+            if update_message is None:
+                break
+            with reporting(metrics):
+                self.conn.update(update_message, timeout=time_left(deadline), metrics=metrics,
+                                 update_format=self.update_format, **kwargs)
+            sizes.append((n_docs, len(update_message)))
+        self.invalidate_cache(kwargs)
+        return sizes
+
+    def update_messages(self, docs, chunk, chunk_bytes=None):
+        """Serialize docs into update messages, yielding the number of
+        documents in each along with the message."""
         if hasattr(docs, "items") or not hasattr(docs, "__iter__"):
             docs = [docs]
-        # to avoid making messages too large, we break the message every
-        # chunk docs.
-        for doc_chunk in grouper(docs, chunk):
-            update_message = self.schema.make_update(doc_chunk)
-            self.conn.update(str(update_message), **kwargs)
+        if chunk_bytes is None:
+            # to avoid making messages too large, we break the message every
+            # chunk docs.
+            for doc_chunk in grouper(docs, chunk):
+                yield len(doc_chunk), str(self.schema.make_update(doc_chunk, self.update_format))
+            return
+        fragments = (self.schema.make_update_fragment(doc, self.update_format) for doc in docs)
+        join_fragments = UPDATE_FORMATS[self.update_format].join_fragments
+        overhead = len(join_fragments([]))
+        for batch in byte_grouper(fragments, chunk, chunk_bytes - overhead):
+            yield len(batch), join_fragments(batch)
+
+    def bulk_add(self, docs, chunk=1000, processes=None, concurrency=4,
+                 on_progress=None, on_error=None, **kwargs):
+        """Add a large number of documents, serializing them in a pool of
+        processes and sending several updates at once; see BulkLoader.
+        Returns a BulkLoadStats."""
+        from .bulk import BulkLoader
+        return BulkLoader(self, chunk, processes, concurrency, on_progress, on_error,
+                          **kwargs).load(docs)
+
+    def load_csv(self, csv_file, chunk=10000, chunk_bytes=4 << 20, concurrency=1,
+                 on_progress=None, on_error=None, **kwargs):
+        """Load a CSV file (a filename, or a file opened in binary mode)
+        through Solr's CSV update handler, reading it a chunk at a time
+        rather than all at once; see CSVLoader. Returns a BulkLoadStats."""
+        from .bulk import CSVLoader
+        return CSVLoader(self, chunk, chunk_bytes, concurrency, on_progress, on_error,
+                         **kwargs).load(csv_file)
 
     def delete(self, docs=None, queries=None, **kwargs):
         if not self.writeable:
@@ -181,50 +547,200 @@ class SolrInterface(object):
             raise SolrError("No docs or query specified for deletion")
         elif docs is not None and (hasattr(docs, "items") or not hasattr(docs, "__iter__")):
             docs = [docs]
-        delete_message = self.schema.make_delete(docs, queries)
-        self.conn.update(str(delete_message), **kwargs)
+        with reporting(self.new_metrics('update')) as metrics:
+            with timing(metrics, 'build'):
+                delete_message = str(self.schema.make_delete(docs, queries))
+            self.conn.update(delete_message, metrics=metrics, **kwargs)
+        self.invalidate_cache(kwargs)
 
     def commit(self, *args, **kwargs):
         if not self.writeable:
             raise TypeError("This Solr instance is only for reading")
         self.conn.commit(*args, **kwargs)
+        self.invalidate_cache()
 
     def optimize(self, *args, **kwargs):
         if not self.writeable:
             raise TypeError("This Solr instance is only for reading")
         self.conn.optimize(*args, **kwargs)
+        self.invalidate_cache()
 
-    def rollback(self):
+    def rollback(self, timeout=None):
         if not self.writeable:
             raise TypeError("This Solr instance is only for reading")
-        self.conn.rollback()
+        self.conn.rollback(timeout=timeout)
+        self.invalidate_cache()
 
-    def delete_all(self):
+    def delete_all(self, timeout=None):
         if not self.writeable:
             raise TypeError("This Solr instance is only for reading")
         # When deletion is fixed to escape query strings, this will need fixed.
-        self.delete(queries=self.Q(**{"*":"*"}))
+        self.delete(queries=self.Q(**{"*":"*"}), timeout=timeout)
+
+    def search(self, timeout=None, metrics=None, record_class=None, **kwargs):
+        if not self.readable:
+            raise TypeError("This Solr instance is only for writing")
+        if metrics is None:
+            metrics = self.new_metrics('select')
+            if metrics is not None:
+                with reporting(metrics):
+                    return self.search(timeout=timeout, metrics=metrics,
+                                       record_class=record_class, **kwargs)
+        with timing(metrics, 'build'):
+            params = self.response_params(params_from_dict(**kwargs))
+        response = self.cached_response(params, record_class)
+        if response is None:
+            requested = self.cache_clock()
+            response = self.schema.parse_response(
+                self.conn.select(self.time_allowed(params, timeout), timeout=timeout,
+                                 metrics=metrics),
+                metrics, self.response_format, self.lazy_docs, record_class)
+            # Partial results aren't worth keeping.
+            if not response.partialResults:
+                self.cache_response(params, response, record_class, requested)
+        elif metrics is not None:
+            metrics.cached = True
+        if metrics is not None:
+            metrics.record_response(response)
+        return response
+
+    def response_params(self, params):
+        """Ask for the response in response_format."""
+        request_params = RESPONSE_FORMATS[self.response_format].request_params
+        if request_params:
+            params = sorted(params + request_params)
+        return params
+
+    def time_allowed(self, params, timeout):
+        """Ask Solr to stop searching once timeout has passed, unless the
+        query already sets a shorter timeAllowed. Solr won't have a
+        timeAllowed with a cursorMark, so a query with one is left to the
+        socket timeout alone."""
+        if timeout is None or 'cursorMark' in dict(params):
+            return params
+        time_allowed = max(int(timeout * 1000), 1)
+        others = []
+        for k, v in params:
+            if k == 'timeAllowed':
+                time_allowed = min(time_allowed, int(v))
+            else:
+                others.append((k, v))
+        return sorted(others + [('timeAllowed', str(time_allowed))])
+
+    def cached_response(self, params, record_class=None):
+        if self.result_cache is not None:
+            return self.result_cache.get(self.cache_key(params, record_class))
+
+    def cache_response(self, params, response, record_class=None, requested=None):
+        if self.result_cache is not None:
+            self.result_cache.put(self.cache_key(params, record_class), response, requested)
+
+    def cache_clock(self):
+        """The time by the result cache's clock, if there is a cache."""
+        if self.result_cache is not None:
+            return self.result_cache.clock()
+
+    @staticmethod
+    def cache_key(params, record_class=None):
+        # Responses parsed into records or columns aren't the same as
+        # those parsed into dicts.
+        if record_class is None:
+            return tuple(params)
+        return tuple(params) + (record_class,)
+
+    def invalidate_cache(self, update_kwargs=None):
+        """Clear the result cache after a commit - or after an add or delete,
+        if it asked for one. With only a commitWithin, the commit is still
+        to come, so nothing is cached until it's due."""
+        if self.result_cache is None:
+            return
+        if update_kwargs is None or any(update_kwargs.get(k) is not None
+                                        for k in ('commit', 'softCommit')):
+            self.result_cache.clear()
+        elif update_kwargs.get('commitWithin') is not None:
+            commit_within = float(update_kwargs['commitWithin']) / 1000
+            self.result_cache.clear(until=self.result_cache.clock() + commit_within)
+
+    def search_stream(self, constructor=dict, timeout=None, **kwargs):
+        if not self.readable:
+            raise TypeError("This Solr instance is only for writing")
+        params = self.time_allowed(params_from_dict(**kwargs), timeout)
+        # Streamed responses are parsed as they are read, so they are
+        # reported (with only the http phase timed) by the connection.
+        return self.schema.parse_response_stream(
+            self.conn.select_stream(params, timeout=timeout), constructor)
 
-    def search(self, **kwargs):
+    def export_stream(self, constructor=dict, timeout=None, **kwargs):
         if not self.readable:
             raise TypeError("This Solr instance is only for writing")
-        params = params_from_dict(**kwargs)
-        return self.schema.parse_response(self.conn.select(params))
+        if not hasattr(self.conn.http_connection, 'request_stream'):
+            warnings.warn("This http_connection can't stream responses, so the whole "
+                "export will be read into memory first; use PooledHttp to stream it")
+        return self.schema.parse_export_stream(
+            self.conn.export_stream(params_from_dict(**kwargs), timeout=timeout), constructor)
+
+    def execute_many(self, searches, timeout=None):
+        """Execute several searches (SolrSearch or MltSolrSearch objects)
+        at once, returning their responses in the same order. If a search
+        fails, its exception is returned in place of its response.
+
+        The searches are run concurrently, on up to max_workers threads,
+        if the http_connection is thread-safe (like PooledHttp); otherwise
+        they are run one after another.
+
+        If timeout is given, it applies to each search separately.
+        """
+        def execute(search):
+            try:
+                return search.execute(timeout=timeout)
+            except Exception, e:
+                return e
+        searches = list(searches)
+        if getattr(self.conn.http_connection, 'thread_safe', False) and len(searches) > 1:
+            return [task.result() for task in self.worker_pool().map(execute, searches)]
+        return [execute(search) for search in searches]
+
+    def worker_pool(self):
+        with self.workers_lock:
+            if self.workers is None:
+                self.workers = WorkerPool(self.max_workers, name="sunburnt execute_many")
+            return self.workers
 
     def query(self, *args, **kwargs):
         if not self.readable:
             raise TypeError("This Solr instance is only for writing")
-        q = SolrSearch(self)
+        q = self.query_class(self)
         if len(args) + len(kwargs) > 0:
             return q.query(*args, **kwargs)
         else:
             return q
 
-    def mlt_search(self, content=None, **kwargs):
+    def mlt_search(self, content=None, timeout=None, metrics=None, record_class=None, **kwargs):
         if not self.readable:
             raise TypeError("This Solr instance is only for writing")
-        params = params_from_dict(**kwargs)
-        return self.schema.parse_response(self.conn.mlt(params, content=content))
+        if metrics is None:
+            metrics = self.new_metrics('mlt')
+            if metrics is not None:
+                with reporting(metrics):
+                    return self.mlt_search(content, timeout, metrics, record_class, **kwargs)
+        with timing(metrics, 'build'):
+            params = self.time_allowed(self.response_params(params_from_dict(**kwargs)), timeout)
+        response = self.schema.parse_response(
+            self.conn.mlt(params, content=content, timeout=timeout, metrics=metrics), metrics,
+            self.response_format, self.lazy_docs, record_class)
+        if metrics is not None:
+            metrics.record_response(response)
+        return response
+
+    def add_listener(self, listener):
+        """Call listener with a RequestMetrics after each request to Solr."""
+        self.conn.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.conn.listeners.remove(listener)
+
+    def new_metrics(self, handler):
+        return self.conn.new_metrics(handler)
 
     def mlt_query(self, fields=None, content=None, content_charset=None, url=None, query_fields=None,
                   **kwargs):
@@ -243,7 +759,7 @@ class SolrInterface(object):
         """
         if not self.readable:
             raise TypeError("This Solr instance is only for writing")
-        q = MltSolrSearch(self, content=content, content_charset=content_charset, url=url)
+        q = self.mlt_query_class(self, content=content, content_charset=content_charset, url=url)
         return q.mlt(fields=fields, query_fields=query_fields, **kwargs)
 
     def Q(self, *args, **kwargs):
@@ -252,6 +768,32 @@ class SolrInterface(object):
         return q
 
 
+def time_left(deadline):
+    """The number of seconds until deadline (or None, if there isn't one);
+    raise socket.timeout if it has already passed."""
+    if deadline is None:
+        return None
+    left = deadline - time.time()
+    if left <= 0:
+        raise socket.timeout("Deadline exceeded")
+    return left
+
+
+def byte_grouper(strings, n, max_bytes):
+    """Group strings into lists of at most n strings, which add up to at
+    most max_bytes - except that a string longer than that is put in a
+    list by itself."""
+    group, size = [], 0
+    for string in strings:
+        if group and (len(group) >= n or size + len(string) > max_bytes):
+            yield group
+            group, size = [], 0
+        group.append(string)
+        size += len(string)
+    if group:
+        yield group
+
+
 def grouper(iterable, n):
     "grouper('ABCDEFG', 3) --> [['ABC'], ['DEF'], ['G']]"
     i = iter(iterable)
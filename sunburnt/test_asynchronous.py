@@ -0,0 +1,207 @@
+from __future__ import absolute_import
+
+import cgi, shutil, StringIO, tempfile, urlparse
+
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_equal
+
+try:
+    from tornado.concurrent import Future
+    from tornado.httpclient import HTTPResponse
+    from tornado.ioloop import IOLoop
+    import tornado.gen
+except ImportError:
+    raise SkipTest("tornado is not installed")
+
+from .asynchronous import AsyncSolrInterface
+from .cache import SchemaCache
+from .test_sunburnt import MockResponse, schema_string
+
+
+class MockAsyncHTTPClient(object):
+    def __init__(self, down=()):
+        self.requests = []
+        self.down = set(down)
+
+    def fetch(self, request, raise_error=True):
+        self.requests.append(request)
+        u = urlparse.urlparse(request.url)
+        params = cgi.parse_qs(u.query)
+        if u.hostname in self.down:
+            code, body = 599, ''
+        elif u.path.endswith('/admin/file/'):
+            code, body = 200, schema_string
+        elif u.path.endswith('/select/'):
+            start = int(params.get("start", [0])[0])
+            rows = int(params.get("rows", [10])[0])
+            code, body = 200, MockResponse(start, rows).xml_response()
+        elif u.path.endswith('/update/'):
+            code, body = 200, ''
+        else:
+            code, body = 404, 'Not found'
+        f = Future()
+        f.set_result(HTTPResponse(request, code, buffer=StringIO.StringIO(body)))
+        return f
+
+
+def run(f):
+    return IOLoop.current().run_sync(f)
+
+
+def test_schema_is_fetched_asynchronously():
+    si = AsyncSolrInterface("http://test.example.com/",
+                            http_connection=MockAsyncHTTPClient())
+    schema = run(lambda: si.schema_future)
+    assert si.schema is schema
+    assert_equal(schema.unique_key, "int_field")
+
+
+def test_cached_schema_is_used_if_solr_is_unreachable():
+    directory = tempfile.mkdtemp()
+    try:
+        cache = SchemaCache(directory)
+        client = MockAsyncHTTPClient()
+        si = AsyncSolrInterface("http://test.example.com/", http_connection=client,
+                                schema_cache=cache)
+        run(lambda: si.schema_future)
+        def fetch(request, raise_error=True):
+            f = Future()
+            f.set_result(HTTPResponse(request, 599))
+            return f
+        client.fetch = fetch
+        si = AsyncSolrInterface("http://test.example.com/", http_connection=client,
+                                schema_cache=cache)
+        schema = run(lambda: si.schema_future)
+        assert_equal(schema.unique_key, "int_field")
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_lazy_schema():
+    client = MockAsyncHTTPClient(down=["test.example.com"])
+    si = AsyncSolrInterface("http://test.example.com/", http_connection=client,
+                            lazy_schema=True)
+    assert_equal(client.requests, [])
+    try:
+        run(lambda: si.schema_future)
+    except Exception:
+        pass
+    else:
+        assert False
+    # The next time the schema is wanted, it's fetched again.
+    client.down = set()
+    assert_equal(run(lambda: si.schema_future).unique_key, "int_field")
+    assert_equal(len(client.requests), 2)
+
+
+def test_query_before_schema_is_loaded():
+    f = Future()
+    client = MockAsyncHTTPClient()
+    client.fetch = lambda request, raise_error=True: f
+    si = AsyncSolrInterface("http://test.example.com/", http_connection=client)
+    try:
+        si.query("*")
+    except Exception, e:
+        assert "schema_future" in e.args[0]
+    else:
+        assert False
+
+
+def test_execute():
+    si = AsyncSolrInterface("http://test.example.com/",
+                            http_connection=MockAsyncHTTPClient())
+    @tornado.gen.coroutine
+    def query():
+        yield si.schema_future
+        response = yield si.query("*").paginate(start=2, rows=3).execute()
+        count = yield si.query("*").count()
+        raise tornado.gen.Return((response, count))
+    response, count = run(query)
+    assert_equal([d['int_field'] for d in response], [2, 3, 4])
+    assert_equal(count, 10)
+
+
+def test_many_queries_in_flight():
+    si = AsyncSolrInterface("http://test.example.com/",
+                            http_connection=MockAsyncHTTPClient())
+    @tornado.gen.coroutine
+    def queries():
+        yield si.schema_future
+        responses = yield [si.query("*").paginate(start=i, rows=1).execute()
+                           for i in range(10)]
+        raise tornado.gen.Return(responses)
+    responses = run(queries)
+    assert_equal([r[0]['int_field'] for r in responses], range(10))
+
+
+def test_execute_many():
+    client = MockAsyncHTTPClient()
+    si = AsyncSolrInterface("http://test.example.com/", http_connection=client, max_workers=1)
+    run(lambda: si.schema_future)
+    searches = [si.query("*").paginate(start=n, rows=2) for n in range(3)]
+    searches.insert(1, si.mlt_query("int_field"))
+    responses = run(lambda: si.execute_many(searches))
+    assert isinstance(responses[1], Exception)
+    del responses[1]
+    assert_equal([[d['int_field'] for d in r] for r in responses],
+                 [[n, n + 1] for n in range(3)])
+
+
+def test_replicas():
+    from .replicas import ReplicaSet
+    client = MockAsyncHTTPClient(down=["solr2.example.com"])
+    replicas = ReplicaSet(["http://solr1.example.com/solr/", "http://solr2.example.com/solr/",
+                           "http://solr3.example.com/solr/"], probe_interval=None)
+    si = AsyncSolrInterface(replicas, http_connection=client)
+    run(lambda: si.schema_future)
+    for i in range(4):
+        response = run(si.query("*").paginate(rows=2).execute)
+        assert_equal(len(response), 2)
+    hosts = [urlparse.urlparse(r.url).hostname for r in client.requests]
+    assert_equal(sorted(set(hosts)), ["solr1.example.com", "solr2.example.com",
+                                      "solr3.example.com"])
+    assert_equal(hosts.count("solr2.example.com"), 1)
+    assert_equal([s['healthy'] for s in replicas.stats()], [True, False, True])
+
+
+def test_add_and_commit():
+    client = MockAsyncHTTPClient()
+    si = AsyncSolrInterface("http://test.example.com/", http_connection=client)
+    @tornado.gen.coroutine
+    def update():
+        yield si.add([{"int_field": i, "text_field": "text",
+                       "string_field": "s%s" % i} for i in range(3)], chunk=2)
+        yield si.commit()
+    run(update)
+    updates = [r for r in client.requests if '/update/' in r.url]
+    assert_equal([r.method for r in updates], ["POST"] * 3)
+    assert_equal(updates[-1].body, "<commit/>")
+    assert updates[0].body.count("<doc>") == 2
+
+
+def test_read_only_interface():
+    si = AsyncSolrInterface("http://test.example.com/", mode='r',
+                            http_connection=MockAsyncHTTPClient())
+    try:
+        run(lambda: si.add({"int_field": 1}))
+    except TypeError:
+        pass
+    else:
+        assert False
+
+
+def test_sync_only_features():
+    from .bulk import BulkLoader, CSVLoader
+    from .indexer import BufferedIndexer
+    si = AsyncSolrInterface("http://test.example.com/", http_connection=MockAsyncHTTPClient())
+    run(lambda: si.schema_future)
+    for f in (lambda: si.bulk_add([{"int_field": 1}]),
+              lambda: si.load_csv(StringIO.StringIO("int_field\n1\n")),
+              lambda: BulkLoader(si), lambda: CSVLoader(si), lambda: BufferedIndexer(si),
+              lambda: si.query("*").iter_cursor(), lambda: si.query("*").stream()):
+        try:
+            f()
+        except TypeError:
+            pass
+        else:
+            assert False
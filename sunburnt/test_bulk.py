@@ -0,0 +1,154 @@
+from __future__ import absolute_import
+
+import csv
+import os
+import tempfile
+
+from .bulk import csv_records
+from .schema import SolrError
+from .sunburnt import SolrInterface
+from .test_indexer import UpdateMockConnection, make_docs
+from .test_sunburnt import MockConnection, StringIO
+
+from nose.tools import assert_equal
+
+
+class Book(object):
+    text_field = 'text'
+    def __init__(self, n):
+        self.int_field = n
+    def string_field(self):
+        return 'string %s' % self.int_field
+
+
+def check_bulk_add(processes, concurrency, update_format='xml'):
+    conn = UpdateMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn,
+                       update_format=update_format)
+    progress = []
+    docs = make_docs(45) + [Book(n) for n in range(45, 50)]
+    stats = si.bulk_add(iter(docs), chunk=10, processes=processes, concurrency=concurrency,
+                        on_progress=lambda s: progress.append(s.docs))
+    assert_equal(sorted(map(sorted, conn.batches)), [range(n, n + 10) for n in range(0, 50, 10)])
+    assert_equal(progress, [10, 20, 30, 40, 50])
+    assert_equal((stats.docs, stats.batches, stats.failed_docs), (50, 5, 0))
+    assert stats.bytes > 0
+
+def test_bulk_add():
+    for processes in (0, 2):
+        for concurrency in (1, 3):
+            yield check_bulk_add, processes, concurrency
+        yield check_bulk_add, processes, 1, 'json'
+
+
+def test_bulk_add_errors():
+    for processes in (0, 2):
+        docs = make_docs(25)
+        del docs[12]['text_field']
+        errors = []
+        si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection())
+        stats = si.bulk_add(docs, chunk=10, processes=processes,
+                            on_error=lambda e, batch: errors.append((e, batch)))
+        assert_equal([batch for e, batch in errors], [docs[10:20]])
+        assert isinstance(errors[0][0], SolrError)
+        assert_equal((stats.docs, stats.failed_docs, stats.failed_batches), (15, 10, 1))
+
+        si = SolrInterface("http://test.example.com/", http_connection=UpdateMockConnection(500))
+        try:
+            si.bulk_add(make_docs(5), processes=processes)
+        except SolrError:
+            pass
+        else:
+            assert False
+
+
+class CSVMockConnection(MockConnection):
+    def __init__(self, status=200):
+        super(CSVMockConnection, self).__init__()
+        self.status = status
+        self.batches = []
+
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method == 'POST' and uri_obj.path.endswith('/update/csv'):
+            assert_equal(headers['Content-Type'], 'text/csv; charset=utf-8')
+            self.params = params
+            fieldnames = params['fieldnames'][0].split(',')
+            self.batches.append([dict(zip(fieldnames, row))
+                                 for row in csv.reader(StringIO(body),
+                                                       delimiter=params['separator'][0])])
+            return self.MockStatus(self.status), ''
+
+
+csv_file = """id,title,tags,ignored
+
+1,One,a|b,x
+2,"Two, with ""quotes""
+over two lines",c,y
+3,Three,,z
+"""
+
+def test_load_csv():
+    conn = CSVMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn)
+    stats = si.load_csv(StringIO(csv_file), chunk_bytes=40,
+                        field_map={'id': 'int_field', 'title': 'text_field', 'ignored': None},
+                        split={'tags': '|'}, literals={'string_field': u'\u2603'},
+                        commitWithin=1000)
+    assert_equal([[row['int_field'] for row in batch] for batch in conn.batches],
+                 [['1'], ['2'], ['3']])
+    assert_equal(conn.batches[1][0]['text_field'], 'Two, with "quotes"\nover two lines')
+    assert_equal(conn.params, {
+        'commitWithin': ['1000.0'], 'header': ['false'],
+        'fieldnames': ['int_field,text_field,tags,'], 'separator': [','],
+        'encapsulator': ['"'], 'f.tags.split': ['true'], 'f.tags.separator': ['|'],
+        'literal.string_field': [u'\u2603'.encode('utf-8')]})
+    assert_equal((stats.docs, stats.batches, stats.bytes), (3, 3, len(csv_file) - 23))
+
+
+def test_load_csv_from_path():
+    conn = CSVMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn)
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write("# exported today\n" + "".join("%s\ttext %s\n" % (i, i) for i in range(25)))
+        stats = si.load_csv(path, chunk=10, header=False, skipLines=1, separator='\t',
+                            fieldnames=['int_field', 'text_field'], concurrency=3)
+    finally:
+        os.remove(path)
+    assert_equal([len(batch) for batch in conn.batches], [10, 10, 5])
+    assert_equal(conn.batches[2][4], {'int_field': '24', 'text_field': 'text 24'})
+    assert_equal(conn.params['separator'], ['\t'])
+    assert_equal((stats.docs, stats.batches), (25, 3))
+
+
+def test_load_csv_errors():
+    errors = []
+    si = SolrInterface("http://test.example.com/", http_connection=CSVMockConnection(500))
+    stats = si.load_csv(StringIO(csv_file), chunk=2,
+                        on_error=lambda e, batch: errors.append((e, batch)))
+    assert_equal([len(batch) for e, batch in errors], [2, 1])
+    assert isinstance(errors[0][0], SolrError)
+    assert_equal((stats.docs, stats.failed_docs, stats.failed_batches), (0, 3, 2))
+    try:
+        si.load_csv(StringIO(csv_file))
+    except SolrError:
+        pass
+    else:
+        assert False
+    try:
+        si.load_csv(StringIO(csv_file), header=False)
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def test_csv_records():
+    for lines, encapsulator, escape, records in (
+        (['a,b\n', '\n', 'c,d'], '"', None, ['a,b\n', 'c,d']),
+        (['"a\n', '\n', 'b",c\n', 'd\n'], '"', None, ['"a\n\nb",c\n', 'd\n']),
+        (['a\\\n', 'b\\\\\n', 'c\\"\n'], None, '\\', ['a\\\nb\\\\\n', 'c\\"\n']),
+        (['"a\\"\n', 'b"\n'], '"', '\\', ['"a\\"\nb"\n']),
+        ):
+        assert_equal(list(csv_records(lines, encapsulator, escape)), records)
@@ -0,0 +1,229 @@
+from __future__ import absolute_import
+
+import os, pickle, shutil, socket, tempfile
+from StringIO import StringIO
+
+from . import schema
+from .cache import ResultCache, SchemaCache
+from .sunburnt import SolrInterface
+from .test_retry import Clock
+from .test_sunburnt import PaginationMockConnection, schema_string
+
+from nose.tools import assert_equal
+
+
+class CountingMockConnection(PaginationMockConnection):
+    def __init__(self):
+        super(CountingMockConnection, self).__init__()
+        self.selects = 0
+
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if uri_obj.path.endswith('/update/'):
+            return self.MockStatus(200), ''
+        if uri_obj.path.endswith('/select/'):
+            self.selects += 1
+        return super(CountingMockConnection, self)._handle_request(uri_obj, params, method, body, headers)
+
+
+class Book(object):
+    def __init__(self, int_field, string_field):
+        self.int_field = int_field
+
+
+def test_lru_eviction():
+    cache = ResultCache(max_size=2)
+    si = SolrInterface("http://test.example.com/", http_connection=CountingMockConnection(),
+                       result_cache=cache)
+    for key in ('a', 'b', 'a', 'c'):
+        si.search(q=key)
+    assert_equal(sorted(k[0][1] for k in cache.entries), ['a', 'c'])
+    assert_equal(cache.stats(), dict(hits=1, misses=3, evictions=1, expirations=0,
+                                     invalidations=0, size=2))
+
+
+def test_ttl():
+    cache = ResultCache(ttl=10)
+    cache.clock = clock = Clock()
+    conn = CountingMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn, result_cache=cache)
+    si.query("*").execute()
+    clock.now = 10
+    si.query("*").execute()
+    assert_equal(conn.selects, 1)
+    clock.now = 11
+    si.query("*").execute()
+    assert_equal(conn.selects, 2)
+    assert_equal(cache.stats()['expirations'], 1)
+
+
+def test_cached_responses_are_copies():
+    conn = CountingMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn,
+                       result_cache=ResultCache())
+    books = si.query("*").execute(constructor=Book)
+    assert_equal([b.int_field for b in books], range(10))
+    response = si.query("*").execute()
+    assert_equal([d['int_field'] for d in response], range(10))
+    response.result.docs[0]['int_field'] = 'changed'
+    assert_equal(si.query("*").execute()[0]['int_field'], 0)
+    assert_equal(conn.selects, 1)
+
+
+def check_invalidation(update, invalidated):
+    conn = CountingMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn,
+                       result_cache=ResultCache())
+    si.query("*").execute()
+    update(si)
+    si.query("*").execute()
+    assert_equal(conn.selects, 2 if invalidated else 1)
+
+def test_invalidation():
+    doc = {'int_field': 1, 'text_field': 'one', 'string_field': 'one'}
+    for update, invalidated in (
+        (lambda si: si.commit(), True),
+        (lambda si: si.optimize(), True),
+        (lambda si: si.rollback(), True),
+        (lambda si: si.add(doc), False),
+        (lambda si: si.add(doc, commit=True), True),
+        (lambda si: si.add(doc, softCommit=True), True),
+        (lambda si: si.add(doc, commitWithin=1000), True),
+        (lambda si: si.delete(doc), False),
+        (lambda si: si.delete(doc, commit=True), True),
+        ):
+        yield check_invalidation, update, invalidated
+
+
+def test_commit_within():
+    cache = ResultCache()
+    cache.clock = clock = Clock()
+    conn = CountingMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn, result_cache=cache)
+    si.query("*").execute()
+    si.add({'int_field': 1, 'text_field': 'one', 'string_field': 'one'}, commitWithin=5000)
+    # Until the commit is due, responses may not show the update yet, so
+    # they aren't kept.
+    for now, selects in ((0, 2), (4, 3), (5, 4), (6, 4)):
+        clock.now = now
+        si.query("*").execute()
+        assert_equal(conn.selects, selects)
+    # A response asked for before the commit is due isn't kept, however
+    # late it's stored.
+    si.add({'int_field': 1, 'text_field': 'one', 'string_field': 'one'}, commitWithin=1000)
+    cache.put('late', si.query("*").execute(), requested=6.5)
+    assert_equal(cache.get('late'), None)
+
+
+class SchemaMockConnection(PaginationMockConnection):
+    """Serves the schema with an ETag, if it has one, and answers 304 if
+    the schema hasn't changed; or, if status is set, with that status.
+    Raises socket.error if down."""
+    def __init__(self, etag='"1"', schema=schema_string):
+        super(SchemaMockConnection, self).__init__()
+        self.etag = etag
+        self.schema = schema
+        self.status = None
+        self.down = False
+        self.schema_requests = []
+
+    def request(self, uri, method='GET', body=None, headers=None):
+        if 'admin/file' not in uri:
+            return super(SchemaMockConnection, self).request(uri, method, body, headers)
+        self.schema_requests.append(headers or {})
+        if self.down:
+            raise socket.error("Connection refused")
+        if self.status is not None:
+            return self.MockStatus(self.status), 'Unavailable'
+        r = self.MockHeaders(200)
+        if self.etag is not None:
+            r['etag'] = self.etag
+            if (headers or {}).get('If-None-Match') == self.etag:
+                r.status = 304
+                return r, ''
+        return r, self.schema
+
+    class MockHeaders(dict):
+        def __init__(self, status):
+            super(SchemaMockConnection.MockHeaders, self).__init__()
+            self.status = status
+
+
+def check_schema_cache(check):
+    directory = tempfile.mkdtemp()
+    try:
+        check(SchemaCache(os.path.join(directory, 'schemas')))
+    finally:
+        shutil.rmtree(directory)
+
+def check_revalidation(cache):
+    conn = SchemaMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn, schema_cache=cache)
+    assert_equal(conn.schema_requests, [{}])
+    si = SolrInterface("http://test.example.com/", http_connection=conn, schema_cache=cache)
+    assert_equal(conn.schema_requests[1], {'If-None-Match': '"1"'})
+    assert_equal(si.schema.unique_key, 'int_field')
+    assert_equal(si.schema.fields['int_field'].normalize('3'), 3)
+    # A changed schema is fetched, and cached, again.
+    conn.etag = '"2"'
+    conn.schema = schema_string.replace('<uniqueKey>int_field', '<uniqueKey>text_field')
+    si = SolrInterface("http://test.example.com/", http_connection=conn, schema_cache=cache)
+    assert_equal(si.schema.unique_key, 'text_field')
+    schema, validators = cache.get("http://test.example.com/admin/file/?file=schema.xml")
+    assert_equal((schema.unique_key, validators['etag']), ('text_field', '"2"'))
+    # Other Solr cores have their own schemas.
+    assert_equal(cache.get("http://test.example.com/core/admin/file/?file=schema.xml"), None)
+
+def check_fallback(cache):
+    conn = SchemaMockConnection(etag=None)
+    SolrInterface("http://test.example.com/", http_connection=conn, schema_cache=cache)
+    conn.down = True
+    si = SolrInterface("http://test.example.com/", http_connection=conn, schema_cache=cache)
+    assert_equal(si.schema.unique_key, 'int_field')
+    conn.down = False
+    conn.status = 503
+    si = SolrInterface("http://test.example.com/", http_connection=conn, schema_cache=cache)
+    assert_equal(si.schema.unique_key, 'int_field')
+    # Without an ETag or Last-Modified, Solr can only be asked for the
+    # schema unconditionally.
+    assert_equal(conn.schema_requests, [{}, {}, {}])
+    conn.status = 404
+    try:
+        SolrInterface("http://test.example.com/", http_connection=conn, schema_cache=cache)
+    except EnvironmentError:
+        pass
+    else:
+        assert False
+
+def check_unusable_cache(cache):
+    conn = SchemaMockConnection()
+    conn.down = True
+    try:
+        SolrInterface("http://test.example.com/", http_connection=conn, schema_cache=cache)
+    except socket.error:
+        pass
+    else:
+        assert False
+    conn.down = False
+    SolrInterface("http://test.example.com/", http_connection=conn, schema_cache=cache)
+    with open(cache.path("http://test.example.com/admin/file/?file=schema.xml"), 'wb') as f:
+        f.write('not a pickle')
+    si = SolrInterface("http://test.example.com/", http_connection=conn, schema_cache=cache)
+    assert_equal(conn.schema_requests[-1], {})
+    assert_equal(si.schema.unique_key, 'int_field')
+
+def test_schema_cache():
+    for check in (check_revalidation, check_fallback, check_unusable_cache):
+        yield check_schema_cache, check
+
+
+def test_schema_pickling():
+    s = schema.SolrSchema(StringIO(schema_string))
+    pickled = pickle.dumps(s, pickle.HIGHEST_PROTOCOL)
+    # As if in another process, which hasn't read a schema.
+    field_type = type(s.fields['int_field'])
+    del vars(schema)[field_type.__name__]
+    s = pickle.loads(pickled)
+    assert_equal(type(s.fields['int_field']).__name__, field_type.__name__)
+    assert_equal(s.fields['int_field'].normalize('3'), 3)
+    assert s.default_field is s.fields['text_field']
+    assert_equal(s.fields['string_field'].multi_valued, True)
@@ -0,0 +1,203 @@
+from __future__ import absolute_import
+
+import json
+import Queue
+import threading
+import time
+
+import lxml.etree
+
+from .indexer import BufferedIndexer
+from .schema import SolrError
+from .sunburnt import SolrInterface
+from .test_sunburnt import MockConnection
+
+from nose.tools import assert_equal
+
+
+class UpdateMockConnection(MockConnection):
+    thread_safe = True
+
+    def __init__(self, status=200):
+        super(UpdateMockConnection, self).__init__()
+        self.status = status
+        self.batches = []
+        self.content_types = set()
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method == 'POST' and uri_obj.path.endswith('/update/'):
+            self.unblocked.wait()
+            ids = lxml.etree.fromstring(body).xpath("/add/doc/field[@name='int_field']/text()")
+        elif method == 'POST' and uri_obj.path.endswith('/update/json'):
+            self.unblocked.wait()
+            ids = [doc['int_field'] for doc in json.loads(body)]
+        else:
+            return
+        self.content_types.add(headers['Content-Type'])
+        self.batches.append([int(i) for i in ids])
+        return self.MockStatus(self.status), ''
+
+
+def make_docs(n, start=0):
+    return [{'int_field': i, 'text_field': 'text', 'string_field': 'string'}
+            for i in range(start, start + n)]
+
+
+def make_indexer(conn=None, **kwargs):
+    conn = conn or UpdateMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn)
+    return conn, BufferedIndexer(si, **kwargs)
+
+
+def test_flush_by_doc_count():
+    conn, indexer = make_indexer(max_docs=10, max_latency=60)
+    for doc in make_docs(25):
+        indexer.add(doc)
+    assert indexer.flush(5)
+    assert_equal(conn.batches, [range(10), range(10, 20), range(20, 25)])
+    stats = indexer.stats()
+    assert_equal((stats['docs_added'], stats['docs_sent'], stats['batches']), (25, 25, 3))
+    indexer.close()
+
+
+def test_flush_by_size():
+    conn, indexer = make_indexer(max_bytes=100, max_latency=60)
+    for doc in make_docs(3):
+        indexer.add(doc)
+    indexer.close()
+    assert_equal(conn.batches, [[0], [1], [2]])
+
+
+def test_flush_by_latency():
+    conn, indexer = make_indexer(max_latency=0.05)
+    indexer.add(make_docs(1)[0])
+    for i in range(100):
+        if conn.batches:
+            break
+        time.sleep(0.01)
+    assert_equal(conn.batches, [[0]])
+    indexer.close()
+
+
+def test_backpressure():
+    conn, indexer = make_indexer(max_docs=1, queue_size=2)
+    conn.unblocked.clear()
+    docs = make_docs(10)
+    try:
+        for doc in docs:
+            indexer.add(doc, timeout=0.05)
+    except Queue.Full:
+        pass
+    else:
+        assert False
+    conn.unblocked.set()
+    indexer.close()
+    # One document was being sent, and two were queued.
+    assert_equal(conn.batches, [[0], [1], [2]])
+
+
+def test_many_producers():
+    conn, indexer = make_indexer(max_docs=7, queue_size=10)
+    threads = [threading.Thread(target=lambda n=n: map(indexer.add, make_docs(20, n * 20)))
+               for n in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    indexer.close()
+    assert_equal(sorted(sum(conn.batches, [])), range(100))
+    assert all(len(batch) <= 7 for batch in conn.batches)
+
+
+def test_errors():
+    errors = []
+    conn, indexer = make_indexer(UpdateMockConnection(status=500), max_docs=2,
+                                 on_error=lambda e, docs: errors.append((e, docs)))
+    try:
+        indexer.add({'int_field': 1})
+    except SolrError:
+        pass
+    else:
+        assert False
+    docs = make_docs(3)
+    for doc in docs:
+        indexer.add(doc)
+    indexer.close()
+    assert_equal([d for e, d in errors], [docs[:2], docs[2:]])
+    assert all(isinstance(e, SolrError) for e, d in errors)
+    assert_equal(indexer.stats()['docs_failed'], 3)
+    try:
+        indexer.add(docs[0])
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def test_flush_after_close():
+    conn, indexer = make_indexer()
+    indexer.close()
+    try:
+        indexer.flush(timeout=1)
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def test_add_racing_close():
+    conn, indexer = make_indexer(max_docs=10)
+    added = []
+    def producer(start):
+        for doc in make_docs(1000, start):
+            try:
+                indexer.add(doc)
+            except ValueError:
+                return
+            added.append(doc['int_field'])
+    threads = [threading.Thread(target=producer, args=(n * 1000,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.01)
+    indexer.close()
+    for t in threads:
+        t.join()
+    # Every document which add() accepted was sent.
+    assert_equal(sorted(i for batch in conn.batches for i in batch), sorted(added))
+
+
+def check_add_chunking(docs, chunk, chunk_bytes, batches):
+    conn = UpdateMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn)
+    sizes = si.add(docs, chunk=chunk, chunk_bytes=chunk_bytes)
+    assert_equal(conn.batches, batches)
+    assert_equal([n for n, size in sizes], map(len, batches))
+    if chunk_bytes is not None:
+        assert all(size <= chunk_bytes for n, size in sizes if n > 1)
+
+def test_add_chunking():
+    small = make_docs(10)
+    large = [dict(doc, text_field='x' * 1000) for doc in make_docs(3, 10)]
+    for docs, chunk, chunk_bytes, batches in (
+        (small, 4, None, [range(4), range(4, 8), [8, 9]]),
+        (small, 100, 100000, [range(10)]),
+        (small, 4, 100000, [range(4), range(4, 8), [8, 9]]),
+        (small, 100, 500, [range(4), range(4, 8), [8, 9]]),
+        (small[:1], 100, 10, [[0]]),
+        (small[:4] + large + small[4:], 100, 1500, [range(4), [10], [11], [12, 4, 5, 6], [7, 8, 9]]),
+        ):
+        yield check_add_chunking, docs, chunk, chunk_bytes, batches
+
+
+def test_json_updates():
+    conn = UpdateMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn, update_format='json')
+    assert_equal(si.add(make_docs(5), chunk=2), [(2, 125), (2, 125), (1, 63)])
+    assert_equal(si.add(make_docs(3, 5), chunk_bytes=150), [(2, 125), (1, 63)])
+    with BufferedIndexer(si, max_docs=2) as indexer:
+        for doc in make_docs(3, 8):
+            indexer.add(doc)
+    assert_equal(conn.batches, [[0, 1], [2, 3], [4], [5, 6], [7], [8, 9], [10]])
+    assert_equal(conn.content_types, set(["application/json; charset=utf-8"]))
@@ -0,0 +1,87 @@
+from __future__ import absolute_import
+
+from .cache import ResultCache
+from .schema import SolrError
+from .sunburnt import SolrInterface
+from .test_cache import CountingMockConnection
+from .test_retry import FlakyMockConnection
+
+from nose.tools import assert_equal
+
+
+class Listener(object):
+    def __init__(self):
+        self.requests = []
+    def __call__(self, metrics):
+        self.requests.append(metrics)
+
+
+def make_interface(conn=None, **kwargs):
+    si = SolrInterface("http://test.example.com/", http_connection=conn or CountingMockConnection(),
+                       **kwargs)
+    listener = Listener()
+    si.add_listener(listener)
+    return si, listener.requests
+
+
+def test_search_metrics():
+    si, requests = make_interface()
+    si.query("*").paginate(rows=4).execute()
+    assert_equal(len(requests), 1)
+    m = requests[0]
+    assert_equal((m.handler, m.method, m.status, m.attempts, m.QTime, m.numFound, m.docs, m.error),
+                 ('select', 'GET', 200, 1, 0, 10, 4, None))
+    assert m.url.startswith("http://test.example.com/select/?")
+    assert_equal(sorted(m.timings), ['build', 'convert', 'http', 'parse'])
+    assert m.total >= sum(m.timings.values())
+    assert_equal(m.request_bytes, 0)
+    assert m.response_bytes > 0
+
+
+def test_update_metrics():
+    si, requests = make_interface()
+    docs = [{'int_field': i, 'text_field': 't', 'string_field': 's'} for i in range(25)]
+    si.add(docs, chunk=10)
+    si.commit()
+    assert_equal([(m.handler, m.method) for m in requests], [('update', 'POST')] * 4)
+    assert all('build' in m.timings for m in requests[:3])
+    assert_equal(sorted(requests[3].timings), ['http'])
+    assert requests[0].request_bytes > requests[2].request_bytes > 0
+
+
+def test_cached_search_metrics():
+    si, requests = make_interface(result_cache=ResultCache())
+    for i in range(2):
+        si.query("*").execute()
+    assert_equal([m.cached for m in requests], [False, True])
+    assert 'http' not in requests[1].timings
+
+
+def test_failed_request_metrics():
+    si, requests = make_interface(FlakyMockConnection([500]))
+    try:
+        si.query("*").execute()
+    except SolrError:
+        pass
+    assert_equal(len(requests), 1)
+    assert_equal(requests[0].status, 500)
+    assert isinstance(requests[0].error, SolrError)
+
+
+def test_stream_metrics():
+    si, requests = make_interface()
+    stream = si.query("*").stream()
+    assert_equal(requests, [])
+    assert_equal(len(list(stream)), 10)
+    assert_equal([m.handler for m in requests], ['select'])
+    assert requests[0].response_bytes > 0
+
+
+def test_broken_listener():
+    si, requests = make_interface()
+    def broken(metrics):
+        raise Exception("broken")
+    si.add_listener(broken)
+    assert_equal(len(si.query("*").execute()), 10)
+    si.remove_listener(broken)
+    assert_equal(len(requests), 1)
@@ -0,0 +1,156 @@
+from __future__ import absolute_import
+
+import datetime
+
+from .javabin import NamedList, SolrDocument, SolrDocumentList, dumps, loads
+from .schema import SolrSchema, solr_date
+from .sunburnt import SolrInterface
+from .test_sunburnt import MockConnection, MockResponse, StringIO, schema_string, xml_response
+
+from nose.tools import assert_equal
+
+
+# Values as Solr's JavaBinCodec writes them, after the version byte.
+value_samples = [
+    ("00", None),
+    ("01", True),
+    ("02", False),
+    ("03ff", -1),
+    ("040102", 258),
+    ("053ff8000000000000", 1.5),
+    ("0600000000", 0),
+    ("06ffffff85", -123),
+    ("45", 5),
+    ("5401", 20),
+    ("5f8f01", 2303),
+    ("070000010000000000", 2**40),
+    ("60", 0),
+    ("7f9a0b", 22959),
+    ("083f8ccccd", 1.1),
+    ("23616263", u"abc"),
+    ("22c3a9", u"\xe9"),
+    ("3f01" + "78" * 32, u"x" * 32),
+    ("8245222d2d", [5, u"--"]),
+    ("0d03616263", bytearray("abc")),
+    ("0e45460f", [5, 6]),
+    ("0a02216145" "21625f00", {u"a": 5, u"b": 15}),
+    ("c2e0236f6e6541e142", NamedList([(u"one", 1), (u"one", 2)])),
+    ("112161460f", NamedList([(u"a", 6)])),
+    ("12412161", u"a"),
+    ("1412345678123456781234567812345678", u"12345678-1234-5678-1234-567812345678"),
+    ]
+
+def check_decode(hex_string, value):
+    decoded = loads(("02" + hex_string).decode('hex'))
+    assert_equal(decoded, value)
+    assert_equal(type(decoded), type(value))
+
+def test_decode():
+    for hex_string, value in value_samples:
+        yield check_decode, hex_string, value
+
+
+def check_round_trip(value):
+    assert_equal(loads(dumps(value)), value)
+
+def test_round_trip():
+    for value in (
+        None, True, 0, -1, 14, 15, 2**31 - 1, 2**31, -2**63, 2**63 - 1, 0.1, -2.5e100,
+        u"", u"short", u"\u2603" * 100, bytearray(300),
+        [], [1, [2, [3]]], {u"k": [None]},
+        NamedList([(u"a", 1), (u"b", NamedList([(u"a", 2)])), (u"a", 3)]),
+        SolrDocumentList(2, 10, 0.5, [SolrDocument(id=u"1", n=[1, 2]), SolrDocument(id=u"2")]),
+        ):
+        yield check_round_trip, value
+
+
+def test_bad_messages():
+    for data in ("", "\x01\x00", "\x02", "\x02\x25ab", "\x02\x10", "\x02\x06\x00"):
+        try:
+            loads(data)
+        except ValueError:
+            pass
+        else:
+            assert False, repr(data)
+
+
+# A response, as Solr writes it: the header, and a result of two docs,
+# with field names written once and then referred to by number.
+recorded_response = (
+    "02"
+    "c2"                                    # NamedList of 2
+    "e02e" + "responseHeader".encode('hex') +
+    "c2"                                    # NamedList of 2
+    "e026" + "status".encode('hex') + "0600000000" +
+    "e025" + "QTime".encode('hex') + "45" +
+    "e028" + "response".encode('hex') +
+    "0c"                                    # SolrDocumentList
+    "83626008" "3fc00000"                   # numFound 2, start 0, maxScore 1.5
+    "82"                                    # 2 docs
+    "0ba3"                                  # doc of 3 fields
+    "e029" + "int_field".encode('hex') + "41" +
+    "e02c" + "string_field".encode('hex') + "8123" + "one".encode('hex') +
+    "e02a" + "date_field".encode('hex') + "0900000122a5a38950"
+    "0ba2"                                  # doc of 2 fields
+    "e5" "5401"
+    "e6" "8123" + "two".encode('hex')
+    ).decode('hex')
+
+def test_recorded_response():
+    schema = SolrSchema(StringIO(schema_string))
+    response = schema.parse_response(recorded_response, response_format='javabin')
+    assert_equal((response.status, response.QTime, response.params), (0, 5, None))
+    assert_equal((response.result.name, response.result.numFound, response.result.start),
+                 ('response', 2, 0))
+    assert_equal(response.result.docs[0]['int_field'], 1)
+    assert_equal(response.result.docs[0]['string_field'], (u'one',))
+    assert_equal(unicode(solr_date(response.result.docs[0]['date_field'])),
+                 u'2009-07-23T03:24:34Z')
+    assert_equal(response.result.docs[1], {'int_field': 20, 'string_field': (u'two',)})
+
+
+def test_same_as_xml():
+    schema = SolrSchema(StringIO(schema_string))
+    x = schema.parse_response(xml_response)
+    doc = lambda **fields: SolrDocument(fields)
+    j = schema.parse_response(dumps(NamedList([
+        ("responseHeader", NamedList([("status", 0), ("QTime", 5), ("params", NamedList([
+            ("q", "*:*"), ("fq", ["a", "b"])]))])),
+        ("response", SolrDocumentList(12, 0, 1.5, [
+            doc(int_field=1, string_field=["one", "uno"],
+                date_field=datetime.datetime(2009, 7, 23, 3, 24, 34), score=1.5),
+            doc(int_field=2, boolean_field=True, double_field=0.25)])),
+        ("facet_counts", NamedList([
+            ("facet_queries", NamedList([("int_field:[1 TO 2]", 2)])),
+            ("facet_fields", NamedList([("string_field", NamedList([("uno", 5), ("one", 3)]))])),
+            ("facet_dates", NamedList([("date_field", NamedList([
+                ("2009-07-23T00:00:00Z", 2), ("gap", "+1DAY"),
+                ("end", datetime.datetime(2009, 7, 24))]))]))])),
+        ("highlighting", NamedList([("1", NamedList([("string_field", ["<em>one</em>"])]))])),
+        ("moreLikeThis", NamedList([("1", SolrDocumentList(1, 0, None, [doc(int_field=3)]))])),
+        ])), response_format='javabin')
+    assert_equal((j.status, j.QTime, j.params), (x.status, x.QTime, x.params))
+    assert_equal(j.result.docs, x.result.docs)
+    assert_equal((j.result.numFound, j.result.start), (x.result.numFound, x.result.start))
+    for attr in ('facet_queries', 'facet_fields', 'facet_dates'):
+        assert_equal(getattr(j.facet_counts, attr), getattr(x.facet_counts, attr))
+    assert_equal(j.highlighting, x.highlighting)
+    assert_equal(j.more_like_this.docs, x.more_like_this.docs)
+
+
+class JavabinMockConnection(MockConnection):
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method == 'GET' and uri_obj.path.endswith('/select/') and params['wt'] == ['javabin']:
+            start = int(params["start"][0])
+            rows = int(params["rows"][0])
+            docs = [SolrDocument(doc) for doc in MockResponse.mock_docs[start:start+rows]]
+            return self.MockStatus(200), dumps(NamedList([
+                ("responseHeader", NamedList([("status", 0), ("QTime", 0)])),
+                ("response", SolrDocumentList(len(MockResponse.mock_docs), start, None, docs))]))
+
+def test_javabin_search():
+    si = SolrInterface("http://test.example.com/", response_format='javabin',
+                       http_connection=JavabinMockConnection())
+    response = si.query("*").paginate(start=3, rows=4).execute()
+    assert_equal((response.result.numFound, response.result.start), (10, 3))
+    assert_equal(list(response), MockResponse.mock_docs[3:7])
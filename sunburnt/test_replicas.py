@@ -0,0 +1,164 @@
+from __future__ import absolute_import
+
+import socket
+import time
+
+from .replicas import ReplicaSet
+from .sunburnt import SolrInterface
+from .test_sunburnt import PaginationMockConnection
+
+from nose.tools import assert_equal
+
+
+replica_urls = ["http://solr1.example.com/solr/", "http://solr2.example.com/solr",
+                "http://solr3.example.com/solr/"]
+
+
+class ReplicaMockConnection(PaginationMockConnection):
+    def __init__(self, down=()):
+        super(ReplicaMockConnection, self).__init__()
+        self.down = set(down)
+        self.hosts = []
+
+    def request(self, uri, *args, **kwargs):
+        host = uri.split("/")[2]
+        self.hosts.append(host)
+        if host in self.down:
+            raise socket.error("Connection refused")
+        return super(ReplicaMockConnection, self).request(uri, *args, **kwargs)
+
+
+class SlowReplicaMockConnection(ReplicaMockConnection):
+    """Replicas in slow refuse connections after delay seconds - or time
+    out, if they're given less time than that."""
+    supports_timeout = True
+
+    def __init__(self, slow=(), delay=1):
+        super(SlowReplicaMockConnection, self).__init__()
+        self.slow = set(slow)
+        self.delay = delay
+        self.timeouts = []
+
+    def request(self, uri, *args, **kwargs):
+        timeout = kwargs.pop('timeout', None)
+        host = uri.split("/")[2]
+        if host in self.slow:
+            self.hosts.append(host)
+            self.timeouts.append(timeout)
+            if timeout <= self.delay:
+                time.sleep(timeout)
+                raise socket.timeout("timed out")
+            time.sleep(self.delay)
+            raise socket.error("Connection refused")
+        return super(SlowReplicaMockConnection, self).request(uri, *args, **kwargs)
+
+
+class MockStatus(object):
+    def __init__(self, status):
+        self.status = status
+
+
+def test_round_robin():
+    conn = ReplicaMockConnection()
+    si = SolrInterface(replica_urls, http_connection=conn)
+    for i in range(6):
+        si.query("*").execute()
+    assert_equal(conn.hosts[1:], ["solr2.example.com", "solr3.example.com",
+                                  "solr1.example.com"] * 2)
+
+
+def test_least_outstanding():
+    replicas = ReplicaSet(replica_urls, strategy='least_outstanding')
+    busy = [replicas.choose(), replicas.choose()]
+    assert_equal(len(set(busy)), 2)
+    free = replicas.choose()
+    assert free not in busy
+    replicas.release(busy[0])
+    assert replicas.choose() is busy[0]
+
+
+def test_failover():
+    conn = ReplicaMockConnection(down=["solr2.example.com"])
+    replicas = ReplicaSet(replica_urls, probe_interval=None)
+    si = SolrInterface(replicas, http_connection=conn)
+    results = [si.query("*").execute() for i in range(4)]
+    assert_equal([len(r) for r in results], [10] * 4)
+    assert_equal(conn.hosts.count("solr2.example.com"), 1)
+    assert_equal([s['healthy'] for s in replicas.stats()], [True, False, True])
+    assert_equal(replicas.stats()[1]['failures'], 1)
+
+
+def test_all_replicas_down():
+    conn = ReplicaMockConnection()
+    si = SolrInterface(ReplicaSet(replica_urls, probe_interval=None), http_connection=conn)
+    conn.down = set(url.split("/")[2] for url in replica_urls)
+    try:
+        si.query("*").execute()
+    except socket.error:
+        pass
+    else:
+        assert False
+    assert_equal(sorted(conn.hosts[1:]), sorted(conn.down))
+
+
+def test_caller_deadline_does_not_fail_replicas():
+    conn = SlowReplicaMockConnection()
+    replicas = ReplicaSet(replica_urls, probe_interval=None)
+    si = SolrInterface(replicas, http_connection=conn)
+    conn.slow = set(url.split("/")[2] for url in replica_urls)
+    start = time.time()
+    try:
+        si.query("*").execute(timeout=0.3)
+    except socket.timeout:
+        pass
+    else:
+        assert False
+    assert time.time() - start < 0.5
+    assert_equal(len(conn.hosts[1:]), 1)
+    assert conn.timeouts[0] <= 0.3
+    assert_equal([s['healthy'] for s in replicas.stats()], [True, True, True])
+
+
+def test_failover_gets_what_is_left_of_the_deadline():
+    conn = SlowReplicaMockConnection(delay=0.1)
+    replicas = ReplicaSet(replica_urls, probe_interval=None)
+    si = SolrInterface(replicas, http_connection=conn)
+    conn.slow = set(url.split("/")[2] for url in replica_urls)
+    try:
+        si.query("*").execute(timeout=0.25)
+    except socket.timeout:
+        pass
+    else:
+        assert False
+    # Two replicas refused the request, and the third was given what
+    # remained of the time, which ran out.
+    assert_equal(len(conn.timeouts), 3)
+    for timeout, expected in zip(conn.timeouts, [0.25, 0.15, 0.05]):
+        assert expected - 0.03 < timeout <= expected
+    assert_equal(sorted(s['healthy'] for s in replicas.stats()), [False, False, True])
+
+
+def test_probe_readmits_replicas():
+    class Prober(object):
+        def request(self, uri):
+            if uri.startswith("http://solr1"):
+                raise socket.error("Connection refused")
+            return MockStatus(404 if uri.startswith("http://solr2") else 503), ''
+    replicas = ReplicaSet(replica_urls, probe_interval=None, probe_connection=Prober())
+    for i in range(3):
+        replicas.release(replicas.choose(), failed=True)
+    replicas.probe()
+    assert_equal([s['healthy'] for s in replicas.stats()], [False, True, False])
+
+
+def test_successful_request_readmits_replica():
+    conn = ReplicaMockConnection(down=["solr1.example.com"])
+    replicas = ReplicaSet(replica_urls[:1], probe_interval=None)
+    try:
+        SolrInterface(replicas, http_connection=conn)
+    except socket.error:
+        pass
+    assert_equal(replicas.stats()[0]['healthy'], False)
+    conn.down = set()
+    SolrInterface(replicas, http_connection=conn)
+    assert_equal(replicas.stats()[0]['healthy'], True)
@@ -0,0 +1,227 @@
+from __future__ import absolute_import
+
+import cgi
+import httplib
+import socket
+import time
+import urlparse
+
+from .retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+from .sunburnt import SolrInterface, SolrError
+from .replicas import ReplicaSet
+from .test_sunburnt import MockResponse, PaginationMockConnection
+
+from nose.tools import assert_equal
+
+
+class FlakyMockConnection(PaginationMockConnection):
+    """Fails each select with the given outcomes (an HTTP status or an
+    exception) before answering normally."""
+    def __init__(self, failures=()):
+        super(FlakyMockConnection, self).__init__()
+        self.failures = list(failures)
+        self.selects = []
+
+    def request(self, uri, *args, **kwargs):
+        if '/select/' in uri:
+            self.selects.append(uri)
+            if self.failures:
+                failure = self.failures.pop(0)
+                if isinstance(failure, Exception):
+                    raise failure
+                return self.MockStatus(failure), 'Service Unavailable'
+        return super(FlakyMockConnection, self).request(uri, *args, **kwargs)
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+    def __call__(self):
+        return self.now
+
+
+def check_delays(policy, delays):
+    assert_equal([policy.delay(n) for n in range(1, len(delays) + 1)], delays)
+
+def test_backoff():
+    check_delays(RetryPolicy(backoff=1, jitter=0), [1, 2, 4, 8, 10, 10])
+    check_delays(RetryPolicy(backoff=0.5, multiplier=3, max_backoff=100, jitter=0), [0.5, 1.5, 4.5, 13.5])
+    check_delays(RetryPolicy.from_retry_timeout(2), [2])
+
+def test_jitter():
+    policy = RetryPolicy(backoff=1, jitter=0.5)
+    delays = [policy.delay(3) for i in range(100)]
+    assert all(2 <= d <= 4 for d in delays)
+    assert len(set(delays)) > 1
+
+def test_retry_timeout_compatibility():
+    assert_equal(RetryPolicy.from_retry_timeout(-1).max_attempts, 1)
+    policy = RetryPolicy.from_retry_timeout(0)
+    assert_equal((policy.max_attempts, policy.retry_statuses), (2, frozenset()))
+
+
+def check_retries(policy, failures, n_selects, exception):
+    conn = FlakyMockConnection(failures)
+    si = SolrInterface("http://test.example.com/", http_connection=conn, retry_policy=policy)
+    try:
+        response = si.query("*").execute()
+    except exception:
+        pass
+    else:
+        assert exception is None
+        assert_equal(len(response), 10)
+    assert_equal(len(conn.selects), n_selects)
+
+def test_retries():
+    refused = socket.error("Connection refused")
+    no_wait = dict(backoff=0, jitter=0)
+    for policy, failures, n_selects, exception in (
+        (RetryPolicy(**no_wait), [503, 503], 3, None),
+        (RetryPolicy(**no_wait), [503, 503, 503], 3, SolrError),
+        (RetryPolicy(**no_wait), [refused, 503], 3, None),
+        (RetryPolicy(**no_wait), [refused] * 3, 3, socket.error),
+        (RetryPolicy(**no_wait), [500], 1, SolrError),
+        (RetryPolicy(retry_statuses=(500, 503), **no_wait), [500], 2, None),
+        (RetryPolicy(max_attempts=1, **no_wait), [refused], 1, socket.error),
+        (RetryPolicy.from_retry_timeout(0), [503], 1, SolrError),
+        (RetryPolicy.from_retry_timeout(0), [refused], 2, None),
+        ):
+        yield check_retries, policy, failures, n_selects, exception
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.clock = clock = Clock()
+    policy = RetryPolicy(max_attempts=1, circuit_breaker=breaker)
+    conn = FlakyMockConnection([503, 503, 503])
+    si = SolrInterface("http://test.example.com/", http_connection=conn, retry_policy=policy)
+    for i in range(2):
+        try:
+            si.query("*").execute()
+        except SolrError:
+            pass
+    assert breaker.is_open("http://test.example.com/")
+    # While the circuit is open, we fail without asking Solr.
+    try:
+        si.query("*").execute()
+    except CircuitOpenError:
+        pass
+    else:
+        assert False
+    assert_equal(len(conn.selects), 2)
+    # After the reset timeout, one trial request is let through; a
+    # failure reopens the circuit, a success closes it.
+    clock.now = 11
+    try:
+        si.query("*").execute()
+    except CircuitOpenError:
+        assert False
+    except SolrError:
+        pass
+    assert_equal(len(conn.selects), 3)
+    assert breaker.is_open("http://test.example.com/")
+    clock.now = 22
+    assert_equal(len(si.query("*").execute()), 10)
+    assert not breaker.is_open("http://test.example.com/")
+
+
+def test_circuit_breaker_closes_after_other_errors():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.clock = clock = Clock()
+    policy = RetryPolicy(max_attempts=1, circuit_breaker=breaker)
+    conn = FlakyMockConnection([socket.error("refused"), httplib.BadStatusLine("")])
+    si = SolrInterface("http://test.example.com/", http_connection=conn, retry_policy=policy)
+    for error, now in ((socket.error, 0), (httplib.BadStatusLine, 11)):
+        clock.now = now
+        try:
+            si.query("*").execute()
+        except error:
+            pass
+        else:
+            assert False
+    assert breaker.is_open("http://test.example.com/")
+    clock.now = 22
+    assert_equal(len(si.query("*").execute()), 10)
+    assert not breaker.is_open("http://test.example.com/")
+
+
+def test_circuit_breaker_per_replica():
+    breaker = CircuitBreaker(failure_threshold=1)
+    policy = RetryPolicy(max_attempts=1, circuit_breaker=breaker)
+    conn = FlakyMockConnection([503])
+    urls = ["http://solr1.example.com/solr/", "http://solr2.example.com/solr/"]
+    si = SolrInterface(ReplicaSet(urls), http_connection=conn, retry_policy=policy)
+    try:
+        si.query("*").execute()
+    except SolrError:
+        pass
+    assert_equal([breaker.is_open(url) for url in urls], [False, True])
+    # Requests carry on going to the replica whose circuit is closed.
+    for i in range(3):
+        si.query("*").execute()
+    assert all(url.startswith(urls[0]) for url in conn.selects[1:])
+
+
+class PartialMockResponse(MockResponse):
+    def xml_response(self):
+        return super(PartialMockResponse, self).xml_response().replace(
+            '<int name="QTime">0</int>', '<int name="QTime">0</int><bool name="partialResults">true</bool>')
+
+
+class PartialMockConnection(FlakyMockConnection):
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        return self.MockStatus(200), PartialMockResponse(0, 5).xml_response()
+
+
+def test_deadline_cuts_retries_short():
+    conn = FlakyMockConnection([503, 503])
+    policy = RetryPolicy(backoff=1, jitter=0)
+    si = SolrInterface("http://test.example.com/", http_connection=conn, retry_policy=policy)
+    t = time.time()
+    try:
+        si.query("*").execute(timeout=0.5)
+    except SolrError:
+        pass
+    else:
+        assert False
+    assert time.time() - t < 0.5
+    assert_equal(len(conn.selects), 1)
+
+
+def test_expired_deadline():
+    conn = FlakyMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn)
+    try:
+        si.query("*").execute(timeout=0)
+    except socket.timeout:
+        pass
+    else:
+        assert False
+    assert_equal(conn.selects, [])
+
+
+def check_time_allowed(kwargs, timeout, time_allowed):
+    conn = FlakyMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn)
+    si.search(q="*", timeout=timeout, **kwargs)
+    assert_equal(cgi.parse_qs(urlparse.urlparse(conn.selects[0]).query).get('timeAllowed'),
+                 time_allowed)
+
+def test_time_allowed():
+    for kwargs, timeout, time_allowed in (
+        ({}, None, None),
+        ({}, 2, ['2000']),
+        ({}, 0.0001, ['1']),
+        ({'timeAllowed': 500}, 2, ['500']),
+        ({'timeAllowed': 5000}, 2, ['2000']),
+        ):
+        yield check_time_allowed, kwargs, timeout, time_allowed
+
+
+def test_partial_results():
+    si = SolrInterface("http://test.example.com/", http_connection=FlakyMockConnection())
+    assert_equal(si.query("*").execute().partialResults, False)
+    si = SolrInterface("http://test.example.com/", http_connection=PartialMockConnection())
+    response = si.query("*").execute(timeout=1)
+    assert_equal((response.partialResults, len(response)), (True, 5))
+    assert_equal(si.query("*").stream(timeout=1).partialResults, True)
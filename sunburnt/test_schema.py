@@ -2,14 +2,19 @@ from __future__ import absolute_import
 
 import cStringIO as StringIO
 import datetime
+import json
 import uuid
 
+import lxml.etree
 import mx.DateTime
 import pytz
 
-from .schema import solr_date, SolrSchema, SolrError, SolrUpdate, SolrDelete
+from .schema import solr_date, DynamicFieldIndex, SolrSchema, SolrError, SolrUpdate, SolrJSONUpdate, \
+    SolrDelete
 from .search import LuceneQuery
 
+from nose.tools import assert_equal
+
 debug = False
 
 not_utc = pytz.timezone('Etc/GMT-3')
@@ -282,6 +287,23 @@ def test_update_serialization():
     for obj, xml_string in update_docs:
         yield check_update_serialization, s, obj, xml_string
 
+def check_json_update_serialization(s, obj, xml_string):
+    # The JSON update holds the same values as the XML one.
+    expected = []
+    for doc in lxml.etree.fromstring(xml_string):
+        fields = {}
+        for field in doc:
+            fields.setdefault(field.get('name'), []).append(field.text)
+        expected.append(fields)
+    docs = json.loads(str(SolrJSONUpdate(s, obj)))
+    assert_equal([dict((k, v if isinstance(v, list) else [v]) for k, v in doc.items())
+                  for doc in docs], expected)
+
+def test_json_update_serialization():
+    s = SolrSchema(StringIO.StringIO(good_schema))
+    for obj, xml_string in update_docs:
+        yield check_json_update_serialization, s, obj, xml_string
+
 bad_updates = [
     # Dictionary containing bad field name
     {"int_field":1, "text_field":"a", "my_arse":True},
@@ -291,9 +313,9 @@ bad_updates = [
     D(1),
     ]
 
-def check_broken_updates(s, obj):
+def check_broken_updates(s, obj, update_format):
     try:
-        SolrUpdate(s, obj)
+        s.make_update(obj, update_format)
     except SolrError:
         pass
     else:
@@ -301,8 +323,9 @@ def check_broken_updates(s, obj):
 
 def test_bad_updates():
     s = SolrSchema(StringIO.StringIO(good_schema))
-    for obj in bad_updates:
-        yield check_broken_updates, s, obj
+    for update_format in ('xml', 'json'):
+        for obj in bad_updates:
+            yield check_broken_updates, s, obj, update_format
 
 
 delete_docs = [
@@ -445,3 +468,60 @@ def test_uuid_data_understood_ok():
     solr_data = "12980286-591b-40c6-aa08-b4393a6d13b3"
     uuid_field = s.match_field("id")
     assert uuid_field.from_solr(solr_data) == uuid.UUID("12980286-591b-40c6-aa08-b4393a6d13b3")
+
+
+dynamic_fields_schema = """
+<schema name="timetric" version="1.1">
+  <types>
+    <fieldType name="string" class="solr.StrField"/>
+    <fieldType name="int" class="solr.IntField"/>
+  </types>
+  <fields>
+    <field name="id" type="int"/>
+    <dynamicField name="*_s" type="string"/>
+    <dynamicField name="attr_*" type="string"/>
+    <dynamicField name="*_i" type="int"/>
+    <dynamicField name="i_*" type="int"/>
+    <dynamicField name="*_count_i" type="int"/>
+    <dynamicField name="*_s" type="int"/>
+    <dynamicField name="*" type="string"/>
+  </fields>
+ </schema>
+"""
+
+def check_dynamic_field(name, pattern):
+    s = SolrSchema(StringIO.StringIO(dynamic_fields_schema))
+    assert_equal(s.match_field(name).name, pattern)
+
+def test_dynamic_field_precedence():
+    for name, pattern in (
+        ('id', 'id'),
+        ('title_s', '*_s'),
+        # The longest pattern wins, wherever it is in the schema...
+        ('attr_title_s', 'attr_*'),
+        ('attr_s', 'attr_*'),
+        ('page_count_i', '*_count_i'),
+        # ...or, of those as long, the first.
+        ('i_x_i', '*_i'),
+        ('i_s', '*_s'),
+        ('anything', '*'),
+        ('', '*'),
+        ):
+        yield check_dynamic_field, name, pattern
+
+def test_dynamic_field_index():
+    import pickle
+    s = SolrSchema(StringIO.StringIO(dynamic_fields_schema))
+    index = s.dynamic_field_index
+    index.memo_size = 3
+    names = ['attr_a', 'a_s', 'i_1', 'x_count_i', 'attr_a', 'none', 'a_s']
+    def scan(name):
+        matches = [f for f in s.dynamic_fields if f.match(name)]
+        return min(matches, key=lambda f: -len(f.name))
+    for name in names:
+        assert s.match_dynamic_field(name) is scan(name)
+        assert s.match_dynamic_field(name) is scan(name)
+        assert len(index.memo) <= 3
+    s.dynamic_field_index = index = DynamicFieldIndex(s.dynamic_fields[:2])
+    assert_equal(index.match('none'), None)
+    assert_equal(pickle.loads(pickle.dumps(index)).memo, {})
@@ -5,13 +5,15 @@ try:
 except ImportError:
     from StringIO import StringIO
 
-import cgi, datetime, urlparse
+import cgi, datetime, json, socket, urlparse, zlib
 
 from lxml.builder import E
 from lxml.etree import tostring
 import mx.DateTime
 
+from .schema import SolrError
 from .sunburnt import SolrInterface
+from .transport import decode_content, gzip_encode
 
 from nose.tools import assert_equal
 
@@ -96,6 +98,12 @@ class MockResponse(object):
             ] + self.extra_response_parts()
         return tostring(E.response(*response_portions))
 
+    def json_response(self):
+        return json.dumps({
+            'responseHeader': {'status': 0, 'QTime': 0},
+            'response': {'numFound': len(self.mock_docs), 'start': self.start,
+                         'docs': self.mock_docs[self.start:self.start+self.rows]}})
+
 
 class MockConnection(object):
     class MockStatus(object):
@@ -132,6 +140,8 @@ class PaginationMockConnection(MockConnection):
         if method == 'GET' and uri_obj.path.endswith('/select/'):
             start = int(params.get("start", [0])[0])
             rows = int(params.get("rows", [10])[0])
+            if params.get("wt") == ["json"]:
+                return self.MockStatus(200), MockResponse(start, rows).json_response()
             return self.MockStatus(200), MockResponse(start, rows).xml_response()
 
 
@@ -285,3 +295,626 @@ def check_mlt_query(i, o, E):
 def test_mlt_queries():
     for i, o, E in mlt_query_tests:
         yield check_mlt_query, i, o, E
+
+
+class CompressingMockConnection(PaginationMockConnection):
+    def request(self, uri, method='GET', body=None, headers=None):
+        if headers and headers.get("Content-Encoding") == "gzip":
+            body = decode_content(body, "gzip")
+        r, c = super(CompressingMockConnection, self).request(uri, method, body, headers)
+        if headers and "gzip" in headers.get("Accept-Encoding", ""):
+            r = MockHeaders(r.status, {"content-encoding": "gzip"})
+            c = gzip_encode(c)
+        return r, c
+
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method == 'POST' and uri_obj.path.endswith('/update/'):
+            return self.MockStatus(200), ''
+        return super(CompressingMockConnection, self)._handle_request(
+            uri_obj, params, method, body, headers)
+
+
+class MockHeaders(dict):
+    def __init__(self, status, headers):
+        super(MockHeaders, self).__init__(headers)
+        self.status = status
+
+
+def check_compression(compress_responses, compress_updates):
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=CompressingMockConnection(d),
+                       compress_responses=compress_responses, compress_updates=compress_updates)
+    si.conn.transfer_stats.reset()
+    response = si.query("*").execute()
+    assert_equal(len(response), 10)
+    assert_equal("Accept-Encoding" in d['headers'], compress_responses)
+    si.add({"int_field": 1, "text_field": "one", "string_field": ["one"] * 100})
+    assert_equal(d['headers'].get("Content-Encoding"), "gzip" if compress_updates else None)
+    assert d['body'].startswith("<add><doc>")
+
+    stats = si.conn.transfer_stats.as_dict()
+    assert_equal(stats['requests'], 2)
+    if compress_responses:
+        assert stats['response_wire_bytes'] < stats['response_bytes']
+    else:
+        assert_equal(stats['response_wire_bytes'], stats['response_bytes'])
+    if compress_updates:
+        assert stats['request_wire_bytes'] < stats['request_bytes']
+    else:
+        assert_equal(stats['request_wire_bytes'], stats['request_bytes'])
+
+def test_compression():
+    for compress_responses in (False, True):
+        for compress_updates in (False, True):
+            yield check_compression, compress_responses, compress_updates
+
+def test_decode_content():
+    data = "<response/>" * 10
+    assert_equal(decode_content(gzip_encode(data), "gzip"), data)
+    assert_equal(decode_content(zlib.compress(data), "deflate"), data)
+    assert_equal(decode_content(zlib.compress(data)[2:-4], "deflate"), data)
+    assert_equal(decode_content(data, None), data)
+
+
+class ClosingStringIO(object):
+    closed_count = 0
+    def __init__(self, content):
+        self.f = StringIO(content)
+    def read(self, *args):
+        return self.f.read(*args)
+    def close(self):
+        ClosingStringIO.closed_count += 1
+
+
+class StreamingMockConnection(PaginationMockConnection):
+    def request_stream(self, *args, **kwargs):
+        r, c = self.request(*args, **kwargs)
+        return r, ClosingStringIO(c)
+
+
+class MltMockResponse(MockResponse):
+    def extra_response_parts(self):
+        return [E.lst({'name':'moreLikeThis'},
+            E.result({'name':'0', 'numFound':'1', 'start':'0'},
+                self.xmlify_doc({'int_field':100, 'string_field':'hundred'})))]
+
+
+class MltStreamingMockConnection(StreamingMockConnection):
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        return self.MockStatus(200), MltMockResponse(0, 10).xml_response()
+
+
+class IntFieldHolder(object):
+    def __init__(self, int_field, string_field):
+        self.int_field = int_field
+
+
+def check_stream(connection_class, p_args, constructor, int_fields):
+    si = SolrInterface("http://test.example.com/", http_connection=connection_class())
+    closed_count = ClosingStringIO.closed_count
+    stream = si.query("*").paginate(*p_args).stream(constructor)
+    assert_equal((stream.name, stream.numFound, stream.start, stream.status),
+                 ("response", 10, p_args[0] or 0, 0))
+    if constructor is None:
+        assert_equal([d['int_field'] for d in stream], int_fields)
+    else:
+        assert_equal([d.int_field for d in stream], int_fields)
+    if hasattr(connection_class, 'request_stream'):
+        assert_equal(ClosingStringIO.closed_count, closed_count + 1)
+
+def test_stream():
+    for connection_class, p_args, constructor, int_fields in (
+        (StreamingMockConnection, (None, None), None, range(10)),
+        (StreamingMockConnection, (3, 4), None, [3, 4, 5, 6]),
+        (StreamingMockConnection, (8, 4), IntFieldHolder, [8, 9]),
+        (PaginationMockConnection, (2, 2), None, [2, 3]),
+        (MltStreamingMockConnection, (None, None), None, range(10)),
+        ):
+        yield check_stream, connection_class, p_args, constructor, int_fields
+
+def test_stream_compressed():
+    class CompressingStreamingMockConnection(CompressingMockConnection, StreamingMockConnection):
+        pass
+    si = SolrInterface("http://test.example.com/", compress_responses=True,
+                       http_connection=CompressingStreamingMockConnection())
+    si.conn.transfer_stats.reset()
+    assert_equal([d['int_field'] for d in si.query("*").stream()], range(10))
+    stats = si.conn.transfer_stats.as_dict()
+    assert_equal(stats['requests'], 1)
+    assert 0 < stats['response_wire_bytes'] < stats['response_bytes']
+
+
+
+class ExportMockConnection(StreamingMockConnection):
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method == 'GET' and uri_obj.path.endswith('/export'):
+            docs = [{'int_field': d['int_field'], 'string_field': [d['string_field']],
+                     'boolean_field': d['int_field'] % 2 == 0} for d in MockResponse.mock_docs]
+            fields = params['fl'][0].split(',')
+            docs = [dict((k, v) for k, v in doc.items() if k in fields) for doc in docs]
+            # Laid out as Solr lays it out, a document per line.
+            return self.MockStatus(200), ('{"responseHeader": {"status": 0},\n'
+                '"response":{"numFound":%s, "docs":[\n%s]}}' % (
+                len(docs), ",\n".join(json.dumps(doc) for doc in docs)))
+
+def test_export():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=ExportMockConnection(d))
+    closed_count = ClosingStringIO.closed_count
+    query = si.query(text_field="hello").filter(boolean_field=True)
+    stream = query.field_limit(["int_field", "string_field"]).export(
+        sort=["-boolean_field", "int_field"])
+    assert_equal((stream.numFound, stream.status), (10, 0))
+    docs = list(stream)
+    assert_equal(docs[1], {'int_field': 1, 'string_field': (u'one',)})
+    assert_equal([doc['int_field'] for doc in docs], range(10))
+    assert_equal(ClosingStringIO.closed_count, closed_count + 1)
+    assert_equal(d['params'], {'q': ['text_field:hello'], 'fq': ['boolean_field:true'],
+                               'fl': ['int_field,string_field'],
+                               'sort': ['boolean_field desc, int_field asc']})
+
+    stream = si.query("*").export(fields="int_field", constructor=lambda int_field: int_field)
+    assert_equal(list(stream), range(10))
+    assert_equal((d['params']['fl'], d['params']['sort']), (['int_field'], ['int_field asc']))
+
+    try:
+        si.query("*").export()
+    except SolrError:
+        pass
+    else:
+        assert False
+
+
+class BufferedExportMockConnection(PaginationMockConnection):
+    """Answers exports, but (like httplib2) can't stream them."""
+    _handle_request = ExportMockConnection.__dict__['_handle_request']
+
+def test_export_without_streaming_warns():
+    import warnings
+    si = SolrInterface("http://test.example.com/",
+                       http_connection=BufferedExportMockConnection())
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        docs = list(si.query("*").export(fields="int_field"))
+    assert_equal(len(docs), 10)
+    assert_equal(len(caught), 1)
+    assert "memory" in str(caught[0].message)
+
+
+class CountingStringIO(ClosingStringIO):
+    def __init__(self, content):
+        super(CountingStringIO, self).__init__(content)
+        self.bytes_read = 0
+    def read(self, *args):
+        data = super(CountingStringIO, self).read(*args)
+        self.bytes_read += len(data)
+        return data
+
+def test_export_stream():
+    from .schema import SolrExportStream, SolrSchema
+    schema = SolrSchema(StringIO(schema_string))
+    docs = [{'int_field': i, 'text_field': u'caf\xe9 %s' % i} for i in range(1000)]
+    msg = '{"responseHeader": {"status": 0},\n "response": {"numFound": 1000, "docs": %s}}' % (
+        json.dumps(docs, indent=1))
+    for read_size in (1, 7, 65536):
+        f = CountingStringIO(msg)
+        stream = type('SmallReadExportStream', (SolrExportStream,), {'read_size': read_size})(
+            schema, f)
+        assert_equal(stream.numFound, 1000)
+        first = next(iter(stream))
+        assert_equal(first, docs[0])
+        if read_size < 65536:
+            # Only as much has been read as was needed.
+            assert f.bytes_read < 200
+        assert_equal(list(stream), docs[1:])
+
+    for msg, error in (
+        ('{"responseHeader": {"status": 0}, "response": {"numFound": 0, "docs": []}}', None),
+        ('{"responseHeader": {"status": 0}, "response": {"numFound": 1, "docs": [{"int_f', SolrError),
+        ('{"responseHeader": {"status": 0}, "response": {"numFound": 2, "docs": [{"int_field": 1},'
+         '{"EXCEPTION": "Field text_field has no docValues"}]}}', SolrError),
+        ('{"responseHeader": {"status": 400}, "error": {"msg": "bad sort"}}', ValueError),
+        ):
+        try:
+            assert_equal(list(SolrExportStream(schema, StringIO(msg))), [])
+        except Exception, e:
+            assert error is not None and isinstance(e, error), e
+        else:
+            assert error is None
+
+
+def test_json_pagination():
+    d = {}
+    si = SolrInterface("http://test.example.com/", response_format='json',
+                       http_connection=PaginationMockConnection(d))
+    response = si.query("*").paginate(start=3, rows=4).execute()
+    assert_equal((d['params']['wt'], d['params']['json.nl']), (['json'], ['arrarr']))
+    assert_equal((response.result.name, response.result.numFound, response.result.start),
+                 ("response", 10, 3))
+    assert_equal(list(response), MockResponse.mock_docs[3:7])
+
+
+
+class CursorMockConnection(MockConnection):
+    """Pages through the mock docs with cursor marks like "at:3"."""
+    supports_timeout = True
+
+    def __init__(self, tracking_dict=None):
+        super(CursorMockConnection, self).__init__(tracking_dict)
+        self.cursor_marks = []
+        self.timeouts = []
+
+    def request(self, uri, method='GET', body=None, headers=None, timeout=None):
+        self.timeouts.append(timeout)
+        return super(CursorMockConnection, self).request(uri, method, body, headers)
+
+    def _handle_request(self, uri_obj, params, method, body, headers):
+        if method == 'GET' and uri_obj.path.endswith('/select/'):
+            assert 'start' not in params
+            # As Solr does, refuse a cursor with a timeAllowed.
+            if 'timeAllowed' in params:
+                return self.MockStatus(400), "Can not search using both cursorMark and timeAllowed"
+            assert 'int_field' in params['sort'][0]
+            cursor_mark = params['cursorMark'][0]
+            self.cursor_marks.append(cursor_mark)
+            start = 0 if cursor_mark == '*' else int(cursor_mark[3:])
+            response = MockResponse(start, int(params['rows'][0]))
+            docs = response.mock_docs[start:start+response.rows]
+            next_cursor_mark = 'at:%s' % (start + len(docs)) if docs else cursor_mark
+            if params.get('wt') == ['json']:
+                msg = json.loads(response.json_response())
+                msg['nextCursorMark'] = next_cursor_mark
+                return self.MockStatus(200), json.dumps(msg)
+            response.extra_response_parts = lambda: [E.str({'name': 'nextCursorMark'},
+                                                           next_cursor_mark)]
+            return self.MockStatus(200), response.xml_response()
+
+def check_iter_cursor(response_format, page_size, rows, ids, cursor_marks):
+    conn = CursorMockConnection()
+    si = SolrInterface("http://test.example.com/", response_format=response_format,
+                       http_connection=conn)
+    query = si.query("*").sort_by("-text_field").sort_by("int_field")
+    if rows is not None:
+        query = query.paginate(rows=rows)
+    docs = query.iter_cursor(page_size=page_size)
+    # Nothing is fetched until the first doc is asked for.
+    assert_equal(conn.cursor_marks, [])
+    assert_equal([doc['int_field'] for doc in docs], ids)
+    assert_equal(conn.cursor_marks, cursor_marks)
+
+def test_iter_cursor():
+    for response_format in ('xml', 'json'):
+        yield check_iter_cursor, response_format, 4, None, range(10), ['*', 'at:4', 'at:8', 'at:10']
+        yield check_iter_cursor, response_format, 5, None, range(10), ['*', 'at:5', 'at:10']
+        yield check_iter_cursor, response_format, 4, 6, range(6), ['*', 'at:4']
+
+def test_iter_cursor_timeout():
+    conn = CursorMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn)
+    conn.timeouts = []
+    query = si.query("*").sort_by("int_field")
+    assert_equal(len(list(query.iter_cursor(page_size=5, timeout=2))), 10)
+    # Each page still has a socket timeout, but doesn't ask Solr for a
+    # timeAllowed.
+    assert_equal(conn.cursor_marks, ['*', 'at:5', 'at:10'])
+    assert_equal(len(conn.timeouts), 3)
+    assert all(1 < timeout <= 2 for timeout in conn.timeouts)
+    params = si.time_allowed([('cursorMark', '*'), ('q', '*')], 2)
+    assert_equal(params, [('cursorMark', '*'), ('q', '*')])
+
+def test_iter_cursor_errors():
+    si = SolrInterface("http://test.example.com/", http_connection=CursorMockConnection())
+    for query in (si.query("*"), si.query("*").sort_by("text_field"),
+                  si.query("*").sort_by("int_field").paginate(start=5)):
+        try:
+            list(query.iter_cursor())
+        except SolrError:
+            pass
+        else:
+            assert False
+
+
+xml_response = """<response>
+<lst name="responseHeader"><int name="status">0</int><int name="QTime">5</int>
+  <lst name="params"><str name="q">*:*</str><arr name="fq"><str>a</str><str>b</str></arr></lst>
+</lst>
+<result name="response" numFound="12" start="0" maxScore="1.5">
+  <doc><int name="int_field">1</int><arr name="string_field"><str>one</str><str>uno</str></arr>
+    <date name="date_field">2009-07-23T03:24:34Z</date><float name="score">1.5</float></doc>
+  <doc><int name="int_field">2</int><bool name="boolean_field">true</bool>
+    <double name="double_field">0.25</double></doc>
+</result>
+<lst name="facet_counts">
+  <lst name="facet_queries"><int name="int_field:[1 TO 2]">2</int></lst>
+  <lst name="facet_fields"><lst name="string_field"><int name="uno">5</int><int name="one">3</int></lst></lst>
+  <lst name="facet_dates"><lst name="date_field"><int name="2009-07-23T00:00:00Z">2</int>
+    <str name="gap">+1DAY</str><date name="end">2009-07-24T00:00:00Z</date></lst></lst>
+</lst>
+<lst name="highlighting"><lst name="1"><arr name="string_field"><str>&lt;em&gt;one&lt;/em&gt;</str></arr></lst></lst>
+<lst name="moreLikeThis"><result name="1" numFound="1" start="0">
+  <doc><int name="int_field">3</int></doc></result></lst>
+</response>"""
+
+json_response = json.dumps({
+    "responseHeader": {"status": 0, "QTime": 5, "params": {"q": "*:*", "fq": ["a", "b"]}},
+    "response": {"numFound": 12, "start": 0, "maxScore": 1.5, "docs": [
+        {"int_field": 1, "string_field": ["one", "uno"], "date_field": "2009-07-23T03:24:34Z",
+         "score": 1.5},
+        {"int_field": 2, "boolean_field": True, "double_field": 0.25}]},
+    "facet_counts": {
+        "facet_queries": {"int_field:[1 TO 2]": 2},
+        "facet_fields": {"string_field": [["uno", 5], ["one", 3]]},
+        "facet_dates": {"date_field": {"2009-07-23T00:00:00Z": 2, "gap": "+1DAY",
+                                       "end": "2009-07-24T00:00:00Z"}}},
+    "highlighting": [["1", {"string_field": ["<em>one</em>"]}]],
+    "moreLikeThis": [["1", {"numFound": 1, "start": 0, "docs": [{"int_field": 3}]}]]})
+
+def test_json_response_parsing():
+    from .schema import SolrSchema
+    schema = SolrSchema(StringIO(schema_string))
+    x = schema.parse_response(xml_response)
+    j = schema.parse_response(json_response, response_format='json')
+    for response in (x, j):
+        assert_equal((response.status, response.QTime, response.partialResults), (0, 5, False))
+        assert_equal(sorted(response.params), [('fq', ['a', 'b']), ('q', '*:*')])
+        assert_equal(response.result.docs, x.result.docs)
+        assert_equal(response.result.docs[0]['string_field'], ('one', 'uno'))
+        assert_equal(response.facet_counts.facet_fields,
+                     {'string_field': [('uno', 5), ('one', 3)]})
+        assert_equal(response.facet_counts.facet_queries, [('int_field:[1 TO 2]', 2)])
+        assert_equal(sorted(dict(response.facet_counts.facet_dates)['date_field']),
+                     sorted(dict(x.facet_counts.facet_dates)['date_field']))
+        assert_equal(response.highlighting, {'1': {'string_field': ['<em>one</em>']}})
+        assert_equal(response.more_like_this.docs, [{'int_field': 3}])
+        assert_equal(response.interesting_terms, None)
+
+
+def test_lazy_docs():
+    from .schema import LazyDocument, SolrSchema
+    schema = SolrSchema(StringIO(schema_string))
+    x = schema.parse_response(xml_response)
+    for response_format, msg in (('xml', xml_response), ('json', json_response)):
+        response = schema.parse_response(msg, response_format=response_format, lazy_docs=True)
+        doc = response.result.docs[0]
+        assert isinstance(doc, LazyDocument)
+        assert_equal(sorted(doc), ['date_field', 'int_field', 'score', 'string_field'])
+        # Only what's looked at is converted.
+        assert_equal(doc['string_field'], ('one', 'uno'))
+        assert_equal(doc.values.keys(), ['string_field'])
+        assert 'date_field' in doc and 'text_field' not in doc
+        assert_equal(doc.values.keys(), ['string_field'])
+        assert_equal(response.result.docs, x.result.docs)
+        assert_equal(dict(response.more_like_this.docs[0]), {'int_field': 3})
+        assert_equal(type(dict(doc)), dict)
+
+        copy = doc.copy()
+        copy['solr_highlights'] = {}
+        del copy['score']
+        assert_equal(sorted(copy), ['date_field', 'int_field', 'solr_highlights', 'string_field'])
+        assert_equal(len(copy), 4)
+        assert_equal(len(doc), 4)
+
+    # A field Solr shouldn't have sent is only noticed if it is looked at.
+    doc = LazyDocument(schema, {'int_field': '1', 'no_such_field': 'x'})
+    assert_equal(doc['int_field'], 1)
+    try:
+        doc['no_such_field']
+    except SolrError:
+        pass
+    else:
+        assert False
+
+
+def test_lazy_docs_search():
+    si = SolrInterface("http://test.example.com/", lazy_docs=True,
+                       http_connection=PaginationMockConnection())
+    response = si.query("*").paginate(start=2, rows=3).execute()
+    assert_equal(list(response), MockResponse.mock_docs[2:5])
+    docs = si.query("*").paginate(rows=2).execute(constructor=IntFieldHolder)
+    assert_equal([doc.int_field for doc in docs], [0, 1])
+
+
+def test_records():
+    import pickle
+    from .schema import SolrRecord, SolrSchema, record_class
+    schema = SolrSchema(StringIO(schema_string))
+    fields = ['boolean_field', 'date_field', 'double_field', 'int_field', 'score',
+              'string_field', 'text_field']
+    cls = record_class(fields)
+    assert cls is record_class(tuple(fields))
+    x = schema.parse_response(xml_response)
+    for response_format, msg in (('xml', xml_response), ('json', json_response)):
+        response = schema.parse_response(msg, response_format=response_format, record_class=cls)
+        record = response.result.docs[0]
+        assert isinstance(record, SolrRecord)
+        assert_equal(record._asdict(), x.result.docs[0])
+        assert_equal((record.int_field, record['string_field'], record.text_field),
+                     (1, ('one', 'uno'), None))
+        assert_equal((record.get('text_field', 'none'), record.get('no_such_field')),
+                     ('none', None))
+        assert_equal(record[3], 1)
+        assert_equal(pickle.loads(pickle.dumps(record)), record)
+        assert_equal(response.more_like_this.docs[0].int_field, 3)
+    try:
+        schema.parse_response(xml_response, record_class=record_class(['int_field']))
+    except SolrError:
+        pass
+    else:
+        assert False
+
+    # Dynamic fields are added to those of the schema.
+    schema = SolrSchema(StringIO(schema_string.replace(
+        '</fields>', '<dynamicField name="*_s" type="string"/></fields>')))
+    cls = record_class(sorted(schema.fields) + ['score'], dynamic=True)
+    for response_format, msg in (
+            ('xml', xml_response.replace('<int name="int_field">2</int>',
+                                         '<int name="int_field">2</int><str name="tag_s">x</str>')),
+            ('json', json_response.replace('"int_field": 2', '"int_field": 2, "tag_s": "x"'))):
+        docs = schema.parse_response(msg, response_format=response_format,
+                                     record_class=cls).result.docs
+        assert_equal(docs[1]._fields[-3:], ('tag_s', 'text_field', 'score'))
+        assert_equal((docs[0].tag_s, docs[1].tag_s, docs[0].score), (None, 'x', 1.5))
+
+
+def test_record_classes_are_limited():
+    from . import schema
+    max_record_classes = schema.max_record_classes
+    schema.max_record_classes = 10
+    try:
+        classes = [schema.record_class(['int_field', 'field_%s_s' % i]) for i in range(25)]
+        assert_equal(len(schema.record_classes), 10)
+        # The most recently used are kept.
+        assert schema.record_class(['int_field', 'field_24_s']) is classes[24]
+        assert schema.record_class(['int_field', 'field_0_s']) is not classes[0]
+    finally:
+        schema.max_record_classes = max_record_classes
+
+
+def test_results_as_records():
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=PaginationMockConnection(d))
+    query = si.query("*").field_limit(["int_field", "string_field"]).results_as_records()
+    response = query.paginate(start=2, rows=3).execute()
+    assert_equal([(r.int_field, r.string_field) for r in response],
+                 [(2, 'two'), (3, 'three'), (4, 'four')])
+    assert_equal(d['params']['fl'], ['int_field,string_field'])
+    records = list(si.query("*").results_as_records().paginate(rows=2).execute())
+    assert_equal(records[1]._fields, tuple(sorted(si.schema.fields)))
+    assert_equal(records[1]._asdict(), MockResponse.mock_docs[1])
+    # Records can't be made by a constructor, or highlighted.
+    query = si.query("*").results_as_records()
+    for f in (lambda: query.execute(constructor=IntFieldHolder),
+              lambda: query.results_as(IntFieldHolder).execute(),
+              lambda: query.highlight("string_field").execute(),
+              lambda: query.stream(), lambda: query.export(fields="int_field")):
+        try:
+            f()
+        except ValueError:
+            pass
+        else:
+            assert False
+    # Asking for the options doesn't add score to the fields again.
+    query = si.query("*").field_limit("int_field", score=True).results_as_records()
+    query.options()
+    assert_equal(query.record_class()._fields, ('int_field', 'score'))
+
+
+def test_columns():
+    import numpy
+    from .columnar import MultiValuedColumn, SolrColumns
+    from .schema import SolrSchema
+    schema = SolrSchema(StringIO(schema_string))
+    for response_format, msg in (('xml', xml_response), ('json', json_response)):
+        response = schema.parse_response(msg, response_format=response_format,
+                                         record_class=SolrColumns)
+        columns = response.result.docs
+        assert isinstance(columns, SolrColumns)
+        assert_equal(columns.rows, 2)
+        assert_equal(sorted(columns), ['boolean_field', 'date_field', 'double_field',
+                                       'int_field', 'score', 'string_field'])
+        # Every document has an int_field, so it isn't masked.
+        assert_equal(type(columns['int_field']), numpy.ndarray)
+        assert_equal(columns['int_field'].dtype, numpy.int32)
+        assert_equal(list(columns['int_field']), [1, 2])
+        assert_equal(columns['double_field'].dtype, numpy.float64)
+        assert_equal(list(columns['double_field'].mask), [True, False])
+        assert_equal(columns['double_field'][1], 0.25)
+        assert_equal(columns['score'].dtype, numpy.float64)
+        assert_equal(columns['score'][0], 1.5)
+        assert_equal(columns['boolean_field'].dtype, numpy.bool_)
+        assert_equal(list(columns['boolean_field'].filled(False)), [False, True])
+        assert_equal(columns['date_field'].dtype, numpy.dtype('datetime64[ms]'))
+        assert_equal(columns['date_field'][0], numpy.datetime64('2009-07-23T03:24:34', 'ms'))
+        assert columns['date_field'].mask[1]
+        strings = columns['string_field']
+        assert isinstance(strings, MultiValuedColumn)
+        assert_equal(list(strings.values), ['one', 'uno'])
+        assert_equal(list(strings.offsets), [0, 2, 2])
+        assert_equal(list(strings.row(0)), ['one', 'uno'])
+        assert_equal(len(strings.row(1)), 0)
+        assert_equal(list(response.more_like_this.docs['int_field']), [3])
+
+        copy = columns.copy()
+        copy['int_field'][0] = 5
+        assert_equal(columns['int_field'][0], 1)
+        assert_equal(copy.rows, 2)
+
+    try:
+        schema.parse_response(json.dumps({
+            "responseHeader": {"status": 0, "QTime": 0},
+            "response": {"numFound": 1, "start": 0, "docs": [{"int_field": "x"}]}}),
+            response_format='json', record_class=SolrColumns)
+    except SolrError:
+        pass
+    else:
+        assert False
+
+
+def test_results_as_columns():
+    from .cache import ResultCache
+    d = {}
+    si = SolrInterface("http://test.example.com/", http_connection=PaginationMockConnection(d),
+                       result_cache=ResultCache())
+    query = si.query("*").results_as_columns()
+    columns = query.paginate(start=2, rows=3).execute().result.docs
+    assert_equal(columns.rows, 3)
+    assert_equal(list(columns['int_field']), [2, 3, 4])
+    assert_equal(list(columns['string_field'].values), ['two', 'three', 'four'])
+    assert_equal(list(columns['string_field'].offsets), [0, 1, 2, 3])
+    # Cached columns aren't mixed up with cached dicts, or records.
+    cached = query.paginate(start=2, rows=3).execute().result.docs
+    assert cached is not columns
+    assert_equal(list(cached['int_field']), [2, 3, 4])
+    docs = si.query("*").paginate(start=2, rows=3).execute().result.docs
+    assert_equal(docs, MockResponse.mock_docs[2:5])
+    records = si.query("*").results_as_records().results_as_columns()
+    assert_equal(records.paginate(rows=1).execute().result.docs.rows, 1)
+    try:
+        list(query.sort_by("int_field").iter_cursor())
+    except SolrError:
+        pass
+    else:
+        assert False
+    for f in (lambda: query.execute(constructor=IntFieldHolder),
+              lambda: query.highlight("string_field").execute(),
+              lambda: query.stream(), lambda: query.export(fields="int_field")):
+        try:
+            f()
+        except ValueError:
+            pass
+        else:
+            assert False
+
+
+class UnreliableSchemaMockConnection(PaginationMockConnection):
+    def __init__(self):
+        super(UnreliableSchemaMockConnection, self).__init__()
+        self.schema_requests = 0
+        self.down = False
+
+    def request(self, uri, *args, **kwargs):
+        if 'admin/file' in uri:
+            self.schema_requests += 1
+            if self.down:
+                raise socket.error("Connection refused")
+        return super(UnreliableSchemaMockConnection, self).request(uri, *args, **kwargs)
+
+
+def test_lazy_schema():
+    conn = UnreliableSchemaMockConnection()
+    conn.down = True
+    si = SolrInterface("http://test.example.com/", http_connection=conn, lazy_schema=True)
+    assert_equal(conn.schema_requests, 0)
+    try:
+        si.query("*")
+    except socket.error:
+        pass
+    else:
+        assert False
+    conn.down = False
+    response = si.query("*").paginate(rows=2).execute()
+    assert_equal(list(response), MockResponse.mock_docs[:2])
+    si.query("*").execute()
+    assert_equal(conn.schema_requests, 2)
+    si = SolrInterface("http://test.example.com/", http_connection=conn)
+    assert_equal(conn.schema_requests, 3)
@@ -0,0 +1,209 @@
+from __future__ import absolute_import
+
+import BaseHTTPServer
+import SocketServer
+import errno
+import httplib
+import socket
+import StringIO
+import threading
+import time
+import zlib
+
+from .transport import PooledHttp, ResponseStream, gzip_encode
+
+from nose.tools import assert_equal
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        body = self.path
+        if self.path.endswith("slow"):
+            time.sleep(0.5)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path.endswith("close"):
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        BaseHTTPServer.HTTPServer.__init__(self, *args, **kwargs)
+        self.paths = []
+
+
+class TestPooledHttp(object):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={"poll_interval": 0.01})
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = "http://127.0.0.1:%s" % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        h = PooledHttp()
+        for i in range(3):
+            r, c = h.request("%s/select/?q=%s" % (self.url, i))
+            assert_equal(r.status, 200)
+            assert_equal(r['content-type'], "text/plain")
+            assert_equal(c, "/select/?q=%s" % i)
+        stats = h.stats()
+        assert_equal((stats['requests'], stats['created'], stats['reused']), (3, 1, 2))
+        assert_equal((stats['idle'], stats['in_use'], stats['hosts']), (1, 0, 1))
+        h.close()
+
+    def test_post_body(self):
+        h = PooledHttp()
+        r, c = h.request(self.url + "/update/", method="POST", body="<commit/>",
+                         headers={"Content-Type": "text/xml"})
+        assert_equal(c, "<commit/>")
+
+    def test_connection_close_is_respected(self):
+        h = PooledHttp()
+        h.request(self.url + "/close")
+        stats = h.stats()
+        assert_equal((stats['idle'], stats['discarded']), (0, 1))
+
+    def test_idle_connections_are_evicted(self):
+        h = PooledHttp(idle_timeout=0.01)
+        h.request(self.url + "/")
+        time.sleep(0.05)
+        h.request(self.url + "/")
+        stats = h.stats()
+        assert_equal((stats['created'], stats['reused'], stats['evicted']), (2, 0, 1))
+
+    def test_pool_size_limits_idle_connections(self):
+        h = PooledHttp(pool_size=2)
+        pool = h.pool_for("http", "127.0.0.1", self.server.server_port)
+        conns = [pool.get()[0] for i in range(3)]
+        for conn in conns:
+            pool.put(conn)
+        stats = h.stats()
+        assert_equal((stats['idle'], stats['discarded'], stats['in_use']), (2, 1, 0))
+
+    def test_concurrent_requests(self):
+        h = PooledHttp(pool_size=4, block=True)
+        results = {}
+        def worker(n):
+            results[n] = h.request("%s/%s" % (self.url, n))[1]
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert_equal(results, dict((n, "/%s" % n) for n in range(20)))
+        stats = h.stats()
+        assert stats['created'] <= 4
+        assert_equal((stats['requests'], stats['in_use']), (20, 0))
+
+    def test_per_request_timeout(self):
+        h = PooledHttp(timeout=5)
+        try:
+            h.request(self.url + "/slow", timeout=0.1)
+        except socket.timeout:
+            pass
+        else:
+            assert False
+        assert_equal(h.stats()['discarded'], 1)
+        h.request(self.url + "/fast", timeout=0.1)
+        conn, _ = h.pool_for("http", "127.0.0.1", self.server.server_port).idle[-1]
+        assert_equal(conn.sock.gettimeout(), 0.1)
+        r, c = h.request(self.url + "/slow")
+        assert_equal(c, "/slow")
+        assert_equal(conn.sock.gettimeout(), 5)
+
+    def test_timeout_on_reused_connection_is_not_resent(self):
+        h = PooledHttp()
+        h.request(self.url + "/fast")
+        start = time.time()
+        try:
+            h.request(self.url + "/slow", timeout=0.1)
+        except socket.timeout:
+            pass
+        else:
+            assert False
+        assert time.time() - start < 0.2
+        # Give the server time to finish with /slow (or get it again).
+        time.sleep(0.5)
+        assert_equal(self.server.paths, ["/fast", "/slow"])
+
+    def test_only_stale_connection_errors_are_resent(self):
+        h = PooledHttp()
+        for error, stale in [
+                (socket.error(errno.ECONNRESET, "Connection reset by peer"), True),
+                (socket.error(errno.EPIPE, "Broken pipe"), True),
+                (socket.error(errno.ECONNREFUSED, "Connection refused"), False),
+                (socket.timeout("timed out"), False),
+                (httplib.BadStatusLine(""), True),
+                (httplib.BadStatusLine("No status line received - "
+                                       "the server has closed the connection"), True),
+                (httplib.BadStatusLine("HTTP/1.1 2OO OK"), False),
+                (httplib.CannotSendRequest(), True),
+                (httplib.IncompleteRead("partial"), False)]:
+            assert_equal(h.is_stale(error), stale)
+
+    def test_request_stream(self):
+        h = PooledHttp()
+        r, body = h.request_stream(self.url + "/streamed")
+        assert_equal(body.read(3), "/st")
+        assert_equal(h.stats()['in_use'], 1)
+        assert_equal(body.read(), "reamed")
+        body.close()
+        stats = h.stats()
+        assert_equal((stats['in_use'], stats['idle']), (0, 1))
+
+    def test_unread_stream_is_not_reused(self):
+        h = PooledHttp()
+        r, body = h.request_stream(self.url + "/streamed")
+        body.close()
+        stats = h.stats()
+        assert_equal((stats['in_use'], stats['idle'], stats['discarded']), (0, 0, 1))
+
+
+def check_response_stream(encoding, encode, chunk_size, sizes):
+    data = "".join(str(i) for i in range(10000))
+    closed = []
+    stream = ResponseStream(StringIO.StringIO(encode(data)), encoding, on_close=closed.append)
+    stream.chunk_size = chunk_size
+    parts = [stream.read(size) for size in sizes]
+    parts.append(stream.read())
+    assert_equal("".join(parts), data)
+    assert_equal(stream.bytes, len(data))
+    assert_equal(stream.wire_bytes, len(encode(data)))
+    stream.close()
+    assert_equal(closed, [stream])
+
+def raw_deflate(data):
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def test_response_stream():
+    for encoding, encode in ((None, lambda s: s), ("gzip", gzip_encode),
+                             ("deflate", zlib.compress), ("deflate", raw_deflate)):
+        for chunk_size in (1, 10, 65536):
+            for sizes in ((), (1, 100, 0, 1000), (100000,)):
+                yield check_response_stream, encoding, encode, chunk_size, sizes
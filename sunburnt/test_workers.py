@@ -0,0 +1,73 @@
+from __future__ import absolute_import
+
+import threading
+import time
+
+from .schema import SolrError
+from .sunburnt import SolrInterface
+from .test_sunburnt import PaginationMockConnection
+from .workers import WorkerPool
+
+from nose.tools import assert_equal
+
+
+class SlowMockConnection(PaginationMockConnection):
+    """A thread-safe connection which takes a while to answer selects,
+    and fails those asking for too many rows."""
+    thread_safe = True
+    delay = 0.1
+
+    def __init__(self):
+        super(SlowMockConnection, self).__init__()
+        self.threads = set()
+
+    def request(self, uri, *args, **kwargs):
+        if '/select/' in uri:
+            self.threads.add(threading.current_thread())
+            time.sleep(self.delay)
+            if 'rows=1000' in uri:
+                return self.MockStatus(500), 'Internal Server Error'
+        return super(SlowMockConnection, self).request(uri, *args, **kwargs)
+
+
+def test_worker_pool():
+    pool = WorkerPool(size=3)
+    tasks = pool.map(lambda n: 10 / n, [5, 2, 0, 1])
+    assert_equal([task.value for task in tasks if task.wait()], [2, 5, None, 10])
+    assert isinstance(tasks[2].exception, ZeroDivisionError)
+    try:
+        tasks[2].result()
+    except ZeroDivisionError:
+        pass
+    else:
+        assert False
+    assert_equal(len(pool.threads), 3)
+    pool.close()
+    assert_equal(pool.threads, [])
+
+
+def test_execute_many():
+    conn = SlowMockConnection()
+    si = SolrInterface("http://test.example.com/", http_connection=conn, max_workers=4)
+    searches = [si.query("*").paginate(start=n, rows=2) for n in range(6)]
+    searches.insert(3, si.query("*").paginate(rows=1000))
+    t = time.time()
+    responses = si.execute_many(searches)
+    assert time.time() - t < conn.delay * 4
+    si.workers.close()
+    assert_equal(len(conn.threads), 4)
+    assert isinstance(responses[3], SolrError)
+    del responses[3]
+    assert_equal([[d['int_field'] for d in r] for r in responses],
+                 [[n, n + 1] for n in range(6)])
+
+
+def test_execute_many_without_thread_safe_connection():
+    conn = SlowMockConnection()
+    conn.thread_safe = False
+    conn.delay = 0
+    si = SolrInterface("http://test.example.com/", http_connection=conn)
+    responses = si.execute_many([si.query("*").paginate(rows=1000), si.query("*")])
+    assert isinstance(responses[0], SolrError)
+    assert_equal(len(responses[1]), 10)
+    assert_equal(conn.threads, set([threading.current_thread()]))
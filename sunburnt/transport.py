@@ -0,0 +1,389 @@
+from __future__ import absolute_import
+
+import collections
+import errno
+import httplib
+import socket
+import threading
+import time
+import urlparse
+import zlib
+
+
+class PooledHttpResponse(dict):
+    """Response headers, keyed by lower-cased header name, in the same
+    shape as an httplib2.Response - so it can be used anywhere sunburnt
+    would otherwise see one."""
+    def __init__(self, response):
+        super(PooledHttpResponse, self).__init__(
+            (k.lower(), v) for k, v in response.getheaders())
+        self.status = response.status
+        self.reason = response.reason
+        self.version = response.version
+        self['status'] = str(self.status)
+
+
+class ConnectionPool(object):
+    """A pool of keep-alive connections to a single scheme/host/port."""
+    connection_classes = {
+        'http': httplib.HTTPConnection,
+        'https': httplib.HTTPSConnection,
+    }
+
+    def __init__(self, scheme, host, port, pool_size, idle_timeout=None,
+                 timeout=None, block=False):
+        try:
+            self.connection_class = self.connection_classes[scheme]
+        except KeyError:
+            raise ValueError("Unsupported URL scheme '%s'" % scheme)
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.block = block
+        # (connection, time it was returned to the pool), oldest first.
+        self.idle = collections.deque()
+        self.in_use = 0
+        self.lock = threading.Condition(threading.Lock())
+        self.counts = dict.fromkeys(
+            ('requests', 'created', 'reused', 'evicted', 'discarded'), 0)
+
+    def evict_idle(self, now=None):
+        if self.idle_timeout is None:
+            return
+        if now is None:
+            now = time.time()
+        with self.lock:
+            while self.idle and now - self.idle[0][1] > self.idle_timeout:
+                conn, _ = self.idle.popleft()
+                conn.close()
+                self.counts['evicted'] += 1
+
+    def get(self):
+        """Check out a connection, returning it together with a flag
+        saying whether it has been used before."""
+        self.evict_idle()
+        with self.lock:
+            while not self.idle and self.block and self.in_use >= self.pool_size:
+                self.lock.wait()
+            self.in_use += 1
+            self.counts['requests'] += 1
+            if self.idle:
+                # The most recently used connection is the one least
+                # likely to have been dropped by the server.
+                conn, _ = self.idle.pop()
+                self.counts['reused'] += 1
+                return conn, True
+            self.counts['created'] += 1
+        return self.connection_class(self.host, self.port, timeout=self.timeout), False
+
+    def put(self, conn, reusable=True):
+        with self.lock:
+            self.in_use -= 1
+            if reusable and len(self.idle) < self.pool_size:
+                self.idle.append((conn, time.time()))
+            else:
+                conn.close()
+                self.counts['discarded'] += 1
+            self.lock.notify()
+
+    def close(self):
+        with self.lock:
+            while self.idle:
+                conn, _ = self.idle.popleft()
+                conn.close()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+            stats['idle'] = len(self.idle)
+            stats['in_use'] = self.in_use
+        return stats
+
+
+class PooledResponseBody(object):
+    """The body of a response from a PooledHttp, which hands its
+    connection back to the pool when it is closed."""
+    def __init__(self, response, pool, conn):
+        self.response = response
+        self.pool = pool
+        self.conn = conn
+
+    def read(self, size=-1):
+        if size < 0:
+            return self.response.read()
+        return self.response.read(size)
+
+    def close(self):
+        if self.conn is None:
+            return
+        # A connection can only be reused once its response has been read.
+        reusable = self.response.isclosed() and not self.response.will_close
+        if not reusable:
+            self.conn.close()
+        self.pool.put(self.conn, reusable)
+        self.conn = None
+
+
+class PooledHttp(object):
+    """A thread-safe HTTP transport, which keeps a pool of keep-alive
+    connections for each host it talks to.
+
+    It supports the same request() method as httplib2.Http, so it can
+    be passed as the http_connection of a SolrInterface, which can then
+    be shared between threads.
+
+    pool_size is the maximum number of idle connections kept per host;
+    if block is True, it is also the maximum number of connections
+    which may be open to a host at once, and further requests wait for
+    a connection to be returned. Connections which have been idle for
+    longer than idle_timeout seconds are closed rather than reused.
+    timeout is the socket timeout for each connection; it can be
+    overridden for a single request by passing timeout to request().
+    """
+    # Errors which, on a connection we've used before, usually mean that
+    # the server has closed it while it sat in the pool - before it could
+    # have seen the request, so that it's safe to send it again.
+    stale_connection_errors = (httplib.BadStatusLine, httplib.CannotSendRequest)
+    stale_connection_errnos = (errno.ECONNRESET, errno.EPIPE)
+    thread_safe = True
+    supports_timeout = True
+
+    def __init__(self, pool_size=10, idle_timeout=60, timeout=None, block=False):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.block = block
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def pool_for(self, scheme, host, port):
+        key = (scheme, host, port)
+        with self.lock:
+            try:
+                return self.pools[key]
+            except KeyError:
+                pool = self.pools[key] = ConnectionPool(scheme, host, port,
+                    self.pool_size, self.idle_timeout, self.timeout, self.block)
+                return pool
+
+    def request(self, uri, method="GET", body=None, headers=None, timeout=None):
+        response, body = self.request_stream(uri, method, body, headers, timeout)
+        try:
+            content = body.read()
+        finally:
+            body.close()
+        return response, content
+
+    def request_stream(self, uri, method="GET", body=None, headers=None, timeout=None):
+        """Like request(), but return the body as a file-like object, to be
+        read incrementally. The connection is only returned to the pool
+        once the body has been closed."""
+        u = urlparse.urlsplit(uri)
+        path = u.path or "/"
+        if u.query:
+            path = "%s?%s" % (path, u.query)
+        pool = self.pool_for(u.scheme, u.hostname, u.port)
+        conn, reused = pool.get()
+        self.set_timeout(conn, pool.timeout if timeout is None else timeout)
+        try:
+            try:
+                response = self._request(conn, method, path, body, headers)
+            except Exception, e:
+                if not reused or not self.is_stale(e):
+                    raise
+                conn.close()
+                response = self._request(conn, method, path, body, headers)
+        except:
+            conn.close()
+            pool.put(conn, reusable=False)
+            raise
+        return PooledHttpResponse(response), PooledResponseBody(response, pool, conn)
+
+    def is_stale(self, error):
+        """Whether error means that a reused connection had been closed
+        by the server, before any of the response was read. A timeout
+        never does: the server may be working on the request (an update,
+        say), and sending it again would double the time waited too."""
+        if isinstance(error, socket.timeout):
+            return False
+        if isinstance(error, socket.error):
+            return error.errno in self.stale_connection_errnos
+        if isinstance(error, httplib.BadStatusLine):
+            # Anything but an empty status line means the server answered.
+            return error.line in ('', repr('')) \
+                or error.line.startswith("No status line received")
+        return isinstance(error, self.stale_connection_errors)
+
+    @staticmethod
+    def set_timeout(conn, timeout):
+        # Applies to a connection which is already open, and to one which
+        # will be opened by the next request.
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+
+    def _request(self, conn, method, path, body, headers):
+        conn.request(method, path, body, headers or {})
+        return conn.getresponse()
+
+    def evict_idle(self):
+        """Close every connection which has been idle for too long."""
+        now = time.time()
+        for pool in self.pools.values():
+            pool.evict_idle(now)
+
+    def close(self):
+        """Close all idle connections."""
+        for pool in self.pools.values():
+            pool.close()
+
+    def stats(self):
+        """Return counters for all the connection pools: the number of
+        requests made, connections created, reused, evicted for being
+        idle too long and discarded, and the number currently idle and
+        in use."""
+        totals = dict.fromkeys(('requests', 'created', 'reused', 'evicted',
+                                'discarded', 'idle', 'in_use'), 0)
+        with self.lock:
+            pools = self.pools.values()
+        for pool in pools:
+            for k, v in pool.stats().items():
+                totals[k] += v
+        totals['hosts'] = len(pools)
+        return totals
+
+
+def gzip_encode(data, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decode_content(content, encoding):
+    """Undo a gzip or deflate Content-Encoding."""
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            # Some servers send raw deflate data, without the zlib header.
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    elif encoding in (None, '', 'identity'):
+        return content
+    raise ValueError("Unknown Content-Encoding '%s'" % encoding)
+
+
+class ResponseStream(object):
+    """A file-like view of a response body, which decompresses it (if
+    it has a Content-Encoding) as it is read, and counts the bytes read
+    from the network (wire_bytes) and returned (bytes).
+
+    on_close, if given, is called with the stream once it is closed.
+    """
+    chunk_size = 65536
+
+    def __init__(self, fileobj, encoding=None, on_close=None):
+        self.fileobj = fileobj
+        if encoding in ('gzip', 'x-gzip'):
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self.decompressor = zlib.decompressobj()
+        elif encoding in (None, '', 'identity'):
+            self.decompressor = None
+        else:
+            raise ValueError("Unknown Content-Encoding '%s'" % encoding)
+        # The start of a deflate body, kept until it's known whether it
+        # has a zlib header; None once it is.
+        self.deflate_head = '' if encoding == 'deflate' else None
+        self.on_close = on_close
+        self.buffer = ''
+        self.wire_bytes = 0
+        self.bytes = 0
+        self.closed = False
+
+    def read(self, size=-1):
+        if self.decompressor is None:
+            data = self.fileobj.read() if size < 0 else self.fileobj.read(size)
+            self.wire_bytes += len(data)
+        else:
+            while size < 0 or len(self.buffer) < size:
+                chunk = self.fileobj.read(self.chunk_size)
+                if not chunk:
+                    self.buffer += self.decompressor.flush()
+                    break
+                self.wire_bytes += len(chunk)
+                self.buffer += self.decompress(chunk)
+            if size < 0:
+                data, self.buffer = self.buffer, ''
+            else:
+                data, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.bytes += len(data)
+        return data
+
+    def decompress(self, chunk):
+        if self.deflate_head is None:
+            return self.decompressor.decompress(chunk)
+        self.deflate_head += chunk
+        try:
+            data = self.decompressor.decompress(chunk)
+        except zlib.error:
+            # Some servers send raw deflate data, without the zlib header;
+            # start again, as decode_content() does.
+            self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = self.decompressor.decompress(self.deflate_head)
+            self.deflate_head = None
+            return data
+        # zlib has checked the header once it has its two bytes.
+        if len(self.deflate_head) >= 2:
+            self.deflate_head = None
+        return data
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.fileobj.close()
+        if self.on_close is not None:
+            self.on_close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TransferStats(object):
+    """Byte counters for the requests made by a connection.
+
+    request_bytes and response_bytes are the sizes of the bodies before
+    compression and after decompression; request_wire_bytes and
+    response_wire_bytes are what actually crossed the network.
+    """
+    counters = ('requests', 'request_bytes', 'request_wire_bytes',
+                'response_bytes', 'response_wire_bytes')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            for counter in self.counters:
+                setattr(self, counter, 0)
+
+    def record(self, request_bytes, request_wire_bytes, response_bytes, response_wire_bytes):
+        with self.lock:
+            self.requests += 1
+            self.request_bytes += request_bytes
+            self.request_wire_bytes += request_wire_bytes
+            self.response_bytes += response_bytes
+            self.response_wire_bytes += response_wire_bytes
+
+    def as_dict(self):
+        with self.lock:
+            return dict((counter, getattr(self, counter)) for counter in self.counters)
@@ -0,0 +1,90 @@
+from __future__ import absolute_import
+
+import Queue
+import sys
+import threading
+
+
+class Task(object):
+    """A call which has been handed to a WorkerPool."""
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.value = None
+        self.exc_info = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.value = self.func(*self.args, **self.kwargs)
+        except Exception:
+            self.exc_info = sys.exc_info()
+        finally:
+            self.done.set()
+
+    def wait(self, timeout=None):
+        """Wait for the call to finish, returning True if it has."""
+        self.done.wait(timeout)
+        return self.done.is_set()
+
+    @property
+    def exception(self):
+        """The exception raised by the call (once it has finished), or None."""
+        self.wait()
+        return self.exc_info[1] if self.exc_info else None
+
+    def result(self):
+        """Wait for the call to finish, and return its value or re-raise
+        its exception."""
+        self.wait()
+        if self.exc_info:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+
+class WorkerPool(object):
+    """A fixed number of daemon threads, which run calls submitted to
+    them in the order they were submitted. A thread is started for each
+    of the first size calls, and then kept for the life of the pool."""
+    def __init__(self, size=8, name="sunburnt worker"):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.size = size
+        self.name = name
+        self.tasks = Queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        task = Task(func, args, kwargs)
+        with self.lock:
+            if len(self.threads) < self.size:
+                thread = threading.Thread(target=self.work, name=self.name)
+                thread.daemon = True
+                self.threads.append(thread)
+                thread.start()
+        self.tasks.put(task)
+        return task
+
+    def map(self, func, items):
+        """Call func on each item concurrently, returning the Tasks in the
+        same order as the items."""
+        return [self.submit(func, item) for item in items]
+
+    def work(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            task.run()
+
+    def close(self):
+        """Stop the threads once they have finished the work already
+        submitted."""
+        with self.lock:
+            threads, self.threads = self.threads, []
+        for thread in threads:
+            self.tasks.put(None)
+        for thread in threads:
+            thread.join()